@@ -2,8 +2,12 @@
 
 import argparse
 
-from src import graph
+from src import tracer
+from src import recorder
+from src import metrics
 from src import models
+from src import simulate
+from src import sweep
 
 import networkx as nx
 
@@ -16,8 +20,66 @@ if __name__ == '__main__':
     parser.add_argument('--threads', type=int, default=16,
         help='Number of threads the server is using (default: 16)')
     parser.add_argument('--release', action='store_true')
+    parser.add_argument('--max-sessions', type=int, default=256,
+        help='Number of session graphs kept on the server (default: 256)')
+    parser.add_argument('--max-session-memory', type=int, default=2048,
+        help='Memory limit of the session graphs in MB (default: 2048)')
+    parser.add_argument('--layout-cache-memory', type=int, default=256,
+        help='Memory limit of the layout cache in MB (default: 256)')
+    parser.add_argument('--webgl-threshold', type=int, default=10000,
+        help='Number of nodes plus edges above which WebGL is used (default: 10000)')
+    parser.add_argument('--max-arrows', type=int, default=10000,
+        help='Number of edges above which arrowheads are dropped (default: 10000)')
+    parser.add_argument('--max-weight-labels', type=int, default=2000,
+        help='Number of edges above which edge weights are dropped (default: 2000)')
+    parser.add_argument('--max-node-labels', type=int, default=50000,
+        help='Number of nodes above which node hover texts are dropped (default: 50000)')
+    parser.add_argument('--max-edges', type=int, default=0,
+        help='Number of edges that are sampled for drawing, 0 draws all (default: 0)')
+    parser.add_argument('--job-workers', type=int, default=2,
+        help='Number of threads running background jobs (default: 2)')
+    parser.add_argument('--job-queue', type=int, default=16,
+        help='Number of unfinished background jobs that are accepted (default: 16)')
+    parser.add_argument('--job-min-work', type=int, default=2000000,
+        help='(Nodes + edges) * steps above which actions run as background job (default: 2000000)')
+    parser.add_argument('--disable-metrics', action='store_true',
+        help='Stops recording the latency metrics served on /metrics')
+    parser.add_argument('--layout-pool', type=int, default=4,
+        help='Number of pre-generated default graphs new sessions start from (default: 4)')
+    parser.add_argument('--frame-budget', type=int, default=32,
+        help='Memory limit of a recorded trajectory in MB (default: 32)')
+    parser.add_argument('--max-frames', type=int, default=200,
+        help='Number of steps kept in a recorded trajectory (default: 200)')
+
+    subparsers = parser.add_subparsers(dest='command')
+    simulate.build_parser(subparsers.add_parser('simulate',
+        help='Runs a model headless and writes the state trajectory to disk'))
+    sweep.build_parser(subparsers.add_parser('sweep',
+        help='Runs a parameter sweep over models and graph generators in parallel'))
 
     args = vars(parser.parse_args())
+    if args['command'] == 'simulate':
+        simulate.run(args)
+        raise SystemExit(0)
+    if args['command'] == 'sweep':
+        sweep.run(args)
+        raise SystemExit(0)
+
+    from src import graph
+    graph.session_store.max_sessions = args['max_sessions']
+    graph.session_store.max_bytes = args['max_session_memory'] * 1024 ** 2
+    graph.job_queue.max_workers = args['job_workers']
+    graph.job_queue.max_pending = args['job_queue']
+    graph.job_queue.min_work = args['job_min_work']
+    models.layout_cache.max_bytes = args['layout_cache_memory'] * 1024 ** 2
+    for option in ('webgl_threshold', 'max_arrows', 'max_weight_labels', 'max_node_labels', 'max_edges'):
+        tracer.render_options[option] = args[option]
+    recorder.recorder_options['frame_budget'] = args['frame_budget'] * 1024 ** 2
+    recorder.recorder_options['max_frames'] = args['max_frames']
+    graph.page_options['pool_size'] = args['layout_pool']
+    metrics.metrics_options['enabled'] = not args['disable_metrics']
+    # builds the default graphs and pages before the first request
+    graph.pagePool()
 
     if args['release']:
         print(f'Running server in release mode: {args.get("host")}:{args.get("port")}')
@@ -6,8 +6,8 @@ Created on Fri May 15 11:45:07 2020
 """
 
 import math
-from typing import List
-from itertools import chain
+
+import numpy as np
 
 # Start and end are lists defining start and end points
 # Edge x and y are lists used to construct the graph
@@ -85,35 +85,50 @@ def addEdge(start, end, edge_x, edge_y, lengthFrac=1, arrowPos = None, arrowLeng
 
     return edge_x, edge_y
 
-def add_arrows(source_x: List[float], target_x: List[float], source_y: List[float], target_y: List[float],
-               arrowLength=0.025, arrowAngle=30):
-    pointx = list(map(lambda x: x[0] + (x[1] - x[0]) / 2, zip(source_x, target_x)))
-    pointy = list(map(lambda x: x[0] + (x[1] - x[0]) / 2, zip(source_y, target_y)))
-    etas = list(map(lambda x: math.degrees(math.atan((x[1] - x[0]) / (x[3] - x[2]))),
-                    zip(source_x, target_x, source_y, target_y)))
+def add_edges(start, end, lengthFrac=1, arrowPos=None, arrowLength=0.025, arrowAngle=30, dotSize=20):
+    """ Vectorized version of addEdge for (E x 2) arrays of start and end points.
+
+    Returns the NaN separated x and y coordinates of all edges (and their
+    arrowheads) in the same order as repeated calls of addEdge would.
+    """
+    start = np.asarray(start, dtype=float).reshape(-1, 2)
+    end = np.asarray(end, dtype=float).reshape(-1, 2)
+    x0, y0 = start[:, 0], start[:, 1]
+    x1, y1 = end[:, 0], end[:, 1]
 
-    signx = list(map(lambda x: (x[1] - x[0]) / abs(x[1] - x[0]), zip(source_x, target_x)))
-    signy = list(map(lambda x: (x[1] - x[0]) / abs(x[1] - x[0]), zip(source_y, target_y)))
+    # Incorporate the fraction of this segment covered by a dot into total reduction
+    with np.errstate(divide='ignore', invalid='ignore'):
+        length = np.sqrt((x1-x0)**2 + (y1-y0)**2)
+        dotSizeConversion = .0565/20 # length units per dot size
+        convertedDotDiameter = dotSize * dotSizeConversion
+        lengthFrac = lengthFrac - convertedDotDiameter / length
 
-    dx = list(map(lambda x: arrowLength * math.sin(math.radians(x + arrowAngle)), etas))
-    dy = list(map(lambda x: arrowLength * math.cos(math.radians(x + arrowAngle)), etas))
-    none_spacer = [None for _ in range(len(pointx))]
-    arrow_line_x = list(map(lambda x: x[0] - x[1] ** 2 * x[2] * x[3], zip(pointx, signx, signy, dx)))
-    arrow_line_y = list(map(lambda x: x[0] - x[1] ** 2 * x[2] * x[3], zip(pointy, signx, signy, dy)))
+        # If the line segment should not cover the entire distance, get actual start and end coords
+        skipX = (x1-x0)*(1-lengthFrac)
+        skipY = (y1-y0)*(1-lengthFrac)
+        x0, x1 = x0 + skipX/2, x1 - skipX/2
+        y0, y1 = y0 + skipY/2, y1 - skipY/2
 
-    arrow_line_1x_coords = list(chain(*zip(pointx, arrow_line_x, none_spacer)))
-    arrow_line_1y_coords = list(chain(*zip(pointy, arrow_line_y, none_spacer)))
+    gap = np.full(len(x0), np.nan)
+    columns_x, columns_y = [x0, x1, gap], [y0, y1, gap]
 
-    dx = list(map(lambda x: arrowLength * math.sin(math.radians(x - arrowAngle)), etas))
-    dy = list(map(lambda x: arrowLength * math.cos(math.radians(x - arrowAngle)), etas))
-    none_spacer = [None for _ in range(len(pointx))]
-    arrow_line_x = list(map(lambda x: x[0] - x[1] ** 2 * x[2] * x[3], zip(pointx, signx, signy, dx)))
-    arrow_line_y = list(map(lambda x: x[0] - x[1] ** 2 * x[2] * x[3], zip(pointy, signx, signy, dy)))
+    # Draw arrow
+    if arrowPos is not None:
+        # Find the point of the arrow; assume is at end unless told middle
+        pointx, pointy = x1, y1
+        if arrowPos == 'middle' or arrowPos == 'mid':
+            pointx = x0 + (x1-x0)/2
+            pointy = y0 + (y1-y0)/2
 
-    arrow_line_2x_coords = list(chain(*zip(pointx, arrow_line_x, none_spacer)))
-    arrow_line_2y_coords = list(chain(*zip(pointy, arrow_line_y, none_spacer)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            eta = np.where(y1 != y0, np.degrees(np.arctan((x1-x0)/(y1-y0))), 90.0)
+        # Find the directions the arrows are pointing, signx ** 2 is always one
+        signy = np.where(y1 < y0, -1.0, 1.0)
 
-    x_arrows = arrow_line_1x_coords + arrow_line_2x_coords
-    y_arrows = arrow_line_1y_coords + arrow_line_2y_coords
+        for angle in (arrowAngle, -arrowAngle):
+            dx = arrowLength * np.sin(np.radians(eta + angle))
+            dy = arrowLength * np.cos(np.radians(eta + angle))
+            columns_x.extend((pointx, pointx - signy * dx, gap))
+            columns_y.extend((pointy, pointy - signy * dy, gap))
 
-    return x_arrows, y_arrows
\ No newline at end of file
+    return np.stack(columns_x, axis=1).ravel(), np.stack(columns_y, axis=1).ravel()
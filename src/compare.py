@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+""" Runs all models side by side on the same graph """
+
+import numpy as np
+
+from src.engine import CompiledGraph
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+def batched_sums(compiled, runs):
+    """ Returns the neighbour sums of every run, computed with one
+    traversal per matrix for all runs together """
+    vectors, spans = {}, []
+    for run in runs:
+        inputs = run['inputs'](run['state'], run['args'])
+        group = vectors.setdefault(run['matrix'], [])
+        spans.append((run['matrix'], len(group), len(group) + len(inputs)))
+        group.extend(inputs)
+    sums = {matrix: compiled.neighbour_sums(group, matrix) for matrix, group in vectors.items()}
+    return [sums[matrix][start:stop] for matrix, start, stop in spans]
+
+def step_models(graph, models, args, steps=1, seed=None):
+    """ Advances the states of all models together for the given steps.
+
+    Every model needs a 'kernel' and 'kernel-inputs', a tuple of the
+    matrix ('adjacency' or 'weights') and a function returning the
+    vectors the kernel multiplies with it. The graph is compiled once and
+    in every step the vectors of all models are multiplied in a single
+    traversal. The states are written back after the last step.
+
+    Returns a summary per model id with the number of nodes, the mean
+    state and the number of changed nodes per step, the first step
+    without a change and the final count of every discrete state.
+    """
+    compiled = CompiledGraph(graph)
+    args = dict(args, rng=np.random.default_rng(seed))
+    runs = []
+    for model in models:
+        matrix, inputs = model['kernel-inputs']
+        state = compiled.state(model['key'])
+        runs.append({'model': model, 'matrix': matrix, 'inputs': inputs,
+            'args': args, 'state': state, 'mean': [float(state.mean())] if len(state) else [0.0],
+            'changed': [], 'settled': None})
+
+    for step in range(1, steps + 1):
+        for run, sums in zip(runs, batched_sums(compiled, runs)):
+            state = run['model']['kernel'](compiled, run['state'], run['args'], sums)
+            changed = int(np.count_nonzero(state != run['state']))
+            if changed == 0 and run['settled'] is None:
+                run['settled'] = step
+            run['state'] = state
+            run['changed'].append(changed)
+            run['mean'].append(float(state.mean()) if len(state) else 0.0)
+
+    summaries = {}
+    for run in runs:
+        model, state = run['model'], run['state']
+        compiled.write(model['key'], state)
+        summaries[model['id']] = {
+            'name': model['name'],
+            'key': model['key'],
+            'nodes': len(state),
+            'mean': run['mean'],
+            'changed': run['changed'],
+            'settled': run['settled'],
+            'states': {} if state.dtype.kind == 'f' else
+                dict(zip(*(values.tolist() for values in np.unique(state, return_counts=True)))),
+        }
+    return summaries
+
+if __name__ == '__main__':
+    print('compare.py')
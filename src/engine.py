@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+""" Compiled simulation engine """
+
+import hashlib
+
+import numpy as np
+import scipy.sparse as sp
+
+from src.state import node_slots, node_values
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+engine_python = 'python'
+engine_csr = 'csr'
+engine_event = 'event'
+engine_default = engine_csr
+
+engines = {
+    engine_python: {'name': 'Python'},
+    engine_csr: {'name': 'Sparse (CSR)'},
+    engine_event: {'name': 'Event Driven'},
+}
+engines_synchronous = (engine_python, engine_csr)
+
+class CompiledGraph:
+    """ Compressed sparse row representation of a networkx graph.
+
+    Row i of the matrices holds the neighbours of node i in the same
+    order as graph.adjacency() returns them, so the vectorized rules
+    visit the neighbours exactly like the dict based rules do.
+    """
+    def __init__(self, graph, weight='weight'):
+        self.graph = graph
+        self.nodes = list(graph.nodes())
+        self.index = {node: idx for idx, node in enumerate(self.nodes)}
+
+        size = len(self.nodes)
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        indices, weights = [], []
+        for srcNode, adjacency in graph.adjacency():
+            row = self.index[srcNode]
+            indptr[row + 1] = len(adjacency)
+            for dstNode, edge in adjacency.items():
+                indices.append(self.index[dstNode])
+                weights.append(edge.get(weight, 1))
+        np.cumsum(indptr, out=indptr)
+
+        self.indptr = indptr
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.degree = np.diff(indptr)
+        self.weights = sp.csr_matrix(
+            (np.asarray(weights, dtype=np.float64), self.indices, indptr),
+            shape=(size, size))
+        self.adjacency = sp.csr_matrix(
+            (np.ones(len(indices), dtype=np.int64), self.indices, indptr),
+            shape=(size, size))
+        self.columns = {}
+        self.node_state, self.slots = node_slots(graph, self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def state(self, key, dtype=None):
+        """ Reads the node attribute key into a state vector """
+        if self.node_state is not None and self.node_state.has_all(key, self.slots):
+            return self.node_state.gather(key, self.slots, dtype)
+        return node_values(self.graph, self.nodes, key, dtype)
+
+    def column(self, key, dtype=None):
+        """ Returns a cached vector of a node attribute that is constant during a run """
+        if key not in self.columns:
+            self.columns[key] = self.state(key, dtype)
+        return self.columns[key]
+
+    def neighbour_sums(self, vectors, matrix='adjacency'):
+        """ Returns matrix @ vector for every vector. The vectors are
+        multiplied as the columns of one dense matrix, so the rows of
+        the sparse matrix are only traversed once. """
+        matrix = getattr(self, matrix)
+        if len(vectors) == 1:
+            return [matrix @ vectors[0]]
+        return list((matrix @ np.column_stack(vectors)).T)
+
+    def write(self, key, state):
+        """ Writes the state vector back to the node attribute key """
+        if self.node_state is not None and key in self.node_state.columns:
+            self.node_state.scatter(key, self.slots, state)
+            return
+        for node, value in zip(self.nodes, state.tolist()):
+            self.graph.nodes[node][key] = value
+
+def compiled_graph(data):
+    """ Returns the compiled graph of data['graph'].
+
+    The compiled graph is kept in data['compiled'] while data['graph'] is
+    the same object, so the chunks of a background job and the actions of
+    a macro only compile it once. Actions that change the edges have to
+    remove it.
+    """
+    compiled = data.get('compiled')
+    if compiled is None or compiled.graph is not data['graph'] \
+            or len(compiled) != len(data['graph']):
+        compiled = data['compiled'] = CompiledGraph(data['graph'])
+    # the cached columns are only constant during a single run
+    compiled.columns.clear()
+    return compiled
+
+def digest(state):
+    return hashlib.blake2b(np.ascontiguousarray(state).tobytes(), digest_size=16).digest()
+
+def recording(step, recorder):
+    """ Wraps a step function so that every new state is recorded """
+    def recorded(state):
+        state = step(state)
+        recorder.record(state)
+        return state
+    return recorded
+
+def iterate(data, steps, step, state, converge=False):
+    """ Applies state = step(state) for the given number of steps.
+
+    If converge is set the visited states are hashed and the iteration
+    stops as soon as a state repeats. The final state is then reached by
+    only running the remaining steps modulo the period of the cycle. The
+    step of the first visit of the repeated state (the transient length)
+    and the period are stored in data['convergence']. A recorder in
+    data['recorder'] receives the initial state and every new state.
+    """
+    recorder = data.get('recorder')
+    if recorder is not None:
+        if recorder.count == 0:
+            recorder.record(state)
+        step = recording(step, recorder)
+    if not converge:
+        for _ in range(steps):
+            state = step(state)
+        return state
+
+    visited = {digest(state): 0}
+    for current in range(1, steps + 1):
+        state = step(state)
+        first = visited.setdefault(digest(state), current)
+        if first != current:
+            period = current - first
+            for _ in range((steps - current) % period):
+                state = step(state)
+            data['convergence'] = {'step': first, 'period': period}
+            print(f'Converged after {first} steps to a '
+                + ('fixed point' if period == 1 else f'cycle of length {period}'))
+            return state
+    return state
+
+def run_kernel(data, args, key, kernel, dtype=None, converge=False):
+    """ Runs a vectorized model kernel for args['steps'] steps.
+
+    The kernel is called as kernel(compiled, state, args) and returns
+    the state vector after a single synchronous update. The states are
+    only written back to the node attributes after the last step.
+    Deterministic kernels can stop early by setting converge.
+    """
+    compiled = compiled_graph(data)
+    state = iterate(data, args['steps'],
+        lambda state: kernel(compiled, state, args),
+        compiled.state(key, dtype), converge)
+    compiled.write(key, state)
+    return data
+
+def run_sweeps(data, args, key, sweep, converge=False):
+    """ Runs a dict based model sweep(graph, args) for args['steps'] steps """
+    graph = data['graph']
+    def step(state):
+        sweep(graph, args)
+        return np.array([value for _, value in graph.nodes(data=key)])
+    iterate(data, args['steps'], step,
+        np.array([value for _, value in graph.nodes(data=key)]), converge)
+    return data
+
+if __name__ == '__main__':
+    print('engine.py')
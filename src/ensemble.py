@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+""" Monte Carlo ensembles of the stochastic models """
+
+import numpy as np
+
+from src.engine import CompiledGraph
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+ensemble_quantiles = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+def run_ensemble(graph, key, kernel, args, realizations=100, seed=None,
+        quantiles=ensemble_quantiles, bins=20):
+    """ Runs independent realizations of a stochastic model kernel.
+
+    All realizations start from the current node states and are advanced
+    together as the columns of an (N x R) state matrix. A node counts as
+    infected while its state is positive. Returns the prevalence curves,
+    their mean and quantiles per step, the final sizes (number of nodes
+    that were infected at least once) with their histogram and the
+    fraction of realizations in which every node got infected.
+    """
+    compiled = CompiledGraph(graph)
+    args = dict(args, rng=np.random.default_rng(seed))
+
+    state = np.repeat(compiled.state(key)[:, None], realizations, axis=1)
+    infected = state > 0
+    prevalence = [infected.mean(axis=0)]
+    for _ in range(args['steps']):
+        state = kernel(compiled, state, args)
+        infected |= state > 0
+        prevalence.append(np.mean(state > 0, axis=0))
+    prevalence = np.array(prevalence)
+
+    finalSize = infected.sum(axis=0)
+    counts, edges = np.histogram(finalSize, bins=bins, range=(0, len(compiled)))
+    return {
+        'nodes': compiled.nodes,
+        'realizations': realizations,
+        'seed': seed,
+        'prevalence': prevalence,
+        'mean': prevalence.mean(axis=1),
+        'quantiles': {q: np.quantile(prevalence, q, axis=1) for q in quantiles},
+        'final_size': finalSize,
+        'final_size_histogram': (counts, edges),
+        'risk': infected.mean(axis=1),
+    }
+
+def ensemble_seed(value):
+    """ Returns the seed as non negative int or None, raises ValueError otherwise """
+    if value is None or value == '':
+        return None
+    try:
+        seed = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Seed {value!r} is not a number')
+    if seed < 0 or not seed.is_integer():
+        raise ValueError(f'Seed {value!r} is not a non negative integer')
+    return int(seed)
+
+def ensemble_action(data, args, key, kernel):
+    """ Runs an ensemble and stores the infection risk of every node in
+    {key}_risk. The curves and the final size histogram are returned in
+    data['ensemble'], the prevalence of every single realization is dropped. """
+    try:
+        seed = ensemble_seed(args.get('seed'))
+    except ValueError as exception:
+        print(f'Ensemble {key}: {exception}')
+        return data
+    result = run_ensemble(data['graph'], key, kernel, args,
+        args['realizations'], seed)
+    for node, risk in zip(result['nodes'], result['risk'].tolist()):
+        data['graph'].nodes[node][f'{key}_risk'] = risk
+    data['ensemble'] = dict({name: value for name, value in result.items()
+        if name not in ('nodes', 'prevalence', 'risk')}, key=key)
+    print(f'Ensemble {key}: {result["realizations"]} realizations, mean final size'
+        f' {result["final_size"].mean():.2f}, final prevalence {result["mean"][-1]:.3f}')
+    return data
+
+if __name__ == '__main__':
+    print('ensemble.py')
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+""" Event driven engine for the epidemic models """
+
+import heapq
+import itertools
+
+import numpy as np
+import networkx as nx
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+def run_events(data, args, key, recovered):
+    """ Runs the SIS/SIR rules by only processing the infection frontier.
+
+    Follows the same synchronous rules as the sweep based updates: a
+    susceptible node (state 0) is infected with 1 - (1 - prob) ** count
+    where count is the number of infected nodes in its adjacency, and an
+    infected node (state > 0) counts down until it recovers to the state
+    recovered (0 for SIS, -1 for SIR). Instead of touching every node in
+    every step, the recoveries are scheduled in a priority queue and only
+    the neighbourhoods of the infected nodes are visited, so a step costs
+    O(active edges) instead of O(N).
+    """
+    graph = data['graph']
+    prob, itime = args['prob'], args['itime']
+    rng = args.get('rng', np.random)
+    # infection spreads from a node to the nodes that have it in their adjacency
+    reverse = graph.pred if isinstance(graph, nx.DiGraph) else graph.adj
+
+    # the node state after step t is given by the recovery time minus t
+    # the counter breaks ties between node names that are not comparable
+    events, recovery, order = [], {}, itertools.count()
+    for node, value in graph.nodes(data=key):
+        if value > 0:
+            recovery[node] = value
+            heapq.heappush(events, (value, next(order), node))
+
+    changed = {}
+    def state(node):
+        return changed.get(node, graph.nodes[node][key])
+
+    steps = 0
+    for step in range(1, args['steps'] + 1):
+        if not recovery:
+            break # nothing can change anymore
+        steps = step
+
+        # counts the infected neighbours of the susceptible frontier
+        count = {}
+        for infected in recovery:
+            for node in reverse[infected]:
+                if node not in recovery and state(node) == 0:
+                    count[node] = count.get(node, 0) + 1
+
+        # recovers the nodes whose infection time ran out in this step
+        while events and events[0][0] <= step:
+            _, _, node = heapq.heappop(events)
+            del recovery[node]
+            changed[node] = recovered
+
+        # infects the frontier
+        if count:
+            nodes = list(count.keys())
+            infection_prob = 1.0 - (1.0 - prob) ** np.array([count[node] for node in nodes])
+            for node, infected in zip(nodes, (rng.random(len(nodes)) <= infection_prob).tolist()):
+                if infected:
+                    recovery[node] = step + itime
+                    heapq.heappush(events, (step + itime, next(order), node))
+
+    for node, time in recovery.items():
+        changed[node] = time - steps
+    for node, value in changed.items():
+        graph.nodes[node][key] = value
+    return data
+
+if __name__ == '__main__':
+    print('events.py')
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+""" Vectorized generators for large random graphs """
+
+import numpy as np
+import scipy.sparse as sp
+
+from src.serialization import arrays_to_graph
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+class EdgeList:
+    """ Undirected simple graph on the nodes 0..size-1 stored as arrays.
+
+    Every edge is stored once with source < target. The optional pos
+    array holds one (x, y) row per node.
+    """
+    __slots__ = ('size', 'source', 'target', 'pos')
+
+    def __init__(self, size, source, target, pos=None):
+        self.size = int(size)
+        self.source = source
+        self.target = target
+        self.pos = pos
+
+    def __len__(self):
+        return len(self.source)
+
+    @property
+    def nbytes(self):
+        return self.source.nbytes + self.target.nbytes + \
+            (0 if self.pos is None else self.pos.nbytes)
+
+    def to_csr(self):
+        """ Returns the symmetric adjacency matrix """
+        ones = np.ones(2 * len(self), dtype=np.int8)
+        rows = np.concatenate((self.source, self.target))
+        cols = np.concatenate((self.target, self.source))
+        return sp.csr_matrix((ones, (rows, cols)), shape=(self.size, self.size))
+
+    def to_networkx(self):
+        """ Builds the graph the UI and the models work on. The edges are
+        sorted by source, so they are passed to the binary loader as is. """
+        pos = np.full((self.size, 2), np.nan) if self.pos is None else self.pos
+        arrays = {
+            'names': np.arange(self.size, dtype=np.int64),
+            'indptr': np.concatenate(([0], np.cumsum(
+                np.bincount(self.source, minlength=self.size)))).astype(np.int64),
+            'indices': self.target,
+            'weights': np.ones(len(self), dtype=np.float64),
+            'positions': pos,
+        }
+        return arrays_to_graph({'directed': False, 'node_type': 'int'}, arrays)
+
+def unique(keys):
+    """ Sorted unique values, sorting is faster than np.unique for large arrays """
+    keys = np.sort(keys)
+    return keys[np.concatenate(([True], keys[1:] != keys[:-1]))] if len(keys) else keys
+
+def simple_edges(size, source, target, pos=None):
+    """ Drops self loops and duplicate edges and orders every edge """
+    source, target = np.minimum(source, target), np.maximum(source, target)
+    keep = source != target
+    keys = unique(source[keep].astype(np.int64) * size + target[keep])
+    dtype = np.int32 if size < 2 ** 31 else np.int64
+    return EdgeList(size, (keys // size).astype(dtype), (keys % size).astype(dtype), pos)
+
+def pair_count(size):
+    return size * (size - 1) // 2
+
+def sample_pairs(rng, size, count):
+    """ Draws count distinct unordered pairs of the nodes 0..size-1 """
+    count = min(count, pair_count(size))
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+    if count > pair_count(size) // 2:
+        # dense graphs are cheaper to sample by their pair index
+        index = rng.choice(pair_count(size), count, replace=False)
+        row = ((np.sqrt(8 * index + 1) - 1) // 2).astype(np.int64) + 1
+        row -= (row * (row - 1) // 2 > index)
+        row += ((row + 1) * row // 2 <= index)
+        return row * size + (index - row * (row - 1) // 2)
+    keys = np.zeros(0, dtype=np.int64)
+    while len(keys) < count:
+        missing = count - len(keys)
+        # draws a few more pairs than needed to make up for duplicates
+        source = rng.integers(0, size, int(missing * 1.1) + 16)
+        target = rng.integers(0, size, len(source))
+        source, target = np.maximum(source, target), np.minimum(source, target)
+        source, target = source[source != target], target[source != target]
+        keys = unique(np.concatenate((keys, source * size + target)))
+    return rng.permutation(keys)[:count]
+
+def erdos_renyi(n, p, seed=None):
+    """ G(n, p): every pair of nodes is connected with probability p """
+    rng = np.random.default_rng(seed)
+    keys = sample_pairs(rng, n, rng.binomial(pair_count(n), p))
+    return simple_edges(n, keys // max(n, 1), keys % max(n, 1))
+
+def barabasi_albert(n, m, seed=None):
+    """ Preferential attachment, every new node adds m edges.
+
+    Uses the edge array formulation of Batagelj and Brandes: the target
+    of an edge is the endpoint at a uniform earlier position of the edge
+    array. The lookups are resolved by pointer jumping instead of a loop
+    over the nodes. Repeated edges are dropped, so nodes can end up with
+    slightly fewer than m edges.
+    """
+    rng = np.random.default_rng(seed)
+    edges = n * m
+    # edge e is stored at the positions 2e (new node e // m) and 2e + 1
+    # (target), the target copies the node at a position in [0, 2e]
+    choice = (rng.random(edges) * np.arange(1, 2 * edges, 2)).astype(np.int64)
+    pointer = choice.copy()
+    odd = np.flatnonzero(pointer % 2 == 1)
+    while len(odd):
+        pointer[odd] = choice[pointer[odd] // 2]
+        odd = odd[pointer[odd] % 2 == 1]
+    source = np.arange(edges, dtype=np.int64) // m
+    return simple_edges(n, source, pointer // 2 // m)
+
+def watts_strogatz(n, k, p, seed=None):
+    """ Ring of n nodes joined to their k nearest neighbours, every edge
+    is rewired to a uniform random node with probability p """
+    rng = np.random.default_rng(seed)
+    source = np.repeat(np.arange(n, dtype=np.int64), k // 2)
+    target = (source + np.tile(np.arange(1, k // 2 + 1), n)) % max(n, 1)
+    rewire = rng.random(len(target)) < p
+    target[rewire] = rng.integers(0, n, int(rewire.sum()))
+    return simple_edges(n, source, target)
+
+def stochastic_block_model(n, blocks, p_in, p_out, seed=None):
+    """ n nodes in equally sized blocks, pairs inside a block are connected
+    with probability p_in and pairs of different blocks with p_out """
+    rng = np.random.default_rng(seed)
+    bounds = np.linspace(0, n, blocks + 1).astype(np.int64)
+    sources, targets = [], []
+    for idx in range(blocks):
+        start, size = bounds[idx], bounds[idx + 1] - bounds[idx]
+        keys = sample_pairs(rng, size, rng.binomial(pair_count(size), p_in))
+        sources.append(start + keys // max(size, 1))
+        targets.append(start + keys % max(size, 1))
+        for other in range(idx + 1, blocks):
+            start_other = bounds[other]
+            size_other = bounds[other + 1] - start_other
+            count = rng.binomial(size * size_other, p_out)
+            keys = rng.choice(size * size_other, count, replace=False)
+            sources.append(start + keys // size_other)
+            targets.append(start_other + keys % size_other)
+    return simple_edges(n, np.concatenate(sources or [[]]).astype(np.int64),
+        np.concatenate(targets or [[]]).astype(np.int64))
+
+def configuration_model(n, gamma, min_degree, seed=None):
+    """ Random graph with a power law degree sequence P(k) ~ k^-gamma.
+    The stubs are paired at random, self loops and multi edges are erased. """
+    if not gamma > 1:
+        raise ValueError(f'The power law exponent gamma must be greater than 1, got {gamma}')
+    if min_degree < 1:
+        raise ValueError(f'The minimum degree must be at least 1, got {min_degree}')
+    rng = np.random.default_rng(seed)
+    degree = np.floor(min_degree * (1 - rng.random(n)) ** (-1 / (gamma - 1))).astype(np.int64)
+    degree = np.minimum(degree, max(n - 1, 0))
+    if degree.sum() % 2 == 1:
+        degree[rng.integers(0, n)] += 1
+    stubs = rng.permutation(np.repeat(np.arange(n, dtype=np.int64), degree))
+    return simple_edges(n, stubs[0::2], stubs[1::2])
+
+def random_geometric(n, radius, seed=None):
+    """ Nodes at uniform positions in the unit square, nodes closer than
+    radius are connected. The square is split into cells of width radius,
+    so only nodes of neighbouring cells are compared. """
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n, 2))
+    cells_per_row = max(int(1 / radius), 1) if radius > 0 else 1
+    cell = np.minimum((pos * cells_per_row).astype(np.int64), cells_per_row - 1)
+    cell_id = cell[:, 0] * cells_per_row + cell[:, 1]
+    # the nodes are numbered by their cell, so neighbouring nodes are
+    # close in memory and every cell is a range of node ids
+    order = np.argsort(cell_id, kind='stable')
+    pos, cell, cell_id = pos[order], cell[order], cell_id[order]
+    count = np.bincount(cell_id, minlength=cells_per_row ** 2)
+    start = np.concatenate(([0], np.cumsum(count)[:-1]))
+
+    sources, targets = [], []
+    # every pair of neighbouring cells is visited once
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        x, y = cell[:, 0] + dx, cell[:, 1] + dy
+        valid = (x < cells_per_row) & (y >= 0) & (y < cells_per_row)
+        nodes = np.flatnonzero(valid)
+        other = x[valid] * cells_per_row + y[valid]
+        size = count[other]
+        source = np.repeat(nodes, size)
+        target = np.arange(len(source)) + np.repeat(start[other] - np.cumsum(size) + size, size)
+        if (dx, dy) == (0, 0):
+            keep = source < target
+            source, target = source[keep], target[keep]
+        delta = pos[source] - pos[target]
+        close = np.einsum('ij,ij->i', delta, delta) <= radius ** 2
+        sources.append(source[close])
+        targets.append(target[close])
+    return simple_edges(n, np.concatenate(sources), np.concatenate(targets), pos)
+
+if __name__ == '__main__':
+    print('generators.py')
@@ -4,25 +4,44 @@
 
 import uuid
 import json
+import random
+import threading
+import functools
+import base64
 import re
+import struct
 import itertools
 
 from itertools import combinations
+import numpy as np
 import networkx as nx
+import plotly.graph_objects as go
 
+import flask
 import dash
 import dash.dependencies as dp
 import dash_core_components as dcc
 import dash_bootstrap_components as dbc
 import dash_html_components as html
+from dash_core_components.express import send_bytes
 from dash.exceptions import PreventUpdate
 from networkx.exception import NetworkXError
+from plotly.io.json import to_json_plotly
 
 import src.designs as designs
 from src.interaction import *
 from src.tracer import *
 from src.models import *
 from src.info import *
+from src.store import SessionStore, handle
+from src.jobs import JobQueue, jobs_finished, estimate_work
+from src.serialization import dumps, loads, extension
+from src.importer import import_bytes, import_formats
+from src.recorder import TrajectoryRecorder, add_playback
+from src.metrics import phase, timed, observe_graph, install
+from src.visual import build_modal_callback, build_step_callback, build_step_slider
+from src.compare import step_models
+from src.simulate import default_args
 
 __author__ = "Created by Konstantin Rolf | University of Groningen"
 __copyright__ = "Copyright 2021, Konstantin Rolf"
@@ -78,10 +97,64 @@ info = [
 ]
 
 
+# the phases of the callbacks that are measured, see metrics.py
+generateFigure = timed('figure')(generateFigure)
+updateLayout = timed('layout')(updateLayout)
+addMinRequirements = timed('prepare')(addMinRequirements)
+loads = timed('decode')(loads)
+import_bytes = timed('decode')(import_bytes)
+
+session_store = SessionStore()
+job_queue = JobQueue()
+# recordings of finished background jobs that are not yet shown
+session_recordings = {}
+# node trace of the figure that the browser of every session shows
+session_figures = {}
+# model summaries of the last step-all action that are not yet shown
+session_summaries = {}
+# ensemble results that are not yet shown
+session_ensembles = {}
+
+def forgetSession(session_id):
+    """ Drops the data kept for a session once its graph is evicted """
+    session_recordings.pop(session_id, None)
+    session_figures.pop(session_id, None)
+    session_summaries.pop(session_id, None)
+    session_ensembles.pop(session_id, None)
+
+session_store.evict_hooks.append(forgetSession)
+
+def finishJob(session_id, data):
+    """ Stores the results of a background job """
+    session_store.put(session_id, data['graph'])
+    if data.get('recorder') is not None:
+        session_recordings[session_id] = data['recorder']
+    if data.get('summaries') is not None:
+        session_summaries[session_id] = data['summaries']
+    if data.get('ensemble') is not None:
+        session_ensembles[session_id] = data['ensemble']
+
 def generateDefaultGraph():
     defaultGen = graph_gens['random_geometric']
     return defaultGen['gen'](*defaultGen['argvals'])
 
+@timed('load')
+def loadSessionGraph(graph_handle):
+    """ Returns the live graph of a session. New sessions get a copy of their
+    default graph and evicted sessions a new graph. """
+    graph = session_store.get(graph_handle['id'])
+    if graph is None:
+        pool = page_cache.get('pool')
+        if pool and graph_handle.get('pool') is not None:
+            # the default graph is shared, the session gets its own copy
+            graph = pool[graph_handle['pool'] % len(pool)][0].copy()
+        else:
+            print(f'Session {graph_handle["id"]} is unknown, generating a new graph')
+            graph = addMinRequirements(generateDefaultGraph())
+        session_store.put(graph_handle['id'], graph)
+    observe_graph(graph)
+    return graph
+
 def input_generate(data, args):
     lines = args['text'].splitlines()
     graph = nx.DiGraph()
@@ -140,73 +213,156 @@ def input_generate(data, args):
     data['graph'] = addMinRequirements(graph)
     return data
 
-def serveLayout():
-    session_id = str(uuid.uuid4())
-    graph = addMinRequirements(generateDefaultGraph())
+# number of pre-generated default graphs that new sessions start from
+page_options = {'pool_size': 4}
+# components, default graphs and figures shared by all page loads
+page_cache = {}
+page_mutex = threading.Lock()
+# session id of the cached pages that is replaced on every page load
+page_placeholder = str(uuid.uuid4())
+
+def buildPageCache():
+    """ Builds everything on the page that does not depend on the session """
     tracer = [
         dropdown_model[dropdown_model_default]['id'],
         dropdown_model[dropdown_model_default]['visual_default']]
-    return html.Div([
-        html.Div([
-            dbc.Modal(
-                [
-                    dbc.ModalHeader('Generate'),
-                    dbc.ModalBody([
-                        dcc.Dropdown(
-                            id='modal-gen-dropdown',
-                            options=[{'label': y['name'], 'value': x} for x, y in graph_gens.items()],
-                            value=graph_gens_default,
-                            style={'left': '0px', 'right': '0px'}
-                        ),
-                        html.Div([], id='modal-gen-comp', style=designs.col)
-                    ]),
-                    dbc.ModalFooter([
-                        dbc.Button('Close', id='modal-gen-close', className='ml-auto', style={'width': '10em'}),
-                        dbc.Button('Generate', id='modal-gen-generate', className='ml-auto', style={'width': '10em'})
-                    ], style={'margin-left': 'auto', 'margin-right': '0'}),
-                ],
-                id='modal',
-            ),
-            dbc.Modal(
-                [
-                    dbc.ModalHeader('Information | Legal Notice'),
-                    dbc.ModalBody(info),
-                    dbc.ModalFooter([
-                        dbc.Button('Close', id='modal-info-close', className='ml-auto', style={'width': '10em'}),
-                    ], style={'margin-left': 'auto', 'margin-right': '0'}),
-                ],
-                id='modal-info',
-                size='xl'
-            ),
-            dbc.Modal(
-                [
-                    dbc.ModalHeader('Input'),
-                    dbc.ModalBody([
-                        dcc.Textarea(
-                            id='model-input-textarea',
-                            value='',
-                            style={'width': '100%', 'height': 300},
-                        ),
-                    ]),
-                    dbc.ModalFooter([
-                        dbc.Button('Close', id='modal-input-close', className='ml-auto', style={'width': '10em'}),
-                        dbc.Button('Generate', id='modal-input-generate', className='ml-auto', style={'width': '10em'})
-                    ], style={'margin-left': 'auto', 'margin-right': '0'}),
-                ],
-                id='modal-input'
-            ),
-        ]),
-        dcc.Store(data=session_id, id='session-id'),
+    pool = []
+    for _ in range(max(page_options['pool_size'], 1)):
+        graph = addMinRequirements(generateDefaultGraph())
+        # the figure is kept as dict so that it is not validated again
+        pool.append((graph, generateFigure(graph, dropdown_model_default, dropdown_model, tracer).to_dict()))
+    page_cache['pool'] = pool
+    page_cache['modals'] = html.Div([
+        dbc.Modal(
+            [
+                dbc.ModalHeader('Generate'),
+                dbc.ModalBody([
+                    dcc.Dropdown(
+                        id='modal-gen-dropdown',
+                        options=[{'label': y['name'], 'value': x} for x, y in graph_gens.items()],
+                        value=graph_gens_default,
+                        style={'left': '0px', 'right': '0px'}
+                    ),
+                    html.Div([], id='modal-gen-comp', style=designs.col)
+                ]),
+                dbc.ModalFooter([
+                    dbc.Button('Close', id='modal-gen-close', className='ml-auto', style={'width': '10em'}),
+                    dbc.Button('Generate', id='modal-gen-generate', className='ml-auto', style={'width': '10em'})
+                ], style={'margin-left': 'auto', 'margin-right': '0'}),
+            ],
+            id='modal',
+        ),
+        dbc.Modal(
+            [
+                dbc.ModalHeader('Compare Models'),
+                dbc.ModalBody([
+                    build_step_slider('compare-slider-steps-value', 'compare-slider-steps', 'Steps'),
+                    dcc.Graph(id='compare-graph', figure=go.Figure()),
+                    html.Div(id='compare-table'),
+                ]),
+                dbc.ModalFooter([
+                    dbc.Button('Close', id='modal-compare-close', className='ml-auto', style={'width': '10em'}),
+                    dbc.Button('Step All', id='compare-step', className='ml-auto', style={'width': '10em'})
+                ], style={'margin-left': 'auto', 'margin-right': '0'}),
+            ],
+            id='modal-compare',
+            size='xl',
+        ),
+        dbc.Modal(
+            [
+                dbc.ModalHeader('Ensemble'),
+                dbc.ModalBody([
+                    html.Div(id='ensemble-summary'),
+                    dcc.Graph(id='ensemble-graph', figure=go.Figure()),
+                    dcc.Graph(id='ensemble-histogram', figure=go.Figure()),
+                ]),
+                dbc.ModalFooter([
+                    dbc.Button('Close', id='modal-ensemble-close', className='ml-auto', style={'width': '10em'}),
+                ], style={'margin-left': 'auto', 'margin-right': '0'}),
+            ],
+            id='modal-ensemble',
+            size='xl',
+        ),
+        dbc.Modal(
+            [
+                dbc.ModalHeader('Information | Legal Notice'),
+                dbc.ModalBody(info),
+                dbc.ModalFooter([
+                    dbc.Button('Close', id='modal-info-close', className='ml-auto', style={'width': '10em'}),
+                ], style={'margin-left': 'auto', 'margin-right': '0'}),
+            ],
+            id='modal-info',
+            size='xl'
+        ),
+        dbc.Modal(
+            [
+                dbc.ModalHeader('Input'),
+                dbc.ModalBody([
+                    dcc.Textarea(
+                        id='model-input-textarea',
+                        value='',
+                        style={'width': '100%', 'height': 300},
+                    ),
+                    dcc.Upload(
+                        html.Div(['Or import an edge list, CSV or MatrixMarket file (',
+                            ', '.join(import_formats), ')']),
+                        id='upload-import',
+                        style={'width': '100%', 'height': '60px', 'line-height': '60px',
+                            'border-width': '1px', 'border-style': 'dashed',
+                            'border-radius': '5px', 'text-align': 'center', 'margin-top': '10px'},
+                    ),
+                    dcc.Checklist(
+                        id='upload-import-options',
+                        options=[{'label': ' Directed', 'value': 'directed'}],
+                        value=['directed'],
+                    ),
+                ]),
+                dbc.ModalFooter([
+                    dbc.Button('Close', id='modal-input-close', className='ml-auto', style={'width': '10em'}),
+                    dbc.Button('Generate', id='modal-input-generate', className='ml-auto', style={'width': '10em'})
+                ], style={'margin-left': 'auto', 'margin-right': '0'}),
+            ],
+            id='modal-input'
+        ),
+        dbc.Modal(
+            [
+                dbc.ModalHeader('Load'),
+                dbc.ModalBody([
+                    dcc.Upload(
+                        html.Div(['Drag and drop or click to select a ', html.B(extension), ' file']),
+                        id='upload-graph',
+                        style={'width': '100%', 'height': '80px', 'line-height': '80px',
+                            'border-width': '1px', 'border-style': 'dashed',
+                            'border-radius': '5px', 'text-align': 'center'},
+                    ),
+                ]),
+                dbc.ModalFooter([
+                    dbc.Button('Close', id='modal-load-close', className='ml-auto', style={'width': '10em'}),
+                ], style={'margin-left': 'auto', 'margin-right': '0'}),
+            ],
+            id='modal-load'
+        ),
+        dcc.Download(id='download-graph'),
+    ])
+    page_cache['stores'] = [
         dcc.Store(data=[], id='session-actions'),
         dcc.Store(data=tracer, id='session-tracer'),
-        dcc.Store(data=json.loads(nx.jit_data(graph)), id='session-graph'),
-
         html.Div([dcc.Store(data=[], id=model['session-tracer'])
             for model in dropdown_model.values()]),
         html.Div([dcc.Store(data=[], id=model['session-actions'])
             for model in dropdown_model.values()]),
         html.Div(dcc.Store(data=[], id='session-graph-actions')),
-
+        # the recorded macro is kept in the browser across page loads
+        dcc.Store(data=[], id='session-macro', storage_type='local'),
+        dcc.Store(data=False, id='session-macro-recording'),
+        dcc.Store(data=[], id='session-macro-actions'),
+        dcc.Store(data=None, id='session-job'),
+        dcc.Store(data=None, id='session-job-done'),
+        dcc.Store(data=None, id='figure-update'),
+        dcc.Store(data=0, id='ensemble-shown'),
+        dcc.Interval(id='job-interval', interval=500, disabled=True),
+    ]
+    page_cache['controls'] = [
         html.Div([
             html.Div(
                 dbc.DropdownMenu(
@@ -231,6 +387,12 @@ def serveLayout():
                         dbc.DropdownMenuItem(
                             'Custom', id='modal-input-open', className='m-1', style={'width': '200px'}
                         ),
+                        dbc.DropdownMenuItem(
+                            'Compare', id='modal-compare-open', className='m-1', style={'width': '200px'}
+                        ),
+                        dbc.DropdownMenuItem(
+                            'Ensemble', id='modal-ensemble-open', className='m-1', style={'width': '200px'}
+                        ),
                         dbc.DropdownMenuItem(divider=True),
                         dbc.DropdownMenuItem(
                             'Info', id='modal-info-open', className='m-1', style={'width': '200px'}
@@ -253,6 +415,16 @@ def serveLayout():
             html.Div([html.Button('Delete', id='action-delete', style=designs.but)], style=designs.col),
             html.Div([html.Button('Connect', id='action-connect', style=designs.but)], style=designs.col),
             html.Div([html.Button('Deconnect', id='action-deconnect', style=designs.but)], style=designs.col),
+            html.Div([html.Button('Cancel', id='action-cancel', style=designs.but)], style=designs.col),
+            html.Div([html.Button('Macro', id='action-macro-record', style=designs.but)], style=designs.col),
+            html.Div([html.Button('Replay', id='action-macro-run', style=designs.but)], style=designs.col),
+            html.Div([html.Button('Clear', id='action-macro-clear', style=designs.but)], style=designs.col),
+            html.Div('', id='job-progress', style={'width': '160px', 'padding-top': '20px'}),
+            html.Div([dcc.Checklist(
+                id='record-trajectory',
+                options=[{'label': ' Record', 'value': 'record'}],
+                value=[],
+            )], style={'padding-top': '20px'}),
             html.Div([
                 'Layout',
                 html.Div([dcc.Dropdown(
@@ -273,45 +445,101 @@ def serveLayout():
             ], style=designs.row),
         ], style=designs.row),
         html.Div([model['ui']() for model in dropdown_model.values()], id='tab-specific'),
+    ]
+
+    # the serialized page of every default graph, see servePage
+    page_cache['pages'] = [to_json_plotly(pageLayout(page_placeholder, index))
+        for index in range(len(pool))]
+
+def pagePool():
+    with page_mutex:
+        if not page_cache:
+            buildPageCache()
+    return page_cache['pool']
+
+def pageLayout(session_id, index):
+    """ Returns the page of a session that starts from the default graph index.
+    The default graph is copied into the session store once the session is
+    used (see loadSessionGraph), so page loads do not fill the store. """
+    pool = page_cache['pool']
+    graph_handle = dict(handle(session_id, None), pool=index)
+    return html.Div([
+        page_cache['modals'],
+        dcc.Store(data=session_id, id='session-id'),
+        dcc.Store(data=graph_handle, id='session-graph'),
+        *page_cache['stores'],
+        *page_cache['controls'],
         dcc.Graph(
             id='basic-graph',
-            figure=generateFigure(graph, dropdown_model_default, dropdown_model, tracer),
+            figure=pool[index][1],
             style={'height' : '90vh', 'width' : '90vw', 'background-color': 'white'}
         )
     ])
 
+def serveLayout():
+    pool = pagePool()
+    return pageLayout(str(uuid.uuid4()), random.randrange(len(pool)))
+
+def servePage():
+    """ Returns the JSON of a new page. Only the session id differs between
+    page loads, so it is substituted into the cached serialized page. """
+    pool = pagePool()
+    page = page_cache['pages'][random.randrange(len(pool))]
+    return page.replace(page_placeholder, str(uuid.uuid4()))
+
+class PageDash(dash.Dash):
+    """ Serves the layout from the cached page JSON """
+    def serve_layout(self):
+        return flask.Response(servePage(), mimetype='application/json')
+
 external_stylesheets = [
     dbc.themes.BOOTSTRAP,
     'https://codepen.io/chriddyp/pen/bWLwgP.css', # Dash CSS
     'https://codepen.io/chriddyp/pen/brPBPO.css', # Loading screen CSS
 ]
-app = dash.Dash(external_stylesheets=external_stylesheets)
+app = PageDash(external_stylesheets=external_stylesheets)
 app.config.suppress_callback_exceptions = True
 app.layout = serveLayout
+install(app)
 
 
 def action_add(data, args):
     graph = data['graph']
-    graph.add_node(randName(graph))
+    node = randName(graph)
+    graph.add_node(node)
+    markEdited(graph, [node])
     addMinRequirements(graph)
     return data
 
 def action_connect(data, args):
     graph, selected = data['graph'], args['selected']
-    for s1, s2 in itertools.combinations(get_node_names(selected), 2):
+    nodes = get_node_names(selected)
+    for s1, s2 in itertools.combinations(nodes, 2):
         graph.add_edge(s1, s2)
+    markEdited(graph, nodes)
     addMinRequirements(graph)
     return data
 
 def action_deconnect(data, args):
     graph, selected = data['graph'], args['selected']
-    for s1, s2 in itertools.combinations(get_node_names(selected), 2):
+    nodes = get_node_names(selected)
+    for s1, s2 in itertools.combinations(nodes, 2):
         graph.remove_edges_from([(s1, s2), (s2, s1)])
+    markEdited(graph, nodes)
     return data
 
 def action_delete(data, args):
     graph, selected = data['graph'], args['selected']
-    graph.remove_nodes_from(get_node_names(selected))
+    nodes = [node for node in get_node_names(selected) if node in graph]
+    # the neighbours of the deleted nodes lose their connections
+    markEdited(graph, {nb for node in nodes for nb in nx.all_neighbors(graph, node)})
+    graph.remove_nodes_from(nodes)
+    return data
+
+def action_step_all(data, args):
+    models = [model for model in dropdown_model.values() if 'kernel-inputs' in model]
+    data['summaries'] = step_models(data['graph'], models,
+        dict(default_args, **args), int(args.get('steps') or 1), args.get('seed'))
     return data
 
 actions_exec = {
@@ -321,11 +549,21 @@ actions_exec = {
         'connect': action_connect,
         'deconnect': action_deconnect,
         'delete': action_delete,
+        'step-all': action_step_all,
     },
 }
+# actions that may run as background job, True if their steps can be chunked
+actions_background = {}
+actions_state = {'session-graph-actions': {'step-all'}}
 for model in dropdown_model.values():
     # registers the actions
     actions_exec[model['id']] = model['actions']
+    actions_state[model['id']] = set(model.get('state-actions', []))
+    for name, function in model['actions'].items():
+        if function is model['update']:
+            actions_background[(model['id'], name)] = True
+    for name in model.get('background', []):
+        actions_background[(model['id'], name)] = False
     # registers the callbacks
     model['callbacks'](app)
 
@@ -357,40 +595,37 @@ def update_modal_gen(inp):
         
     ]
 
-@app.callback(
-    dp.Output('modal', 'is_open'),
-    [dp.Input('modal-gen-open', 'n_clicks'), dp.Input('modal-gen-close', 'n_clicks')],
-    [dp.State('modal', 'is_open')])
-def toggle_modal(n1, n2, is_open):
-    if n1 or n2:
-        return not is_open
-    return is_open
-
-@app.callback(
-    dp.Output('modal-info', 'is_open'),
-    [dp.Input('modal-info-open', 'n_clicks'), dp.Input('modal-info-close', 'n_clicks')],
-    [dp.State('modal-info', 'is_open')])
-def toggle_modal_info(n1, n2, is_open):
-    if n1 or n2:
-        return not is_open
-    return is_open
-
+build_modal_callback(app, 'modal', 'modal-gen-open', 'modal-gen-close')
+build_modal_callback(app, 'modal-info', 'modal-info-open', 'modal-info-close')
+build_modal_callback(app, 'modal-compare', 'modal-compare-open', 'modal-compare-close')
+build_step_callback(app, 'compare-slider-steps-value', 'compare-slider-steps', 'Steps')
+build_modal_callback(app, 'modal-ensemble', 'modal-ensemble-open', 'modal-ensemble-close',
+    show='ensemble-shown.data')
+build_modal_callback(app, 'modal-input', 'modal-input-open', 'modal-input-close',
+    dismiss='upload-import.contents')
+build_modal_callback(app, 'modal-load', 'action-menu-load', 'modal-load-close',
+    dismiss='upload-graph.contents')
 
 @app.callback(
-    dp.Output('modal-input', 'is_open'),
-    [dp.Input('modal-input-open', 'n_clicks'), dp.Input('modal-input-close', 'n_clicks')],
-    [dp.State('modal-input', 'is_open')])
-def toggle_input_modal(n1, n2, is_open):
-    if n1 or n2:
-        return not is_open
-    return is_open
+    dp.Output('download-graph', 'data'),
+    dp.Input('action-menu-save', 'n_clicks'),
+    dp.State('session-graph', 'data'),
+    prevent_initial_call=True)
+def save_graph(n_clicks, graph_handle):
+    if job_queue.active(graph_handle['id']):
+        print(f'Session {graph_handle["id"]} is busy with a background job')
+        raise PreventUpdate()
+    graph = loadSessionGraph(graph_handle)
+    print(f'Saving graph with {len(graph)} nodes')
+    return send_bytes(dumps(graph), f'graph{extension}')
 
 @app.callback(
     dp.Output('session-actions', 'data'),
     dp.Input('session-graph-actions', 'data'),
+    dp.Input('session-macro-actions', 'data'),
     [dp.Input(src['session-actions'], 'data') for src in dropdown_model.values()],
     dp.State('session-actions', 'data'))
-def session_actions_unify(graph_actions, *args):
+def session_actions_unify(graph_actions, macro_actions, *args):
     actions, current = args[:-1], args[-1]
     ctx = dash.callback_context
     if not ctx.triggered:
@@ -399,6 +634,8 @@ def session_actions_unify(graph_actions, *args):
     source = ctx.triggered[0]['prop_id'].split('.')[0]
     if source == 'session-graph-actions':
         return graph_actions
+    if source == 'session-macro-actions':
+        return macro_actions
     # otherwise use model handlers
     for idx, model in enumerate(dropdown_model.values()):
         if model['session-actions'] == source:
@@ -433,8 +670,10 @@ def session_tracer_unify(dropdown, *args):
     dp.Input('action-add', 'n_clicks'),
     dp.Input('action-connect', 'n_clicks'),
     dp.Input('action-deconnect', 'n_clicks'),
-    dp.State('model-input-textarea', 'value'))
-def modal_input_generate(n1, n2, n3, n4, n5, text):
+    dp.Input('compare-step', 'n_clicks'),
+    dp.State('model-input-textarea', 'value'),
+    dp.State('compare-slider-steps', 'value'))
+def modal_input_generate(n1, n2, n3, n4, n5, n6, text, steps):
     ctx = dash.callback_context
     if not ctx.triggered:
         return []
@@ -451,84 +690,287 @@ def modal_input_generate(n1, n2, n3, n4, n5, text):
         return [('session-graph-actions', 'connect', args)]
     elif source == 'action-deconnect':
         return [('session-graph-actions', 'deconnect', args)]
+    elif source == 'compare-step':
+        return [('session-graph-actions', 'step-all', {'steps': steps})]
     print('Graph Action: Could not update')
     raise PreventUpdate()
 
 
-@app.callback(
+# records the actions of the session while the macro recording is on
+app.clientside_callback(
+    """
+    function(actions, n_record, n_clear, n_run, macro, recording) {
+        const triggered = window.dash_clientside.callback_context.triggered;
+        const source = triggered.length ? triggered[0].prop_id.split('.')[0] : '';
+        macro = macro || [];
+        if (source === 'action-macro-record') {
+            recording = !recording;
+            if (recording) {
+                macro = [];
+            }
+        } else if (source === 'action-macro-clear') {
+            macro = [];
+        } else if (source === 'action-macro-run') {
+            // a replay ends the recording, it would record itself
+            recording = false;
+        } else if (source === 'session-actions' && recording && actions && actions.length) {
+            macro = macro.concat(actions);
+        }
+        return [macro, recording, recording ? 'Stop' : 'Macro',
+            macro.length ? 'Replay (' + macro.length + ')' : 'Replay'];
+    }
+    """,
+    dp.Output('session-macro', 'data'),
+    dp.Output('session-macro-recording', 'data'),
+    dp.Output('action-macro-record', 'children'),
+    dp.Output('action-macro-run', 'children'),
+    dp.Input('session-actions', 'data'),
+    dp.Input('action-macro-record', 'n_clicks'),
+    dp.Input('action-macro-clear', 'n_clicks'),
+    dp.Input('action-macro-run', 'n_clicks'),
+    dp.State('session-macro', 'data'),
+    dp.State('session-macro-recording', 'data'))
+
+# replays the whole macro with a single request
+app.clientside_callback(
+    """
+    function(n_clicks, macro) {
+        if (!n_clicks || !macro || !macro.length) {
+            return window.dash_clientside.no_update;
+        }
+        return macro;
+    }
+    """,
+    dp.Output('session-macro-actions', 'data'),
+    dp.Input('action-macro-run', 'n_clicks'),
+    dp.State('session-macro', 'data'))
+
+# shows the controls of the selected model
+app.clientside_callback(
+    """
+    function(update, old) {
+        return old.map(function(z) {
+            return update && update === z.index ? {} : {display: 'none'};
+        });
+    }
+    """,
     dp.Output({'type': 'specific', 'index': dp.ALL}, 'style'),
     dp.Input('dropdown-model', 'value'),
-    dp.State({'type': 'specific', 'index': dp.ALL}, 'id'),)
-def make_input_visible(update, old):
-    if not update: return [{'display': 'none'}] * len(old)
-    return [{'display': 'none'} if update != z['index'] else {} for z in old]
+    dp.State({'type': 'specific', 'index': dp.ALL}, 'id'))
+
+def nodeTrace(figure):
+    """ Returns the colors and texts of the node trace of a figure as arrays """
+    trace = figure.data[1]
+    return (np.asarray(trace.marker.color),
+        None if trace.text is None else np.asarray(trace.text, dtype=object))
+
+def figureUpdate(session_id, figure):
+    """ Wraps a new figure for the figure-update store and remembers its
+    node trace, node updates are passed through """
+    if not isinstance(figure, go.Figure):
+        return figure
+    if figure.frames:
+        # the browser may stop the playback at any frame
+        session_figures.pop(session_id, None)
+    else:
+        color, text = nodeTrace(figure)
+        session_figures[session_id] = {'size': len(figure.data[1].x), 'color': color, 'text': text}
+    return {'figure': figure}
+
+def nodeUpdate(session_id, graph, model_name, tracer, layout_name):
+    """ Returns the node colors and texts that changed since the last figure
+    of the session. The browser keeps the edges and positions, so this only
+    works after actions that do not change the graph itself. A full figure
+    is returned if the browser shows a different graph. """
+    entry = session_figures.get(session_id)
+    if entry is None or entry['size'] != len(graph):
+        updateLayout(graph, layout_name, layouts)
+        return generateFigure(graph, model_name, dropdown_model, tracer)
+    color, text = generateNodeColors(graph, model_name, dropdown_model, tracer)
+    color = np.asarray(color)
+    text = None if text is None else np.asarray(text, dtype=object)
+    update = {'trace': 1, 'color': color, 'text': text}
+    if entry['color'] is not None and entry['color'].shape == color.shape \
+            and (text is None) == (entry['text'] is None):
+        changed = color != entry['color']
+        if text is not None:
+            changed |= text != entry['text']
+        indices = np.flatnonzero(changed)
+        # the indices only pay off if few nodes changed
+        if 2 * len(indices) < len(color):
+            update['indices'] = indices
+            update['color'] = color[indices]
+            update['text'] = None if text is None else text[indices]
+    entry['color'], entry['text'] = color, text
+    return {key: value.tolist() if isinstance(value, np.ndarray) else value
+        for key, value in update.items()}
+
+def findAction(action):
+    """ Returns the function of a session action or None """
+    executor = actions_exec.get(action[0])
+    if executor is None:
+        print(f'Could not find executor {action[0]}')
+        return None
+    function = executor.get(action[1])
+    if function is None:
+        print(f'Could not find function {action[1]}')
+    return function
+
+def isStateAction(action):
+    return action[1] in actions_state.get(action[0], ())
+
+def runActions(data, actions, context):
+    """ Runs a sequence of actions one after another on the same graph.
+
+    The actions only update the data, the caller lays out and draws the
+    graph once after the last one. The compiled graph is shared between
+    the actions until one of them changes the graph.
+    """
+    for action in actions:
+        args = dict(action[2] if len(action) > 2 else {}, **context)
+        data = findAction(action)(data, args)
+        if not isStateAction(action):
+            data.pop('compiled', None)
+    return data
+
+def sendsFigure(function):
+    """ Sends the figure output of a callback through the figure-update store """
+    @functools.wraps(function)
+    def wrapper(graph_handle, *args):
+        result = function(graph_handle, *args)
+        return (result[0], figureUpdate(graph_handle['id'], result[1])) + tuple(result[2:])
+    return wrapper
 
 @app.callback(
 [
     dp.Output('session-graph', 'data'),
-    dp.Output('basic-graph', 'figure'),
+    dp.Output('figure-update', 'data'),
     dp.Output('loader', 'children'),
+    dp.Output('session-job', 'data'),
 ],
 [
     dp.Input('session-graph', 'data'),
+    dp.Input('session-job-done', 'data'),
     dp.Input('modal-gen-generate', 'n_clicks'),
     dp.Input('dropdown-layout', 'value'),
     dp.Input('dropdown-model', 'value'),
     dp.Input('modal-gen-dropdown', 'value'),
     dp.Input('session-actions', 'data'),
     dp.Input('session-tracer', 'data'),
+    dp.Input('upload-graph', 'contents'),
+    dp.Input('upload-import', 'contents'),
 ],
     dp.State({'type': 'modal-gen-input', 'index': dp.ALL}, 'value'),
+    dp.State('upload-import', 'filename'),
+    dp.State('upload-import-options', 'value'),
+    dp.State('record-trajectory', 'value'),
     dp.State('basic-graph', 'selectedData'),
     dp.State('basic-graph', 'clickData'),
     dp.State('basic-graph', 'hoverData'),
 )
-def update_output_div(graph_json, n_clicks_modal,
-    layout_name, model_name, graphGenType, actions, tracer, graphGenInput, selected, clickData, hoverData):
+@sendsFigure
+def update_output_div(graph_handle, job_done, n_clicks_modal,
+    layout_name, model_name, graphGenType, actions, tracer, upload, upload_import,
+    graphGenInput, import_filename, import_options, record, selected, clickData, hoverData):
     ctx = dash.callback_context
+    session_id = graph_handle['id']
     if not ctx.triggered:
-        graph = nx.jit_graph(graph_json)
-        return graph_json, generateFigure(graph, model_name, dropdown_model, tracer), ''
+        graph = loadSessionGraph(graph_handle)
+        if graph_handle.get('pool') is not None:
+            # the page already shows the figure of the default graph
+            pool = page_cache['pool']
+            trace = pool[graph_handle['pool'] % len(pool)][1]['data'][1]
+            session_figures[session_id] = {'size': len(graph),
+                'color': np.asarray(trace['marker']['color']),
+                'text': None if trace.get('text') is None else np.asarray(trace['text'], dtype=object)}
+            return graph_handle, dash.no_update, '', dash.no_update
+        return graph_handle, generateFigure(graph, model_name, dropdown_model, tracer), '', dash.no_update
 
     source = ctx.triggered[0]['prop_id'].split('.')[0]
+    if source != 'session-job-done' and job_queue.active(session_id):
+        # the job mutates the session graph, so nothing else may read or change it
+        print(f'Session {session_id} is busy with a background job')
+        if source in ('dropdown-layout', 'dropdown-model', 'session-tracer'):
+            # the job result is drawn as a full figure with the new settings
+            session_figures.pop(session_id, None)
+        return graph_handle, dash.no_update, 'Busy', dash.no_update
     if source == 'dropdown-layout':
         print(f'Changing layout to {layout_name}')
-        graph = nx.jit_graph(graph_json)
+        graph = loadSessionGraph(graph_handle)
         updateLayout(graph, layout_name, layouts)
-        return graph_json, generateFigure(graph, model_name, dropdown_model, tracer), ''
+        return graph_handle, generateFigure(graph, model_name, dropdown_model, tracer), '', dash.no_update
     elif source == 'dropdown-model':
         print(f'Changing model type to {model_name}')
-        graph = nx.jit_graph(graph_json)
+        graph = loadSessionGraph(graph_handle)
         updateLayout(graph, layout_name, layouts)
-        return graph_json, generateFigure(graph, model_name, dropdown_model, tracer), ''
+        return graph_handle, generateFigure(graph, model_name, dropdown_model, tracer), '', dash.no_update
+    elif source == 'session-job-done':
+        # background jobs only run model updates, which keep the graph
+        graph = loadSessionGraph(graph_handle)
+        recorder = session_recordings.pop(session_id, None)
+        if recorder is not None and len(recorder) > 1:
+            updateLayout(graph, layout_name, layouts)
+            figure = generateFigure(graph, model_name, dropdown_model, tracer)
+            add_playback(figure, recorder)
+        else:
+            figure = nodeUpdate(session_id, graph, model_name, tracer, layout_name)
+        return handle(session_id, session_store.version(session_id)), figure, '', dash.no_update
     elif source == 'session-actions':
+        actions = [action for action in actions or [] if findAction(action) is not None]
         if len(actions) == 0:
             raise PreventUpdate()
-        for action in actions:
-            executor = actions_exec.get(action[0])
-            if executor is not None:
-                function = executor.get(action[1])
-                if function is not None:
-                    args = action[2] if len(action) > 2 else {}
-                    args['selected'] = selected
-                    args['hover'] = hoverData
-                    args['click'] = clickData
-
-
-                    graph = nx.jit_graph(graph_json)
-                    newData = function({'graph': graph},
-                        action[2] if len(action) > 2 else [])
-                    graph = newData['graph']
-                    updateLayout(graph, layout_name, layouts)
-                    return (json.loads(nx.jit_data(graph)),
-                        generateFigure(graph, model_name, dropdown_model, tracer), '')
-                else:
-                    print(f'Could not find function {action[1]}')
-            else:
-                print(f'Could not find executor {action[0]}')
+        context = {'selected': selected, 'hover': hoverData, 'click': clickData}
+        graph = loadSessionGraph(graph_handle)
+        data = {'graph': graph}
+        stateOnly = all(isStateAction(action) for action in actions)
+        keys = {dropdown_model[action[0]]['key'] for action in actions if action[0] in dropdown_model}
+        if record and stateOnly and len(keys) == 1:
+            # a recording needs the same nodes and state in every step
+            data['recorder'] = TrajectoryRecorder(keys.pop(), len(graph))
+
+        if len(actions) == 1:
+            action = actions[0]
+            args = dict(action[2] if len(action) > 2 else {}, **context)
+            chunked = actions_background.get((action[0], action[1]))
+            long = chunked is not None and job_queue.is_long(graph, args, chunked)
+            name, function = action[1], findAction(action)
+        else:
+            # a macro runs as a single job that is not chunked
+            args, chunked, name = {}, False, 'macro'
+            long = sum(estimate_work(graph, dict(action[2] if len(action) > 2 else {}), False)
+                for action in actions) >= job_queue.min_work
+            function = lambda data, args: runActions(data, actions, context)
+        if long:
+            if not stateOnly:
+                # the browser needs the new edges once the job is done
+                session_figures.pop(session_id, None)
+            job = job_queue.submit(session_id, name, function,
+                data, args, chunked, lambda data: finishJob(session_id, data))
+            if job is None:
+                print('Job queue is full')
+                return graph_handle, dash.no_update, 'Server busy', dash.no_update
+            print(f'Running {name} as background job {job.id}')
+            return graph_handle, dash.no_update, '', job.id
+
+        with phase('action'):
+            data = runActions(data, actions, context)
+        if data.get('summaries') is not None:
+            session_summaries[session_id] = data['summaries']
+        if data.get('ensemble') is not None:
+            session_ensembles[session_id] = data['ensemble']
+        graph = data['graph']
+        recorder = data.get('recorder')
+        if stateOnly and (recorder is None or len(recorder) < 2):
+            figure = nodeUpdate(session_id, graph, model_name, tracer, layout_name)
+        else:
+            updateLayout(graph, layout_name, layouts)
+            figure = generateFigure(graph, model_name, dropdown_model, tracer)
+            if recorder is not None:
+                add_playback(figure, recorder)
+        return session_store.put(session_id, graph), figure, '', dash.no_update
     elif source == 'session-tracer':
-        graph = nx.jit_graph(graph_json)
-        return graph_json, generateFigure(graph, model_name, dropdown_model, tracer), ''
+        graph = loadSessionGraph(graph_handle)
+        return graph_handle, generateFigure(graph, model_name, dropdown_model, tracer), '', dash.no_update
     elif source == 'modal-gen-generate':
         graph_gen = graph_gens.get(graphGenType)
         if graph_gen is None:
@@ -537,11 +979,188 @@ def update_output_div(graph_json, n_clicks_modal,
             inputs = [value if value is not None else graph_gen['argvals'][idx]
                 for idx, value in enumerate(graphGenInput)]
             print(f'Generating new graph with layout {graphGenType} with input {inputs}')
-            graph = addMinRequirements(graph_gen['gen'](*inputs))
-            return json.loads(nx.jit_data(graph)), generateFigure(graph, model_name, dropdown_model, tracer), ''
+            try:
+                graph = graph_gen['gen'](*inputs)
+            except (ValueError, NetworkXError) as exception:
+                print(f'Could not generate {graphGenType}: {exception}')
+                return graph_handle, dash.no_update, 'Invalid input', dash.no_update
+            graph = addMinRequirements(graph)
+            return (session_store.put(session_id, graph),
+                generateFigure(graph, model_name, dropdown_model, tracer), '', dash.no_update)
+    elif source == 'upload-graph':
+        if upload is None:
+            raise PreventUpdate()
+        try:
+            graph = loads(base64.b64decode(upload.split(',', 1)[1]))
+        except (ValueError, IndexError, KeyError, struct.error) as exception:
+            print(f'Could not load graph: {exception}')
+            return graph_handle, dash.no_update, 'Invalid file', dash.no_update
+        print(f'Loaded graph with {len(graph)} nodes and {graph.number_of_edges()} edges')
+        graph = addMinRequirements(graph)
+        updateLayout(graph, layout_name, layouts)
+        return (session_store.put(session_id, graph),
+            generateFigure(graph, model_name, dropdown_model, tracer), '', dash.no_update)
+    elif source == 'upload-import':
+        if upload_import is None:
+            raise PreventUpdate()
+        try:
+            graph = import_bytes(base64.b64decode(upload_import.split(',', 1)[1]), import_filename,
+                'directed' in (import_options or []), loadSessionGraph(graph_handle))
+        except (ValueError, IndexError, KeyError) as exception:
+            print(f'Could not import {import_filename}: {exception}')
+            return graph_handle, dash.no_update, 'Invalid file', dash.no_update
+        print(f'Imported graph with {len(graph)} nodes and {graph.number_of_edges()} edges')
+        graph = addMinRequirements(graph)
+        updateLayout(graph, layout_name, layouts)
+        return (session_store.put(session_id, graph),
+            generateFigure(graph, model_name, dropdown_model, tracer), '', dash.no_update)
     print(f'Could not trigger source: {ctx.triggered}')
     raise PreventUpdate
 
+app.clientside_callback(
+    """
+    function(update, figure) {
+        if (!update) {
+            return window.dash_clientside.no_update;
+        }
+        if (update.figure) {
+            return update.figure;
+        }
+        // only the node trace is replaced, all other traces are kept
+        const data = figure.data.slice();
+        const trace = Object.assign({}, data[update.trace]);
+        const marker = Object.assign({}, trace.marker);
+        if (update.indices) {
+            marker.color = Array.from(marker.color);
+            const text = trace.text ? Array.from(trace.text) : trace.text;
+            update.indices.forEach(function(node, idx) {
+                marker.color[node] = update.color[idx];
+                if (text && update.text) {
+                    text[node] = update.text[idx];
+                }
+            });
+            trace.text = text;
+        } else {
+            marker.color = update.color;
+            trace.text = update.text;
+        }
+        trace.marker = marker;
+        data[update.trace] = trace;
+        return Object.assign({}, figure, {data: data});
+    }
+    """,
+    dp.Output('basic-graph', 'figure'),
+    dp.Input('figure-update', 'data'),
+    dp.State('basic-graph', 'figure'))
+
+def compareFigure(summaries):
+    """ Plots the fraction of nodes every model changed per step """
+    figure = go.Figure()
+    for summary in summaries.values():
+        changed = np.asarray(summary['changed'], dtype=np.float64) / max(summary['nodes'], 1)
+        figure.add_trace(go.Scatter(x=np.arange(1, len(changed) + 1), y=changed,
+            mode='lines+markers', name=summary['name']))
+    figure.update_layout(xaxis_title='Step', yaxis_title='Changed nodes',
+        margin={'l': 40, 'r': 20, 't': 20, 'b': 40})
+    return figure
+
+def compareTable(summaries):
+    header = ['Model', 'Mean before', 'Mean after', 'Changed in last step', 'Settled at step', 'States']
+    rows = [[summary['name'], f'{summary["mean"][0]:.3f}', f'{summary["mean"][-1]:.3f}',
+        summary['changed'][-1] if summary['changed'] else 0,
+        summary['settled'] if summary['settled'] is not None else '-',
+        ', '.join(f'{state}: {count}' for state, count in summary['states'].items())]
+        for summary in summaries.values()]
+    return dbc.Table([
+        html.Thead(html.Tr([html.Th(name) for name in header])),
+        html.Tbody([html.Tr([html.Td(value) for value in row]) for row in rows]),
+    ], bordered=True, size='sm')
+
+@app.callback(
+    dp.Output('compare-graph', 'figure'),
+    dp.Output('compare-table', 'children'),
+    dp.Input('session-graph', 'data'),
+    prevent_initial_call=True)
+def update_compare(graph_handle):
+    summaries = session_summaries.pop(graph_handle['id'], None)
+    if summaries is None:
+        raise PreventUpdate()
+    return compareFigure(summaries), compareTable(summaries)
+
+def ensembleFigure(result):
+    """ Plots the mean prevalence per step inside its quantile bands """
+    figure = go.Figure()
+    steps = np.arange(len(result['mean']))
+    quantiles = sorted(result['quantiles'])
+    # the bands are drawn from the outermost to the innermost pair of quantiles
+    for lower, upper in zip(quantiles, reversed(quantiles)):
+        if lower >= upper:
+            break
+        figure.add_trace(go.Scatter(x=steps, y=result['quantiles'][lower], mode='lines',
+            line={'width': 0, 'color': 'steelblue'}, showlegend=False, hoverinfo='skip'))
+        figure.add_trace(go.Scatter(x=steps, y=result['quantiles'][upper], mode='lines',
+            line={'width': 0, 'color': 'steelblue'}, fill='tonexty',
+            fillcolor='rgba(70, 130, 180, 0.2)', name=f'{lower:.0%} - {upper:.0%}'))
+    if 0.5 in result['quantiles']:
+        figure.add_trace(go.Scatter(x=steps, y=result['quantiles'][0.5], mode='lines',
+            line={'dash': 'dash', 'color': 'steelblue'}, name='Median'))
+    figure.add_trace(go.Scatter(x=steps, y=result['mean'], mode='lines',
+        line={'color': 'black'}, name='Mean'))
+    figure.update_layout(xaxis_title='Step', yaxis_title='Prevalence',
+        margin={'l': 40, 'r': 20, 't': 20, 'b': 40})
+    return figure
+
+def ensembleHistogram(result):
+    """ Plots the number of realizations per final size """
+    counts, edges = result['final_size_histogram']
+    figure = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts,
+        width=np.diff(edges), marker={'color': 'steelblue'}))
+    figure.update_layout(xaxis_title='Final size', yaxis_title='Realizations',
+        margin={'l': 40, 'r': 20, 't': 20, 'b': 40})
+    return figure
+
+@app.callback(
+    dp.Output('ensemble-summary', 'children'),
+    dp.Output('ensemble-graph', 'figure'),
+    dp.Output('ensemble-histogram', 'figure'),
+    dp.Output('ensemble-shown', 'data'),
+    dp.Input('session-graph', 'data'),
+    dp.State('ensemble-shown', 'data'),
+    prevent_initial_call=True)
+def update_ensemble(graph_handle, shown):
+    result = session_ensembles.pop(graph_handle['id'], None)
+    if result is None:
+        raise PreventUpdate()
+    finalSize = result['final_size']
+    summary = (f'{result["realizations"]} realizations of {result["key"].upper()}, final size'
+        f' {finalSize.mean():.1f} on average ({np.quantile(finalSize, 0.05):.0f} -'
+        f' {np.quantile(finalSize, 0.95):.0f}), final prevalence {result["mean"][-1]:.3f}')
+    return summary, ensembleFigure(result), ensembleHistogram(result), (shown or 0) + 1
+
+@app.callback(
+    dp.Output('job-progress', 'children'),
+    dp.Output('job-interval', 'disabled'),
+    dp.Output('session-job-done', 'data'),
+    dp.Input('job-interval', 'n_intervals'),
+    dp.Input('session-job', 'data'),
+    dp.Input('action-cancel', 'n_clicks'))
+def poll_job(n_intervals, job_id, n_cancel):
+    if job_id is None:
+        raise PreventUpdate()
+    job = job_queue.get(job_id)
+    if job is None:
+        return '', True, dash.no_update
+
+    ctx = dash.callback_context
+    source = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else None
+    if source == 'action-cancel':
+        if not job_queue.cancel(job_id):
+            raise PreventUpdate()
+        print(f'Cancelling job {job_id}')
+    if job.status in jobs_finished:
+        return f'{job.status.capitalize()}', True, job.id
+    return f'Running {job.progress:.0%}', False, dash.no_update
+
 
 """
 @app.callback(
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+""" Bulk import of edge lists, CSV tables and MatrixMarket files """
+
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+import scipy.io
+import scipy.sparse
+
+from src.state import node_slots, state_columns
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+format_edgelist = 'edgelist'
+format_csv = 'csv'
+format_mtx = 'mtx'
+
+import_formats = {
+    '.txt': format_edgelist,
+    '.edges': format_edgelist,
+    '.edgelist': format_edgelist,
+    '.el': format_edgelist,
+    '.tsv': format_edgelist,
+    '.csv': format_csv,
+    '.mtx': format_mtx,
+}
+
+# number of lines that are parsed at once
+chunk_rows = 1000000
+
+def guess_format(filename):
+    fmt = import_formats.get(os.path.splitext(filename or '')[1].lower())
+    if fmt is None:
+        raise ValueError(f'Unknown file type {filename}, use one of: {list(import_formats)}')
+    return fmt
+
+def read_chunks(reader):
+    frames = list(reader)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def read_edgelist(file):
+    """ Reads whitespace separated 'source target [weight]' lines, # starts a comment """
+    frame = read_chunks(pd.read_csv(file, sep=r'\s+', header=None, comment='#',
+        chunksize=chunk_rows, engine='c'))
+    if frame.shape[1] < 2:
+        raise ValueError('Edge lists need a source and a target column')
+    columns = ['source', 'target', 'weight'][:min(frame.shape[1], 3)]
+    frame = frame.iloc[:, :len(columns)]
+    frame.columns = columns
+    return frame
+
+def read_table(file):
+    """ Reads a CSV file with a header. Edge tables have source and target
+    columns (or use the first two columns), node tables have a node column. """
+    frame = read_chunks(pd.read_csv(file, chunksize=chunk_rows, skipinitialspace=True))
+    frame.columns = [str(column).strip().lower() for column in frame.columns]
+    if 'node' in frame.columns or ('source' in frame.columns and 'target' in frame.columns):
+        return frame
+    if frame.shape[1] < 2:
+        raise ValueError('CSV files need a node column or source and target columns')
+    return frame.rename(columns={frame.columns[0]: 'source', frame.columns[1]: 'target'})
+
+def read_mtx(file):
+    """ Reads a MatrixMarket file, entry (i, j) becomes the edge i -> j """
+    matrix = scipy.io.mmread(file)
+    matrix = matrix.tocoo() if hasattr(matrix, 'tocoo') else scipy.sparse.coo_matrix(matrix)
+    return pd.DataFrame({'source': matrix.row, 'target': matrix.col,
+        'weight': matrix.data.astype(np.float64)})
+
+readers = {
+    format_edgelist: read_edgelist,
+    format_csv: read_table,
+    format_mtx: read_mtx,
+}
+
+def node_column(values):
+    """ Keeps integer node ids and reads all other ids as strings """
+    if values.dtype.kind in 'iu':
+        return values.tolist()
+    return values.astype(str).tolist()
+
+def edges_to_graph(frame, directed=True):
+    """ Builds a graph from an edge table in one add_edges_from call """
+    graph = nx.DiGraph() if directed else nx.Graph()
+    source, target = node_column(frame['source']), node_column(frame['target'])
+    if 'weight' in frame.columns:
+        graph.add_weighted_edges_from(zip(source, target,
+            pd.to_numeric(frame['weight'], errors='coerce').fillna(1.0).tolist()))
+    else:
+        graph.add_edges_from(zip(source, target), weight=1)
+    return graph
+
+def apply_node_table(graph, frame):
+    """ Sets the model state columns of a node table, unknown nodes are added """
+    nodes = node_column(frame['node'])
+    graph.add_nodes_from(nodes)
+    keys = [key for key in frame.columns if key in state_columns]
+    state, slots = node_slots(graph, nodes)
+    for key in keys:
+        values = pd.to_numeric(frame[key], errors='raise').to_numpy()
+        if state is not None:
+            state.scatter(key, slots, values)
+        else:
+            for node, value in zip(nodes, values.tolist()):
+                graph.nodes[node][key] = value
+    print(f'Imported the states {keys} of {len(nodes)} nodes')
+    return graph
+
+def import_file(file, filename, directed=True, graph=None):
+    """ Imports an edge list, CSV or MatrixMarket file.
+
+    Edge tables return a new graph. Node tables set the state columns of
+    the given graph and return it.
+    """
+    frame = readers[guess_format(filename)](file)
+    if 'node' in frame.columns:
+        if graph is None:
+            graph = nx.DiGraph() if directed else nx.Graph()
+        return apply_node_table(graph, frame)
+    return edges_to_graph(frame, directed)
+
+def import_bytes(content, filename, directed=True, graph=None):
+    return import_file(io.BytesIO(content), filename, directed, graph)
+
+if __name__ == '__main__':
+    print('importer.py')
@@ -7,6 +7,7 @@ import networkx as nx
 import dash_html_components as html
 import src.models as md
 import src.tracer as tr
+import src.generators as gen
 
 from src.model_degroot import model_degroot
 from src.model_threshold import model_thu
@@ -74,6 +75,14 @@ layouts = {
         'name': 'Spring Layout',
         'gen': lambda graph: nx.spring_layout(graph),
     },
+    'spring_layout_incremental': {
+        'name': 'Incremental Spring Layout',
+        'gen': lambda graph: md.incrementalSpringLayout(graph),
+        # only moves the nodes that were edited since the last layout,
+        # so it depends on the node positions like the default layout
+        'incremental': True,
+        'cache': False,
+    },
     'spectral_layout': {
         'name': 'Spectral Layout',
         'gen': lambda graph: nx.spectral_layout(graph),
@@ -85,11 +94,32 @@ layouts = {
     'default': {
         'name': 'Default Layout',
         'gen': generateDefaultLayout,
+        # depends on the node positions instead of the topology
+        'cache': False,
     }
 }
 
 class intlist: pass
 
+def edge_gen(function, argtypes):
+    """ Converts the edge arrays of a vectorized generator to a networkx
+    graph, the inputs of the UI are cast to the argument types first """
+    return lambda *args: function(*(argtype(arg)
+        for argtype, arg in zip(argtypes, args))).to_networkx()
+
+def edge_gen_entry(name, function, args, argtypes, argvals, description):
+    return {
+        'name': name,
+        'args': args,
+        'argtypes': argtypes,
+        'argvals': argvals,
+        'gen': edge_gen(function, argtypes),
+        # returns the EdgeList without building the networkx graph
+        'edges': function,
+        'description_fn': f'{function.__name__}({", ".join(args)})',
+        'description': description,
+    }
+
 graph_gens_default = 'random_geometric'
 graph_gens = {
     'balanced_tree': {
@@ -254,6 +284,24 @@ graph_gens = {
         'description_fn': 'random_geometric_graph(n, c)',
         'description': 'Returns a random geometric graph in the unit cube of dimensions dim.',
     },
+    'erdos_renyi': edge_gen_entry('Erdos Renyi (Large)', gen.erdos_renyi,
+        ('n', 'p', 'seed'), (int, float, int), (1000, 0.005, 0),
+        'Returns a G(n, p) random graph, every edge exists with probability p.'),
+    'barabasi_albert': edge_gen_entry('Barabasi Albert (Large)', gen.barabasi_albert,
+        ('n', 'm', 'seed'), (int, int, int), (1000, 2, 0),
+        'Returns a preferential attachment graph, every new node adds m edges.'),
+    'watts_strogatz': edge_gen_entry('Watts Strogatz (Large)', gen.watts_strogatz,
+        ('n', 'k', 'p', 'seed'), (int, int, float, int), (1000, 4, 0.1, 0),
+        'Returns a small world graph, a ring lattice whose edges are rewired with probability p.'),
+    'stochastic_block_model': edge_gen_entry('Stochastic Block Model (Large)', gen.stochastic_block_model,
+        ('n', 'blocks', 'p_in', 'p_out', 'seed'), (int, int, float, float, int), (1000, 4, 0.02, 0.001, 0),
+        'Returns a graph of equally sized blocks with the edge probabilities p_in and p_out.'),
+    'configuration_model': edge_gen_entry('Configuration Model (Large)', gen.configuration_model,
+        ('n', 'gamma', 'min_degree', 'seed'), (int, float, int, int), (1000, 2.5, 2, 0),
+        'Returns a random graph with a power law degree sequence.'),
+    'random_geometric_cells': edge_gen_entry('Random Geometric (Large)', gen.random_geometric,
+        ('n', 'radius', 'seed'), (int, float, int), (1000, 0.05, 0),
+        'Returns a random geometric graph in the unit square, built with a cell list.'),
     #'margulis_gabber_galil_graph': {
     #    'name': 'Margulis Gabber Galil Graph',
     #    'args': ('n',),
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+""" Background jobs for long running model actions """
+
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.metrics import metrics
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+job_queued = 'queued'
+job_running = 'running'
+job_done = 'done'
+job_failed = 'failed'
+job_cancelled = 'cancelled'
+jobs_finished = (job_done, job_failed, job_cancelled)
+
+# number of progress updates of a chunked job
+job_chunks = 10
+
+def estimate_work(graph, args, chunked):
+    """ Estimates the cost of an action as (nodes + edges) * steps * realizations """
+    work = (len(graph) + graph.number_of_edges()) * max(int(args.get('steps', 1) or 1), 1)
+    if not chunked:
+        work *= max(int(args.get('realizations', 1) or 1), 1)
+    return work
+
+class Job:
+    def __init__(self, session_id, name):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.name = name
+        self.status = job_queued
+        self.progress = 0.0
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def describe(self):
+        """ Returns the job state that is shown in the browser """
+        return {'id': self.id, 'name': self.name, 'status': self.status,
+            'progress': self.progress, 'error': self.error}
+
+class JobQueue:
+    """ Runs long model actions on a bounded pool of worker threads.
+
+    Every session can have at most one unfinished job, whose function
+    mutates the live session graph. Chunked jobs run the steps of a model
+    update in parts so that the progress can be polled and a cancel
+    request takes effect between two parts. Submissions are rejected once
+    max_pending jobs are unfinished.
+    """
+    def __init__(self, max_workers=2, max_pending=16, min_work=2000000):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.min_work = min_work
+        self.jobs = {}
+        self.sessions = {}
+        self.executor = None
+        self.mutex = threading.Lock()
+
+    def is_long(self, graph, args, chunked):
+        return estimate_work(graph, args, chunked) >= self.min_work
+
+    def get(self, job_id):
+        with self.mutex:
+            return self.jobs.get(job_id)
+
+    def active(self, session_id):
+        """ Returns the unfinished job of a session or None """
+        with self.mutex:
+            job = self.jobs.get(self.sessions.get(session_id))
+            return job if job is not None and job.status not in jobs_finished else None
+
+    def submit(self, session_id, name, function, data, args, chunked=False, done=None):
+        """ Queues function(data, args) and returns the job or None if the queue is full.
+
+        done(data) is called in the worker after the job completed.
+        """
+        with self.mutex:
+            unfinished = sum(job.status not in jobs_finished for job in self.jobs.values())
+            if unfinished >= self.max_pending:
+                return None
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                    thread_name_prefix='job')
+            # only the latest finished job of every session is kept
+            previous = self.jobs.get(self.sessions.get(session_id))
+            if previous is not None and previous.status in jobs_finished:
+                del self.jobs[previous.id]
+            job = Job(session_id, name)
+            self.jobs[job.id] = job
+            self.sessions[session_id] = job.id
+            job.future = self.executor.submit(self._run, job, function, data, args, chunked, done)
+        return job
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.status in jobs_finished:
+            return False
+        job.cancel_event.set()
+        if job.future.cancel():
+            job.status = job_cancelled
+        return True
+
+    def _run(self, job, function, data, args, chunked, done):
+        job.status = job_running
+        started = time.perf_counter()
+        try:
+            if chunked:
+                steps = int(args.get('steps', 1))
+                chunk = max(1, -(-steps // job_chunks))
+                for start in range(0, steps, chunk):
+                    if job.cancel_event.is_set():
+                        break
+                    data.pop('convergence', None)
+                    data = function(data, dict(args, steps=min(chunk, steps - start)))
+                    job.progress = min(start + chunk, steps) / steps
+                    if data.get('convergence', {}).get('period') == 1:
+                        break # a fixed point does not change anymore
+            elif not job.cancel_event.is_set():
+                data = function(data, args)
+            if done is not None:
+                done(data)
+            if job.cancel_event.is_set():
+                job.status = job_cancelled
+            else:
+                job.progress, job.status = 1.0, job_done
+        except Exception as exception:
+            print(f'Job {job.id} failed: {exception}')
+            job.error, job.status = str(exception), job_failed
+        metrics.observe('odt_job_seconds', time.perf_counter() - started,
+            job=job.name, status=job.status)
+
+if __name__ == '__main__':
+    print('jobs.py')
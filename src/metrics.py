@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+""" Latency and size metrics in the Prometheus text format """
+
+import time
+import bisect
+import threading
+import functools
+
+import flask
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+metrics_options = {'enabled': True}
+
+buckets_seconds = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+buckets_bytes = tuple(256 * 4 ** idx for idx in range(10))
+buckets_count = tuple(10 ** idx for idx in range(1, 8))
+
+class Histogram:
+    """ Counts observations per bucket, the buckets are upper bounds """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """ Registry of labelled histograms.
+
+    Every observation only takes a lock and a bisection, which is cheap
+    compared to the callbacks that are measured.
+    """
+    def __init__(self):
+        self.definitions = {}
+        self.series = {}
+        self.mutex = threading.Lock()
+
+    def define(self, name, description, buckets):
+        self.definitions[name] = (description, buckets)
+
+    def observe(self, name, value, **labels):
+        if not metrics_options['enabled']:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.mutex:
+            histogram = self.series.get(key)
+            if histogram is None:
+                histogram = self.series[key] = Histogram(self.definitions[name][1])
+            histogram.observe(value)
+
+    def render(self):
+        """ Returns all histograms in the Prometheus text exposition format """
+        with self.mutex:
+            series = sorted((key, list(histogram.counts), histogram.sum, histogram.count)
+                for key, histogram in self.series.items())
+        lines = []
+        for name, (description, buckets) in self.definitions.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for (seriesName, labels), counts, total, count in series:
+                if seriesName != name:
+                    continue
+                labelText = ','.join(f'{label}="{escape(value)}"' for label, value in labels)
+                prefix = labelText + ',' if labelText else ''
+                cumulative = 0
+                for bound, bucketCount in zip(buckets + ('+Inf',), counts):
+                    cumulative += bucketCount
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{labelText}}} {total}')
+                lines.append(f'{name}_count{{{labelText}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+metrics = Metrics()
+metrics.define('odt_callback_seconds', 'Duration of a Dash callback request', buckets_seconds)
+metrics.define('odt_callback_payload_bytes', 'Size of a Dash callback response', buckets_bytes)
+metrics.define('odt_phase_seconds', 'Duration of a phase inside a callback', buckets_seconds)
+metrics.define('odt_graph_nodes', 'Number of nodes of the graph a callback works on', buckets_count)
+metrics.define('odt_graph_edges', 'Number of edges of the graph a callback works on', buckets_count)
+metrics.define('odt_job_seconds', 'Duration of a background job', buckets_seconds)
+
+def current_callback():
+    """ Returns the name of the callback that is served by this thread """
+    if flask.has_request_context():
+        return flask.g.get('callback', 'none')
+    return 'none'
+
+class phase:
+    """ Context manager that measures a phase of the current callback """
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        metrics.observe('odt_phase_seconds', time.perf_counter() - self.start,
+            callback=current_callback(), phase=self.name)
+        return False
+
+def timed(name):
+    """ Decorator that measures every call of a function as phase name """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def observe_graph(graph):
+    callback = current_callback()
+    metrics.observe('odt_graph_nodes', len(graph), callback=callback)
+    metrics.observe('odt_graph_edges', graph.number_of_edges(), callback=callback)
+
+def install(app, path='/metrics'):
+    """ Measures every callback request of a Dash app and serves the metrics on path """
+    server = app.server
+
+    @server.before_request
+    def metrics_before():
+        if flask.request.path.endswith('_dash-update-component'):
+            output = (flask.request.get_json(silent=True) or {}).get('output')
+            callback = app.callback_map.get(output, {}).get('callback')
+            flask.g.callback = getattr(callback, '__name__', output)
+            flask.g.start = time.perf_counter()
+
+    @server.after_request
+    def metrics_after(response):
+        start = flask.g.get('start')
+        if start is not None:
+            callback = flask.g.callback
+            metrics.observe('odt_callback_seconds', time.perf_counter() - start, callback=callback)
+            if not response.direct_passthrough:
+                metrics.observe('odt_callback_payload_bytes',
+                    response.calculate_content_length() or 0, callback=callback)
+        return response
+
+    @server.route(path)
+    def metrics_endpoint():
+        return flask.Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+if __name__ == '__main__':
+    print('metrics.py')
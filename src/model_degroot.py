@@ -1,6 +1,8 @@
 
 import numpy as np
 import networkx as nx
+import scipy.sparse.csgraph as csgraph
+import scipy.sparse.linalg as splinalg
 
 import dash
 import dash.dependencies as dp
@@ -12,6 +14,7 @@ from dash.exceptions import PreventUpdate
 from src.interaction import *
 from src.tracer import generate_trace
 from src.models import ContinuesState, stochastic_callback, init_value
+from src.engine import compiled_graph, engine_csr, run_kernel
 import src.designs as designs
 
 from src.visual import *
@@ -20,7 +23,9 @@ from src.visual_connections import visual_connections
 id_degroot_button_random = 'degroot-button-random'
 id_degroot_button_stochastic = 'degroot-button-stochastic'
 id_degroot_button_step = 'degroot-button-step'
+id_degroot_button_consensus = 'degroot-button-consensus'
 id_degroot_dropdown = 'degroot-dropdown'
+id_degroot_dropdown_engine = 'degroot-dropdown-engine'
 id_degroot_slider_steps = 'degroot-slider-steps'
 id_degroot_slider_steps_value = 'degroot-slider-steps-value'
 id_degroot_modal = 'degroot-init'
@@ -32,8 +37,20 @@ action_degroot_stochastic = 'action_degroot_stochastic'
 action_degroot_step = 'action_degroot_step'
 action_degroot_visual = 'action_degroot_visual'
 action_degroot_init = 'action_degroot_init'
+action_degroot_consensus = 'action_degroot_consensus'
+
+def degroot_inputs(state, args):
+    return [state]
+
+def degroot_kernel(compiled, state, args, sums=None):
+    if sums is None:
+        sums = compiled.neighbour_sums(degroot_inputs(state, args), 'weights')
+    return sums[0]
 
 def degroot_update(data, args):
+    if args.get('engine') == engine_csr:
+        return run_kernel(data, args, model_degroot['key'], degroot_kernel, np.float64)
+
     transpose, clip = False, False
     graph = data['graph']
 
@@ -55,6 +72,54 @@ def degroot_update(data, args):
         node[1][key] = val
     return data
 
+def is_aperiodic(graph):
+    if isinstance(graph, nx.DiGraph):
+        return nx.is_aperiodic(graph)
+    return not nx.is_bipartite(graph)
+
+def stationary_distribution(weights):
+    """ Returns the left eigenvector of the eigenvalue 1 normalized to a distribution """
+    if weights.shape[0] < 3:
+        values, vectors = np.linalg.eig(weights.toarray().T)
+    else:
+        values, vectors = splinalg.eigs(weights.T, k=1, which='LM')
+    vector = np.real(vectors[:, np.argmin(np.abs(values - 1.0))])
+    return vector / vector.sum()
+
+def degroot_limit(compiled, state, tol=1e-10, max_steps=10000):
+    """ Calculates the limiting opinions of the DeGroot model.
+
+    A strongly connected and aperiodic graph with stochastic weights
+    reaches a consensus that is given by the stationary distribution
+    weighted average of the initial opinions. All other graphs are
+    iterated with sparse matrix vector products until the opinions
+    change less than tol.
+    """
+    weights = compiled.weights
+    if len(compiled) == 0:
+        return state
+    components, _ = csgraph.connected_components(weights, connection='strong')
+    stochastic = np.allclose(weights.sum(axis=1), 1.0)
+    if components == 1 and stochastic and is_aperiodic(compiled.graph):
+        return np.full(len(state), stationary_distribution(weights) @ state)
+
+    for _ in range(max_steps):
+        newState = weights @ state
+        if not np.all(np.isfinite(newState)):
+            print('DeGroot: Opinions diverge, the weights are not stochastic')
+            return state
+        if np.max(np.abs(newState - state)) < tol:
+            return newState
+        state = newState
+    print(f'DeGroot: Opinions did not converge after {max_steps} steps')
+    return state
+
+def degroot_consensus(data, args):
+    compiled = compiled_graph(data)
+    state = compiled.state(model_degroot['key'], np.float64)
+    compiled.write(model_degroot['key'], degroot_limit(compiled, state))
+    return data
+
 def degroot_random(data, args):
     state = ContinuesState(0.0, 1.0)
     for node, data_node in data['graph'].nodes(data=True):
@@ -73,8 +138,10 @@ def degroot_build(model_id):
                 html.Div([html.Button('Random', id=id_degroot_button_random, style=designs.but)], style=designs.col),
                 html.Div([html.Button('Stochastic', id=id_degroot_button_stochastic, style=designs.but)], style=designs.col),
                 html.Div([html.Button('Step', id=id_degroot_button_step, style=designs.but)], style=designs.col),
+                html.Div([html.Button('Consensus', id=id_degroot_button_consensus, style=designs.but)], style=designs.col),
                 html.Div([build_step_slider(
-                    id_degroot_slider_steps_value, id_degroot_slider_steps, 'Steps')], style=designs.col)
+                    id_degroot_slider_steps_value, id_degroot_slider_steps, 'Steps')], style=designs.col),
+                html.Div([build_engine_selector(id_degroot_dropdown_engine)], style=designs.col),
             ] + build_visual_selector(model_degroot, id=id_degroot_dropdown),
             style=designs.row,
             id={'type': model_degroot['id'], 'index': model_degroot['id']}
@@ -88,6 +155,7 @@ def degroot_build_actions():
         action_degroot_random: degroot_random, 
         action_degroot_stochastic: stochastic_callback,
         action_degroot_step: degroot_update,
+        action_degroot_consensus: degroot_consensus,
         action_degroot_init: lambda data, args: init_value(data, args, model_degroot['key']),
     }
 
@@ -106,18 +174,21 @@ def build_degroot_callbacks(app):
         dp.Input(id_degroot_button_random, 'n_clicks'),
         dp.Input(id_degroot_button_stochastic, 'n_clicks'),
         dp.Input(id_degroot_button_step, 'n_clicks'),
+        dp.Input(id_degroot_button_consensus, 'n_clicks'),
         dp.Input(id_degroot_modal_generate, 'n_clicks'),
         dp.State(id_degroot_modal_init_slider, 'value'),
-        dp.State(id_degroot_slider_steps, 'value'))
-    def callback(n1, n2, n3, n4, init, steps):
+        dp.State(id_degroot_slider_steps, 'value'),
+        dp.State(id_degroot_dropdown_engine, 'value'))
+    def callback(n1, n2, n3, n4, n5, init, steps, engine):
         ctx = dash.callback_context
         if not ctx.triggered: return []
         source = ctx.triggered[0]['prop_id'].split('.')[0]
-        args = {'steps': steps, 'init': init}
+        args = {'steps': steps, 'init': init, 'engine': engine}
         ac = {
             id_degroot_button_random: action_degroot_random,
             id_degroot_button_stochastic: action_degroot_stochastic,
             id_degroot_button_step: action_degroot_step,
+            id_degroot_button_consensus: action_degroot_consensus,
             id_degroot_modal_generate: action_degroot_init
         }
         if source in ac:
@@ -145,8 +216,12 @@ model_degroot = {
     'actions': degroot_build_actions(),
     'callbacks': build_degroot_callbacks,
     'update': degroot_update,
+    'kernel': degroot_kernel,
+    'kernel-inputs': ('weights', degroot_inputs),
+    'background': [action_degroot_consensus],
     'session-actions': 'session-actions-degroot',
     'session-tracer': 'session-tracer-degroot',
+    'state-actions': [action_degroot_random, action_degroot_step, action_degroot_consensus, action_degroot_init],
     'visual_default': visual_degroot['id'],
     'visuals': { model['id']: model for model in [
         visual_connections, visual_degroot
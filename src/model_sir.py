@@ -12,6 +12,9 @@ from dash.exceptions import PreventUpdate
 from src.interaction import *
 from src.tracer import generate_trace
 from src.models import init_value
+from src.engine import engines, engine_csr, engine_event, run_kernel
+from src.events import run_events
+from src.ensemble import ensemble_action
 import src.designs as designs
 
 from src.visual import *
@@ -21,7 +24,9 @@ from src.visual_connections import visual_connections
 id_sir_button_random = 'sir-button-random'
 id_sir_button_step = 'sir-button-step'
 id_sir_button_one = 'sir-button-one'
+id_sir_button_ensemble = 'sir-button-ensemble'
 id_sir_dropdown = 'sir-dropdown'
+id_sir_dropdown_engine = 'sir-dropdown-engine'
 
 id_sir_slider_steps = 'sir-slider-steps'
 id_sir_slider_steps_value = 'sir-slider-steps-value'
@@ -29,6 +34,9 @@ id_sir_slider_prob = 'sir-slider-prob'
 id_sir_slider_prob_value = 'sir-slider-prob-value'
 id_sir_slider_itime = 'sir-slider-itime'
 id_sir_slider_itime_value = 'sir-slider-itime-value'
+id_sir_slider_ensemble = 'sir-slider-ensemble'
+id_sir_slider_ensemble_value = 'sir-slider-ensemble-value'
+id_sir_input_seed = 'sir-input-seed'
 id_sir_modal = 'sir-init'
 id_sir_modal_generate = 'sir-init-generate'
 id_sir_modal_init_slider = 'sir-init-slider'
@@ -38,9 +46,28 @@ action_sir_random = 'action_sir_random'
 action_sir_step = 'action_sir_step'
 action_sir_visual = 'action_sir_visual'
 action_sir_init = 'action_sir_init'
+action_sir_ensemble = 'action_sir_ensemble'
 
 
+def sir_inputs(state, args):
+    return [state >= 1]
+
+def sir_kernel(compiled, state, args, sums=None):
+    count, = compiled.neighbour_sums(sir_inputs(state, args)) if sums is None else sums
+    # 1 minus healthy prob
+    infection_prob = 1.0 - (1.0 - args['prob']) ** count
+    rng = args.get('rng', np.random)
+    infected = (state == 0) & (rng.random(state.shape) <= infection_prob)
+    newState = np.where(state > 1, state - 1, state)
+    newState[state == 1] = -1 # recovered
+    return np.where(infected, args['itime'], newState)
+
 def sir_update(data, args):
+    if args.get('engine') == engine_csr:
+        return run_kernel(data, args, model_sir['key'], sir_kernel)
+    if args.get('engine') == engine_event:
+        return run_events(data, args, model_sir['key'], -1)
+
     graph = data['graph']
     sir_key = model_sir['key']
 
@@ -86,12 +113,15 @@ def sir_build_actions():
         action_sir_step: sir_update,
         action_sir_one: sir_one,
         action_sir_init: lambda data, args: init_value(data, args, model_sir['key']),
+        action_sir_ensemble: lambda data, args: ensemble_action(
+            data, args, model_sir['key'], sir_kernel),
     }
 
 def sir_build_callbacks(app):
     build_step_callback(app, id_sir_slider_steps_value, id_sir_slider_steps, 'Steps')
     build_prob_callback(app, id_sir_slider_prob_value, id_sir_slider_prob)
     build_infection_callback(app, id_sir_slider_itime_value, id_sir_slider_itime)
+    build_ensemble_callback(app, id_sir_slider_ensemble_value, id_sir_slider_ensemble)
     build_init_callback(app, id_sir_modal, id_sir_modal_init_slider, model_sir['name'])
 
     @app.callback(
@@ -105,21 +135,27 @@ def sir_build_callbacks(app):
         dp.Input(id_sir_button_random, 'n_clicks'),
         dp.Input(id_sir_button_step, 'n_clicks'),
         dp.Input(id_sir_button_one, 'n_clicks'),
+        dp.Input(id_sir_button_ensemble, 'n_clicks'),
         dp.Input(id_sir_modal_generate, 'n_clicks'),
         dp.State(id_sir_modal_init_slider, 'value'),
         dp.State(id_sir_slider_steps, 'value'),
         dp.State(id_sir_slider_prob, 'value'),
-        dp.State(id_sir_slider_itime, 'value'),)
-    def callback(n1, n2, n3, n4, init, steps, prob, itime):
+        dp.State(id_sir_slider_itime, 'value'),
+        dp.State(id_sir_dropdown_engine, 'value'),
+        dp.State(id_sir_slider_ensemble, 'value'),
+        dp.State(id_sir_input_seed, 'value'),)
+    def callback(n1, n2, n3, n4, n5, init, steps, prob, itime, engine, realizations, seed):
         ctx = dash.callback_context
         if not ctx.triggered: return []
         source = ctx.triggered[0]['prop_id'].split('.')[0]
-        args = {'steps': steps, 'prob': prob, 'itime': itime, 'init': init}
+        args = {'steps': steps, 'prob': prob, 'itime': itime, 'init': init, 'engine': engine,
+            'realizations': realizations, 'seed': seed}
 
         ac = {
             id_sir_button_random: action_sir_random,
             id_sir_button_step: action_sir_step,
             id_sir_button_one: action_sir_one,
+            id_sir_button_ensemble: action_sir_ensemble,
             id_sir_modal_generate: action_sir_init
         }
         if source in ac:
@@ -139,12 +175,16 @@ def sir_build(model_id):
                 html.Div([html.Button('Random', id=id_sir_button_random, style=designs.but)], style=designs.col),
                 html.Div([html.Button('Step', id=id_sir_button_step, style=designs.but)], style=designs.col),
                 html.Div([html.Button('One', id=id_sir_button_one, style=designs.but)], style=designs.col),
+                html.Div([html.Button('Ensemble', id=id_sir_button_ensemble, style=designs.but)], style=designs.col),
                 html.Div([build_step_slider(
                     id_sir_slider_steps_value, id_sir_slider_steps, 'Steps')], style=designs.col),
                 html.Div([build_prob_slider(
                     id_sir_slider_prob_value, id_sir_slider_prob)]),
                 html.Div([build_infection_slider(
                     id_sir_slider_itime_value, id_sir_slider_itime)], style=designs.col),
+                html.Div([build_ensemble_slider(id_sir_slider_ensemble_value,
+                    id_sir_slider_ensemble, id_sir_input_seed)], style=designs.col),
+                html.Div([build_engine_selector(id_sir_dropdown_engine, engines)], style=designs.col),
             ] + build_visual_selector(model_sir, id=id_sir_dropdown),
             style=designs.row,
             id={'type': model_sir['id'], 'index': model_sir['id']}
@@ -164,6 +204,17 @@ visual_sir = {
     'tracer': sir_tracer,
 }
 
+def sir_risk_tracer(graph, node_x, node_y, node_ids):
+    """ Generates the SIR infection risk tracer """
+    return generate_trace(graph, node_x, node_y, node_ids,
+        f"{model_sir['key']}_risk", 'Infection Risk', 'YlOrRd')
+
+visual_sir_risk = {
+    'id': 'tracer_sir_risk',
+    'name': 'Infection Risk Tracer',
+    'tracer': sir_risk_tracer,
+}
+
 model_sir = {
     'id': 'sir',
     'name': 'SIR',
@@ -175,11 +226,15 @@ model_sir = {
     'actions': sir_build_actions(),
     'callbacks': sir_build_callbacks,
     'update': sir_update,
+    'kernel': sir_kernel,
+    'kernel-inputs': ('adjacency', sir_inputs),
+    'background': [action_sir_ensemble],
     'session-actions': 'session-actions-sir',
     'session-tracer': 'session-tracer-sir',
+    'state-actions': [action_sir_random, action_sir_step, action_sir_one, action_sir_init, action_sir_ensemble],
     'visual_default': visual_sir['id'],
     'visuals': { model['id']: model for model in [
-        visual_connections, visual_sir
+        visual_connections, visual_sir, visual_sir_risk
     ]},
 }
 
@@ -14,6 +14,9 @@ from dash.exceptions import PreventUpdate
 from src.interaction import *
 from src.tracer import generate_trace
 from src.models import init_value
+from src.engine import engines, engine_csr, engine_event, run_kernel
+from src.events import run_events
+from src.ensemble import ensemble_action
 import src.designs as designs
 
 from src.visual import *
@@ -22,14 +25,19 @@ from src.visual_connections import visual_connections
 id_sis_button_random = 'sis-button-random'
 id_sis_button_step = 'sis-button-step'
 id_sis_button_one = 'sis-button-one'
+id_sis_button_ensemble = 'sis-button-ensemble'
 
 id_sis_dropdown = 'sis-dropdown'
+id_sis_dropdown_engine = 'sis-dropdown-engine'
 id_sis_slider_steps = 'sis-slider-steps'
 id_sis_slider_steps_value = 'sis-slider-steps-value'
 id_sis_slider_prob = 'sis-slider-prob'
 id_sis_slider_prob_value = 'sis-slider-prob-value'
 id_sis_slider_itime = 'sis-slider-itime'
 id_sis_slider_itime_value = 'sis-slider-itime-value'
+id_sis_slider_ensemble = 'sis-slider-ensemble'
+id_sis_slider_ensemble_value = 'sis-slider-ensemble-value'
+id_sis_input_seed = 'sis-input-seed'
 id_sis_modal = 'sis-init'
 id_sis_modal_generate = 'sis-init-generate'
 id_sis_modal_init_slider = 'sis-init-slider'
@@ -39,8 +47,25 @@ action_sis_random = 'action_sis_random'
 action_sis_step = 'action_sis_step'
 action_sis_visual = 'action_sis_visual'
 action_sis_init = 'action_sis_init'
+action_sis_ensemble = 'action_sis_ensemble'
+
+def sis_inputs(state, args):
+    return [state >= 1]
+
+def sis_kernel(compiled, state, args, sums=None):
+    count, = compiled.neighbour_sums(sis_inputs(state, args)) if sums is None else sums
+    # 1 minus healthy prob
+    infection_prob = 1.0 - (1.0 - args['prob']) ** count
+    rng = args.get('rng', np.random)
+    infected = (state == 0) & (rng.random(state.shape) <= infection_prob)
+    return np.where(infected, args['itime'], np.where(state > 0, state - 1, state))
 
 def sis_update(data, args):
+    if args.get('engine') == engine_csr:
+        return run_kernel(data, args, model_sis['key'], sis_kernel)
+    if args.get('engine') == engine_event:
+        return run_events(data, args, model_sis['key'], 0)
+
     graph = data['graph']
     sir_key = model_sis['key']
 
@@ -81,12 +106,15 @@ def sis_build_actions():
         action_sis_step: sis_update,
         action_sis_one: sis_one,
         action_sis_init: lambda data, args: init_value(data, args, model_sis['key']),
+        action_sis_ensemble: lambda data, args: ensemble_action(
+            data, args, model_sis['key'], sis_kernel),
     }
 
 def sis_build_callbacks(app):
     build_step_callback(app, id_sis_slider_steps_value, id_sis_slider_steps, 'Steps')
     build_prob_callback(app, id_sis_slider_prob_value, id_sis_slider_prob)
     build_infection_callback(app, id_sis_slider_itime_value, id_sis_slider_itime)
+    build_ensemble_callback(app, id_sis_slider_ensemble_value, id_sis_slider_ensemble)
     build_init_callback(app, id_sis_modal, id_sis_modal_init_slider, 'SIS')
 
     @app.callback(
@@ -100,20 +128,26 @@ def sis_build_callbacks(app):
         dp.Input(id_sis_button_random, 'n_clicks'),
         dp.Input(id_sis_button_step, 'n_clicks'),
         dp.Input(id_sis_button_one, 'n_clicks'),
+        dp.Input(id_sis_button_ensemble, 'n_clicks'),
         dp.Input(id_sis_modal_generate, 'n_clicks'),
         dp.State(id_sis_modal_init_slider, 'value'),
         dp.State(id_sis_slider_steps, 'value'),
         dp.State(id_sis_slider_prob, 'value'),
-        dp.State(id_sis_slider_itime, 'value'),)
-    def callback(n1, n2, n3, n4, init, steps, prob, itime):
+        dp.State(id_sis_slider_itime, 'value'),
+        dp.State(id_sis_dropdown_engine, 'value'),
+        dp.State(id_sis_slider_ensemble, 'value'),
+        dp.State(id_sis_input_seed, 'value'),)
+    def callback(n1, n2, n3, n4, n5, init, steps, prob, itime, engine, realizations, seed):
         ctx = dash.callback_context
         if not ctx.triggered: return []
         source = ctx.triggered[0]['prop_id'].split('.')[0]
-        args = {'steps': steps, 'prob': prob, 'itime': itime, 'init': init}
+        args = {'steps': steps, 'prob': prob, 'itime': itime, 'init': init, 'engine': engine,
+            'realizations': realizations, 'seed': seed}
         ac = {
             id_sis_button_random: action_sis_random,
             id_sis_button_step: action_sis_step,
             id_sis_button_one: action_sis_one,
+            id_sis_button_ensemble: action_sis_ensemble,
             id_sis_modal_generate: action_sis_init,
         }
         if source in ac:
@@ -134,12 +168,16 @@ def sis_build(model_id):
                 html.Div([html.Button('Random', id=id_sis_button_random, style=designs.but)], style=designs.col),
                 html.Div([html.Button('Step', id=id_sis_button_step, style=designs.but)], style=designs.col),
                 html.Div([html.Button('One', id=id_sis_button_one, style=designs.but)], style=designs.col),
+                html.Div([html.Button('Ensemble', id=id_sis_button_ensemble, style=designs.but)], style=designs.col),
                 html.Div([build_step_slider(
                     id_sis_slider_steps_value, id_sis_slider_steps, 'Steps')], style=designs.col),
                 html.Div([build_prob_slider(
                     id_sis_slider_prob_value, id_sis_slider_prob)], style=designs.col),
                 html.Div([build_infection_slider(
                     id_sis_slider_itime_value, id_sis_slider_itime)], style=designs.col),
+                html.Div([build_ensemble_slider(id_sis_slider_ensemble_value,
+                    id_sis_slider_ensemble, id_sis_input_seed)], style=designs.col),
+                html.Div([build_engine_selector(id_sis_dropdown_engine, engines)], style=designs.col),
             ] + build_visual_selector(model_sis, id=id_sis_dropdown),
             style=designs.row,
             id={'type': model_sis['id'], 'index': model_sis['id']}
@@ -158,6 +196,17 @@ visual_sis = {
     'tracer': sis_tracer,
 }
 
+def sis_risk_tracer(graph, node_x, node_y, node_ids):
+    """ Generates the SIS infection risk tracer """
+    return generate_trace(graph, node_x, node_y, node_ids,
+        f"{model_sis['key']}_risk", 'Infection Risk', 'YlOrRd')
+
+visual_sis_risk = {
+    'id': 'tracer_sis_risk',
+    'name': 'Infection Risk Tracer',
+    'tracer': sis_risk_tracer,
+}
+
 model_sis = {
     'id': 'sis',
     'name': 'SIS',
@@ -169,11 +218,15 @@ model_sis = {
     'actions': sis_build_actions(),
     'callbacks': sis_build_callbacks,
     'update': sis_update,
+    'kernel': sis_kernel,
+    'kernel-inputs': ('adjacency', sis_inputs),
+    'background': [action_sis_ensemble],
     'session-actions': 'session-actions-sis',
     'session-tracer': 'session-tracer-sis',
+    'state-actions': [action_sis_random, action_sis_step, action_sis_one, action_sis_init, action_sis_ensemble],
     'visual_default': visual_sis['id'],
     'visuals': { model['id']: model for model in [
-        visual_connections, visual_sis
+        visual_connections, visual_sis, visual_sis_risk
     ]},
 }
 
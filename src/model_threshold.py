@@ -12,6 +12,7 @@ from dash.exceptions import PreventUpdate
 from src.interaction import *
 from src.tracer import generate_trace
 from src.models import DiscreteState, init_value
+from src.engine import engine_csr, run_kernel, run_sweeps
 import src.designs as designs
 
 from src.visual import *
@@ -20,6 +21,7 @@ from src.visual_connections import visual_connections
 id_thu_button_random = 'thu-button-random'
 id_thu_button_step = 'thu-button-step'
 id_thu_dropdown = 'thu-dropdown'
+id_thu_dropdown_engine = 'thu-dropdown-engine'
 id_thu_slider_threshold = 'thu-slider-threshold'
 id_thu_threshold_id = 'thu-slider-threshold-val'
 id_thu_slider_steps = 'thu-slider-steps'
@@ -33,24 +35,33 @@ action_thu_step = 'action_thu_step'
 action_thu_visual = 'action_thu_visual'
 action_thu_init = 'action_thu_init'
 
-def thu_update(data, args):
+def thu_inputs(state, args):
+    return [state > 0.5]
+
+def thu_kernel(compiled, state, args, sums=None):
+    count, = compiled.neighbour_sums(thu_inputs(state, args)) if sums is None else sums
+    return np.where(count < args['threshold'] * compiled.degree, 0, 1)
+
+def thu_sweep(graph, args):
     threshold = args['threshold']
-    graph = data['graph']
     thu_key = model_thu['key']
 
-    for i in range(args['steps']):
-        update_dict = {}
-        for srcNode, adjacency in graph.adjacency():
-            count, total = 0, len(adjacency)
-            for dstNode in adjacency.keys():
-                if graph.nodes[dstNode][thu_key] > 0.5:
-                    count += 1
-            update_dict[srcNode] = 0 if count < threshold * total else 1
-
-        # applies the update dictionary
-        for key, value in update_dict.items():
-            graph.nodes[key][thu_key] = value
-    return data
+    update_dict = {}
+    for srcNode, adjacency in graph.adjacency():
+        count, total = 0, len(adjacency)
+        for dstNode in adjacency.keys():
+            if graph.nodes[dstNode][thu_key] > 0.5:
+                count += 1
+        update_dict[srcNode] = 0 if count < threshold * total else 1
+
+    # applies the update dictionary
+    for key, value in update_dict.items():
+        graph.nodes[key][thu_key] = value
+
+def thu_update(data, args):
+    if args.get('engine') == engine_csr:
+        return run_kernel(data, args, model_thu['key'], thu_kernel, converge=True)
+    return run_sweeps(data, args, model_thu['key'], thu_sweep, converge=True)
 
 def thu_random(data, args):
     state = DiscreteState([0, 1])
@@ -76,11 +87,7 @@ def threshold_uniform_build_callbacks(app):
     def tracer_callback(value):
         return [model_thu['id'], value]
 
-    @app.callback(
-        dp.Output(id_thu_threshold_id, 'children'),
-        dp.Input(id_thu_slider_threshold, 'value'))
-    def slider_update(value):
-        return f'Threshold: {value}'
+    build_label_callback(app, id_thu_threshold_id, id_thu_slider_threshold, 'Threshold:')
 
     @app.callback(
         dp.Output(model_thu['session-actions'], 'data'),
@@ -89,12 +96,13 @@ def threshold_uniform_build_callbacks(app):
         dp.Input(id_thu_modal_generate, 'n_clicks'),
         dp.State(id_thu_modal_init_slider, 'value'),
         dp.State(id_thu_slider_threshold, 'value'),
-        dp.State(id_thu_slider_steps, 'value'))
-    def callback(n1, n2, n3, init, threshold, steps):
+        dp.State(id_thu_slider_steps, 'value'),
+        dp.State(id_thu_dropdown_engine, 'value'))
+    def callback(n1, n2, n3, init, threshold, steps, engine):
         ctx = dash.callback_context
         if not ctx.triggered: return []
         source = ctx.triggered[0]['prop_id'].split('.')[0]
-        args = {'threshold': threshold, 'steps': steps, 'init': init}
+        args = {'threshold': threshold, 'steps': steps, 'init': init, 'engine': engine}
         ac = {
             id_thu_button_random: action_thu_random,
             id_thu_button_step: action_thu_step,
@@ -130,7 +138,8 @@ def threshold_uniform_build(model_id):
                         style={'width': '200px'}
                     ),
                     style=designs.col
-                )
+                ),
+                html.Div([build_engine_selector(id_thu_dropdown_engine)], style=designs.col),
             ] + build_visual_selector(model_thu, id=id_thu_dropdown),
             style=designs.row,
             id={'type': model_thu['id'], 'index': model_thu['id']}
@@ -161,8 +170,11 @@ model_thu = {
     'actions': thu_build_actions(),
     'callbacks': threshold_uniform_build_callbacks,
     'update': thu_update,
+    'kernel': thu_kernel,
+    'kernel-inputs': ('adjacency', thu_inputs),
     'session-actions': 'session-actions-thu',
     'session-tracer': 'session-tracer-thu',
+    'state-actions': [action_thu_random, action_thu_step, action_thu_init],
     'visual_default': visual_thu['id'],
     'visuals': { model['id']: model for model in [
         visual_connections, visual_thu
@@ -13,6 +13,7 @@ from dash.exceptions import PreventUpdate
 from src.interaction import *
 from src.tracer import generate_trace
 from src.models import DiscreteState, init_value
+from src.engine import engine_csr, run_kernel, run_sweeps
 import src.designs as designs
 
 from src.visual import *
@@ -21,6 +22,7 @@ from src.visual_connections import visual_connections
 id_tha_button_random = 'tha-button-random'
 id_tha_button_step = 'tha-button-step'
 id_tha_dropdown = 'tha-dropdown'
+id_tha_dropdown_engine = 'tha-dropdown-engine'
 id_tha_slider_steps = 'tha-slider-steps'
 id_tha_slider_steps_value = 'tha-slider-steps-value'
 id_tha_modal = 'tha-init'
@@ -32,49 +34,74 @@ action_tha_step = 'action_tha_step'
 action_tha_visual = 'action_tha_visual'
 action_tha_init = 'action_tha_init'
 
-def tha_update(data, args):
-    graph = data['graph']
+def tha_inputs(state, args):
+    return [state > 0.5, state < -0.5]
+
+def tha_kernel(compiled, state, args, sums=None):
+    countP, countN = compiled.neighbour_sums(tha_inputs(state, args)) if sums is None else sums
+    total = compiled.degree
+
+    # lonely persons never change
+    active = total > 0
+    sP, sNP = active & (countP == total), active & (countN == total)
+    wP = (countP > 0) & (countN == 0)
+    wNP = (countN > 0) & (countP == 0)
+
+    newState = state.copy()
+    P, NP, UP = state > 0, state < 0, state == 0
+    newState[P & wNP & ~sNP] = 0
+    newState[P & sNP] = -1
+    newState[NP & wP & ~sP] = 0
+    newState[NP & sP] = 1
+    newState[UP & sP] = 1
+    newState[UP & sNP] = -1
+    return newState
+
+def tha_sweep(graph, args):
     tha_key = model_tha['key']
 
-    for i in range(args['steps']):
-        update_dict = {}
-        for srcNode, adjacency in graph.adjacency():
-            # counts 
-            countP, countN, total = 0, 0, len(adjacency)
-            if total == 0: 
-                continue # lonely persons never change
-
-            for dstNode in adjacency.keys():
-                if graph.nodes[dstNode][tha_key] > 0.5:
-                    countP += 1
-                elif graph.nodes[dstNode][tha_key] < -0.5:
-                    countN -= 1
-
-            sP, sNP = countP == total, countN == total
-            wP = countP > 0 and countN == 0
-            wNP = countN > 0 and countP == 0
-
-            state = graph.nodes[srcNode][tha_key]
-            if state > 0: # P
-                if wNP and not sNP:
-                    update_dict[srcNode] = 0
-                if sNP:
-                    update_dict[srcNode] = -1
-            elif state < 0: # NP
-                if wP and not sP:
-                    update_dict[srcNode] = 0
-                if sP:
-                    update_dict[srcNode] = 1
-            elif state == 0: # UP
-                if sP:
-                    update_dict[srcNode] = 1
-                if sNP:
-                    update_dict[srcNode] = -1
-            
-        # applies the update dictionary
-        for key, value in update_dict.items():
-            graph.nodes[key][tha_key] = value
-    return data
+    update_dict = {}
+    for srcNode, adjacency in graph.adjacency():
+        # counts 
+        countP, countN, total = 0, 0, len(adjacency)
+        if total == 0: 
+            continue # lonely persons never change
+
+        for dstNode in adjacency.keys():
+            if graph.nodes[dstNode][tha_key] > 0.5:
+                countP += 1
+            elif graph.nodes[dstNode][tha_key] < -0.5:
+                countN += 1
+
+        sP, sNP = countP == total, countN == total
+        wP = countP > 0 and countN == 0
+        wNP = countN > 0 and countP == 0
+
+        state = graph.nodes[srcNode][tha_key]
+        if state > 0: # P
+            if wNP and not sNP:
+                update_dict[srcNode] = 0
+            if sNP:
+                update_dict[srcNode] = -1
+        elif state < 0: # NP
+            if wP and not sP:
+                update_dict[srcNode] = 0
+            if sP:
+                update_dict[srcNode] = 1
+        elif state == 0: # UP
+            if sP:
+                update_dict[srcNode] = 1
+            if sNP:
+                update_dict[srcNode] = -1
+        
+    # applies the update dictionary
+    for key, value in update_dict.items():
+        graph.nodes[key][tha_key] = value
+
+def tha_update(data, args):
+    if args.get('engine') == engine_csr:
+        return run_kernel(data, args, model_tha['key'], tha_kernel, converge=True)
+    return run_sweeps(data, args, model_tha['key'], tha_sweep, converge=True)
 
 def tha_random(data, args):
     state = DiscreteState([0, 1, 2])
@@ -105,12 +132,13 @@ def tha_build_callbacks(app):
         dp.Input(id_tha_button_step, 'n_clicks'),
         dp.Input(id_tha_modal_generate, 'n_clicks'),
         dp.State(id_tha_modal_init_slider, 'value'),
-        dp.State(id_tha_slider_steps, 'value'))
-    def callback(n1, n2, n3, init, steps):
+        dp.State(id_tha_slider_steps, 'value'),
+        dp.State(id_tha_dropdown_engine, 'value'))
+    def callback(n1, n2, n3, init, steps, engine):
         ctx = dash.callback_context
         if not ctx.triggered: return []
         source = ctx.triggered[0]['prop_id'].split('.')[0]
-        args = {'steps': steps, 'init': init}
+        args = {'steps': steps, 'init': init, 'engine': engine}
         ac = {
             id_tha_button_random: action_tha_random,
             id_tha_button_step: action_tha_step,
@@ -133,7 +161,8 @@ def tha_build(model_id):
                 html.Div([html.Button('Random', id=id_tha_button_random, style=designs.but)], style=designs.col),
                 html.Div([html.Button('Step', id=id_tha_button_step, style=designs.but)], style=designs.col),
                 html.Div([build_step_slider(
-                    id_tha_slider_steps_value, id_tha_slider_steps, 'Steps')], style=designs.col)
+                    id_tha_slider_steps_value, id_tha_slider_steps, 'Steps')], style=designs.col),
+                html.Div([build_engine_selector(id_tha_dropdown_engine)], style=designs.col),
             ] + build_visual_selector(model_tha, id=id_tha_dropdown),
             style=designs.row,
             id={'type': model_tha['id'], 'index': model_tha['id']}
@@ -161,9 +190,12 @@ model_tha = {
     'key': 'tha',
     'actions': tha_build_actions(),
     'callbacks': tha_build_callbacks,
-    'update': tha_tracer,
+    'update': tha_update,
+    'kernel': tha_kernel,
+    'kernel-inputs': ('adjacency', tha_inputs),
     'session-actions': 'session-actions-tha',
     'session-tracer': 'session-tracer-tha',
+    'state-actions': [action_tha_random, action_tha_step, action_tha_init],
     'visual_default': tracer_tha_state['id'],
     'visuals': { model['id']: model for model in [
         visual_connections, tracer_tha_state
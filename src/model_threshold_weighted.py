@@ -3,6 +3,7 @@ from math import gcd
 
 import numpy as np
 import networkx as nx
+import scipy.sparse as sp
 
 import dash
 import dash.dependencies as dp
@@ -14,6 +15,9 @@ from dash.exceptions import PreventUpdate
 from src.interaction import *
 from src.tracer import generate_trace
 from src.models import DiscreteState, stochastic_callback, addMinRequirements, init_value
+from src.engine import engine_csr, run_kernel, run_sweeps, iterate
+from src.state import StateGraph, NodeAttributes, node_slots, node_values
+from src.store import node_bytes, edge_bytes
 import src.designs as designs
 
 from src.visual import *
@@ -23,8 +27,10 @@ id_thw_button_random = 'thw-button-random'
 id_thw_button_step = 'thw-button-step'
 id_thw_button_stochastic = 'thw-button-stochastic'
 id_thw_button_convert = 'thw-button-convert'
+id_thw_button_convert_step = 'thw-button-convert-step'
 
 id_thw_dropdown = 'thw-dropdown'
+id_thw_dropdown_engine = 'thw-dropdown-engine'
 id_thw_slider_steps = 'thw-slider-steps'
 id_thw_slider_steps_value = 'thw-slider-steps-value'
 id_thw_modal = 'thw-init'
@@ -34,85 +40,206 @@ id_thw_modal_init_slider = 'thw-init-slider'
 action_thw_random = 'action_thw_random'
 action_thw_stochastic = 'action_thw_stochastic'
 action_thw_step = 'action_thw_step'
-action_thw_convert = 'action_thw_step'
+action_thw_convert = 'action_thw_convert'
+action_thw_convert_step = 'action_thw_convert_step'
 action_thw_visual = 'action_thw_visual'
 action_thw_init = 'action_thw_init'
 
+def thw_inputs(state, args):
+    return [state > 0.5]
+
+def thw_kernel(compiled, state, args, sums=None):
+    if sums is None:
+        sums = compiled.neighbour_sums(thw_inputs(state, args), 'weights')
+    count = sums[0]
+    return np.where(count <= compiled.column('thw_th', np.float64), 0, 1)
+
+def thw_sweep(graph, args):
+    thw_key, thw_th_key, thw_weight_key = model_thw['key'], 'thw_th', 'weight'
+    update_dict = {}
+    for srcNode, adjacency in graph.adjacency():
+        count = 0.0
+        for dstNode, edge in adjacency.items():
+            if graph.nodes[dstNode][thw_key] > 0.5:
+                count += edge['weight']
+        update_dict[srcNode] = 0 if count <= graph.nodes[srcNode][thw_th_key] else 1
+
+    # applies the update dictionary
+    for key, value in update_dict.items():
+        graph.nodes[key][thw_key] = value
+
 def thw_update(data, args):
-    graph = data['graph']
-    thw_key, thw_th_key, thw_weight_key = model_thw['key'], 'thu_th', 'weight'
-    for i in range(args['steps']):
-        update_dict = {}
-        for srcNode, adjacency in graph.adjacency():
-            count = 0.0
-            for dstNode, edge in adjacency.items():
-                if graph.nodes[dstNode][thw_key] > 0.5:
-                    count += edge['weight']
-            update_dict[srcNode] = 0 if count <= srcNode[thw_th_key] else 1
-
-        # applies the update dictionary
-        for key, value in update_dict.items():
-            graph.nodes[key][thw_key] = value
-    return data
+    if args.get('engine') == engine_csr:
+        return run_kernel(data, args, model_thw['key'], thw_kernel, converge=True)
+    return run_sweeps(data, args, model_thw['key'], thw_sweep, converge=True)
+
+# number of nodes above which the converted graph is not built
+convertLimit = 1000000
 
 def thw_convert(data, args):
-    new_graph = convert(data['graph'],
-        'thu_th', 'weight', model_thw['key'])
-    data['graph'] = addMinRequirements(new_graph)
+    graph = data['graph']
+    try:
+        nodes, edges = convert_size(graph, 'thw_th', 'weight')
+    except ValueError as exception:
+        print(f'Could not convert the graph: {exception}')
+        return data
+    memory = (nodes * node_bytes + edges * edge_bytes) / 2 ** 20
+    print(f'Converted graph has {nodes} nodes and {edges} edges (about {memory:.0f} MB)')
+    if nodes > convertLimit:
+        print(f'Refusing to build more than {convertLimit} nodes, use the lazy step instead')
+        return data
+    data['graph'] = addMinRequirements(convert(graph, 'thw_th', 'weight', model_thw['key']))
     return data
 
-def convert(graph, thresholdKey, weightKey, valueKey):
-    outGraph = nx.empty_graph()
+def thw_convert_step(data, args):
+    """ Runs the converted graph for args['steps'] steps without building it
+    and writes the final states of the original nodes back to the graph """
+    graph = data['graph']
+    try:
+        matrix, state = convert_quotient(graph, 'thw_th', 'weight', model_thw['key'])
+    except ValueError as exception:
+        print(f'Could not convert the graph: {exception}')
+        return data
+    # the converted nodes get the default threshold of addMinRequirements
+    state = iterate(data, args['steps'],
+        lambda state: np.where(matrix @ state <= 0.5, 0, 1), state, converge=True)
+    nodes = list(graph.nodes())
+    nodeState, slots = node_slots(graph, nodes)
+    nodeState.scatter(model_thw['key'], slots, state[:len(nodes)])
+    return data
 
+def convert_counts(graph, thresholdKey, weightKey):
+    """ Returns the edges and the number of gadgets and threshold nodes that
+    replace every edge. The numbers are exact integers, so the size of a
+    conversion can be checked before any array is allocated.
+    """
     base = 10 ** 3
-    edgeIdx, nodeIdx = 0, 0
-
-    for nd, data in graph.nodes(data=True):
-        # adds the node with the data key
-        outGraph.add_nodes_from([(nd, {valueKey: data[valueKey]})])
-
+    edges, gadgets, thresholds = [], [], []
     for src, adjacency in graph.adjacency():
-        # gets an integer representation of the threshold
+        # gets an integer representation of the threshold and the weights
         threshold = int(graph.nodes[src][thresholdKey] * base)
+        weights = [int(edgeData[weightKey] * base) for edgeData in adjacency.values()]
+        if threshold <= 0 or any(weight <= 0 for weight in weights):
+            raise ValueError(f'Thresholds and weights must be at least {1 / base}')
 
         # calculates the LCM of the threshold and all the outgoing edges
         lcm = threshold
-        for dst, edgeData in adjacency.items(): # all adjacent nodes
-            weight = int(edgeData[weightKey] * base)
+        for weight in weights:
             lcm = lcm * weight // gcd(lcm, weight)
 
-        for dst, edgeData in adjacency.items(): # all adjacent nodes
-            # calculates the weight in digit count
-            weight = int(edgeData[weightKey] * base)
-
-            # adds the node constructs
-            for i in range(lcm // weight):
-                t1, t2, b = f'f_{edgeIdx}_{i}_0', f'f_{edgeIdx}_{i}_1', f'b_{edgeIdx}_{i}'
-                outGraph.add_nodes_from([
-                    (t1, {valueKey: 0}),
-                    (t2, {valueKey: 0}),
-                    (b, {valueKey: 0}),
-                ])
-                # adds the connecting 
-                outGraph.add_edges_from([
-                    (t1, src), (t2, src),
-                    (b, t1), (b, t2),
-                    (dst, b)
-                ])
-
-            # adds the counter nodes to the source
-            for i in range(2 * (lcm // weight)):
-                counterNode = f'c_{edgeIdx}_{i}'
-                outGraph.add_nodes_from([(counterNode, {valueKey: 1})])
-                outGraph.add_edge(counterNode, src)
-
-            # adds the threshold nodes to the destination
-            for i in range(lcm // threshold):
-                counterNode = f't_{edgeIdx}_{i}'
-                outGraph.add_nodes_from([(counterNode, {valueKey: 0})])
-                outGraph.add_edge(counterNode, dst)
-            edgeIdx += 1
-    return outGraph        
+        for dst, weight in zip(adjacency, weights):
+            edges.append((src, dst))
+            gadgets.append(lcm // weight)
+            thresholds.append(lcm // threshold)
+    return edges, gadgets, thresholds
+
+def convert_size(graph, thresholdKey, weightKey):
+    """ Returns the number of nodes and edges of the converted graph """
+    _, gadgets, thresholds = convert_counts(graph, thresholdKey, weightKey)
+    # every gadget adds three nodes, two counter nodes and seven edges
+    nodes = len(graph) + 5 * sum(gadgets) + sum(thresholds)
+    edges = 7 * sum(gadgets) + sum(thresholds)
+    return nodes, edges
+
+def block_positions(counts):
+    """ Returns the block and the position inside the block of every element
+    when the blocks have the given sizes """
+    blocks = np.repeat(np.arange(len(counts)), counts)
+    starts = np.cumsum(counts) - counts
+    return blocks, np.arange(len(blocks)) - starts[blocks]
+
+def convert(graph, thresholdKey, weightKey, valueKey):
+    """ Builds the unweighted graph that simulates the weighted threshold model.
+
+    Every edge (src, dst) is replaced by gadgets of three nodes t1, t2, b
+    with the edges t1-src, t2-src, b-t1, b-t2 and dst-b, two counter
+    nodes per gadget attached to src and threshold nodes attached to dst.
+    The original nodes keep their names while the new nodes get integer
+    ids after the largest integer node, so all nodes and edges are added
+    with a few bulk calls.
+    """
+    edges, gadgets, thresholds = convert_counts(graph, thresholdKey, weightKey)
+    names = list(graph.nodes())
+    index = {node: idx for idx, node in enumerate(names)}
+    nameArray = np.empty(len(names), dtype=object)
+    nameArray[:] = names
+    src = np.array([index[edge[0]] for edge in edges], dtype=np.int64)
+    dst = np.array([index[edge[1]] for edge in edges], dtype=np.int64)
+    gadgets = np.array(gadgets, dtype=np.int64)
+    thresholds = np.array(thresholds, dtype=np.int64)
+
+    # every edge owns a block of 3 * gadgets gadget nodes, followed by
+    # 2 * gadgets counter nodes and the threshold nodes
+    offset = 1 + max((node for node in names
+        if isinstance(node, (int, np.integer)) and not isinstance(node, bool)), default=-1)
+    counts = 5 * gadgets + thresholds
+    starts = offset + np.cumsum(counts) - counts
+    total = int(counts.sum())
+
+    edgeIdx, i = block_positions(gadgets)
+    t1 = starts[edgeIdx] + 3 * i
+    edgeSrc, edgeDst = nameArray[src[edgeIdx]].tolist(), nameArray[dst[edgeIdx]].tolist()
+    t1, t2, b = t1.tolist(), (t1 + 1).tolist(), (t1 + 2).tolist()
+    counterIdx, i = block_positions(2 * gadgets)
+    counters = (starts[counterIdx] + 3 * gadgets[counterIdx] + i).tolist()
+    thresholdIdx, i = block_positions(thresholds)
+    thresholdNodes = (starts[thresholdIdx] + 5 * gadgets[thresholdIdx] + i).tolist()
+
+    # the nodes are inserted with a block of consecutive slots instead of
+    # allocating the slot of every node on its own
+    outGraph = StateGraph()
+    nodes = names + list(range(offset, offset + total))
+    slots = outGraph.state.allocate_block(len(nodes))
+    outGraph._node.update(zip(nodes,
+        [NodeAttributes(outGraph.state, slot) for slot in slots.tolist()]))
+    outGraph._adj.update((node, {}) for node in nodes)
+    values = np.zeros(len(nodes), dtype=np.int64)
+    values[:len(names)] = node_values(graph, names, valueKey)
+    values[np.asarray(counters, dtype=np.int64) - offset + len(names)] = 1
+    outGraph.state.scatter(valueKey, slots, values)
+
+    outGraph.add_edges_from(zip(t1, edgeSrc), weight=1)
+    outGraph.add_edges_from(zip(t2, edgeSrc), weight=1)
+    outGraph.add_edges_from(zip(b, t1), weight=1)
+    outGraph.add_edges_from(zip(b, t2), weight=1)
+    outGraph.add_edges_from(zip(edgeDst, b), weight=1)
+    outGraph.add_edges_from(zip(counters, nameArray[src[counterIdx]].tolist()), weight=1)
+    outGraph.add_edges_from(zip(thresholdNodes, nameArray[dst[thresholdIdx]].tolist()), weight=1)
+    return outGraph
+
+def convert_quotient(graph, thresholdKey, weightKey, valueKey):
+    """ Returns the converted graph with all equivalent nodes merged.
+
+    The gadget nodes t1 and t2, the b nodes, the counter nodes and the
+    threshold nodes of an edge all have the same neighbours and start in
+    the same state, so they stay equal under the synchronous update. Each
+    of these classes becomes a single node and the returned matrix counts
+    how many members of a class are adjacent to a member of another class.
+    The size is linear in the original graph no matter how large the
+    gadget counts are. Rows 0..n-1 are the original nodes.
+    """
+    edges, gadgets, thresholds = convert_counts(graph, thresholdKey, weightKey)
+    names = list(graph.nodes())
+    index = {node: idx for idx, node in enumerate(names)}
+    size, count = len(names), len(edges)
+    src = np.array([index[edge[0]] for edge in edges], dtype=np.int64)
+    dst = np.array([index[edge[1]] for edge in edges], dtype=np.int64)
+    gadgets = np.array(gadgets, dtype=np.float64)
+    thresholds = np.array(thresholds, dtype=np.float64)
+    t, b = size + 4 * np.arange(count), size + 4 * np.arange(count) + 1
+    c, h = t + 2, t + 3
+    ones = np.ones(count)
+
+    rows = np.concatenate((src, src, t, t, b, b, c, h, dst, dst))
+    cols = np.concatenate((t, c, src, b, t, dst, src, dst, h, b))
+    data = np.concatenate((2 * gadgets, 2 * gadgets, ones, ones, 2 * ones,
+        ones, ones, ones, thresholds, gadgets))
+    matrix = sp.csr_matrix((data, (rows, cols)), shape=(size + 4 * count,) * 2)
+
+    state = np.zeros(size + 4 * count, dtype=np.int64)
+    state[:size] = node_values(graph, names, valueKey)
+    state[c] = 1
+    return matrix, state
 
 def thw_random(data, args):
     state = DiscreteState([0, 1])
@@ -126,6 +253,7 @@ def thw_build_actions():
         action_thw_step: thw_update,
         action_thw_stochastic: stochastic_callback,
         action_thw_convert: thw_convert,
+        action_thw_convert_step: thw_convert_step,
         action_thw_init: lambda data, args: init_value(data, args, model_thw['key']),
     }
 
@@ -145,19 +273,22 @@ def thw_build_callbacks(app):
         dp.Input(id_thw_button_stochastic, 'n_clicks'),
         dp.Input(id_thw_button_step, 'n_clicks'),
         dp.Input(id_thw_button_convert, 'n_clicks'),
+        dp.Input(id_thw_button_convert_step, 'n_clicks'),
         dp.Input(id_thw_modal_generate, 'n_clicks'),
         dp.State(id_thw_modal_init_slider, 'value'),
-        dp.State(id_thw_slider_steps, 'value'))
-    def callback(n1, n2, n3, n4, n5, init, steps):
+        dp.State(id_thw_slider_steps, 'value'),
+        dp.State(id_thw_dropdown_engine, 'value'))
+    def callback(n1, n2, n3, n4, n5, n6, init, steps, engine):
         ctx = dash.callback_context
         if not ctx.triggered: return []
         source = ctx.triggered[0]['prop_id'].split('.')[0]
-        args = {'steps': steps, 'init': init}
+        args = {'steps': steps, 'init': init, 'engine': engine}
         ac = {
             id_thw_button_random: action_thw_random,
             id_thw_button_stochastic: action_thw_stochastic,
             id_thw_button_step: action_thw_step,
             id_thw_button_convert: action_thw_convert,
+            id_thw_button_convert_step: action_thw_convert_step,
             id_thw_modal_generate: action_thw_init,
         }
         if source in ac:
@@ -178,8 +309,10 @@ def threshold_weighted_build(model_id):
                 html.Div([html.Button('Stochastic', id=id_thw_button_stochastic, style=designs.but)], style=designs.col),
                 html.Div([html.Button('Step', id=id_thw_button_step, style=designs.but)], style=designs.col),
                 html.Div([html.Button('Convert', id=id_thw_button_convert, style=designs.but)], style=designs.col),
+                html.Div([html.Button('Lazy Step', id=id_thw_button_convert_step, style=designs.but)], style=designs.col),
                 html.Div([build_step_slider(
-                    id_thw_slider_steps_value, id_thw_slider_steps, 'Steps')], style=designs.col)
+                    id_thw_slider_steps_value, id_thw_slider_steps, 'Steps')], style=designs.col),
+                html.Div([build_engine_selector(id_thw_dropdown_engine)], style=designs.col),
             ] + build_visual_selector(model_thw, id=id_thw_dropdown),
             style=designs.row,
             id={'type': model_thw['id'], 'index': model_thw['id']}
@@ -217,9 +350,12 @@ model_thw = {
     'key': 'thw',
     'actions': thw_build_actions(),
     'callbacks': thw_build_callbacks,
-    'update': threshold_weighted_tracer,
+    'update': thw_update,
+    'kernel': thw_kernel,
+    'kernel-inputs': ('weights', thw_inputs),
     'session-actions': 'session-actions-thw',
     'session-tracer': 'session-tracer-thw',
+    'state-actions': [action_thw_random, action_thw_step, action_thw_convert_step, action_thw_init],
     'visual_default': tracer_weighted_threshold['id'],
     'visuals': { model['id']: model for model in [
         visual_connections, tracer_weighted_threshold, tracer_thw_th
@@ -14,6 +14,7 @@ from dash.exceptions import PreventUpdate
 from src.interaction import *
 from src.tracer import generate_trace
 from src.models import DiscreteState, init_value
+from src.engine import engine_csr, run_kernel, run_sweeps
 import src.designs as designs
 
 from src.visual import *
@@ -23,6 +24,7 @@ id_upodmaj_button_random = 'upodmaj-button-random'
 id_upodmaj_button_step = 'upodmaj-button-step'
 id_upodmaj_button_stochastic = 'upodmaj-button-stochastic'
 id_upodmaj_dropdown = 'upodmaj-dropdown'
+id_upodmaj_dropdown_engine = 'upodmaj-dropdown-engine'
 id_upodmaj_slider_threshold = 'upodmaj-slider-threshold'
 id_upodmaj_threshold_id = 'upodmaj-slider-threshold-val'
 id_upodmaj_slider_steps = 'upodmaj-slider-steps'
@@ -37,25 +39,38 @@ action_upodmaj_step = 'action_upodmaj_step'
 action_upodmaj_visual = 'action_upodmaj_visual'
 action_upodmaj_init = 'action_upodmaj_init'
 
-def upodmaj_update(data, args):
-    graph = data['graph']
+def upodmaj_inputs(state, args):
+    return [state == s for s in range(args['states'])]
+
+def upodmaj_kernel(compiled, state, args, sums=None):
+    if sums is None:
+        sums = compiled.neighbour_sums(upodmaj_inputs(state, args))
+    counts = np.stack(sums, axis=1)
+    # a node adopts the state of the strict majority of its neighbours
+    top = counts.max(axis=1)
+    unique = (counts == top[:, None]).sum(axis=1) == 1
+    return np.where(unique, counts.argmax(axis=1), state)
+
+def upodmaj_sweep(graph, args):
     upodmaj_key = model_upodmaj['key']
-    for _ in range(args['steps']):
-        update_dict = {}
-        for srcNode, adjacency in graph.adjacency():
-            counts = {state: 0 for state in range(args['states'])} 
-            for dstNode in adjacency.keys():
-                counts[graph.nodes[dstNode][upodmaj_key]] += 1
+    update_dict = {}
+    for srcNode, adjacency in graph.adjacency():
+        counts = {state: 0 for state in range(args['states'])} 
+        for dstNode in adjacency.keys():
+            counts[graph.nodes[dstNode][upodmaj_key]] += 1
 
-            max_key, max_val = max(counts.items(), key=operator.itemgetter(1))
-            del counts[max_key]
-            if max_val > max(counts.values()):
-                update_dict[srcNode] = max_key
+        max_key, max_val = max(counts.items(), key=operator.itemgetter(1))
+        del counts[max_key]
+        if max_val > max(counts.values()):
+            update_dict[srcNode] = max_key
 
-        for key, value in update_dict.items():
-            graph.nodes[key][upodmaj_key] = value 
+    for key, value in update_dict.items():
+        graph.nodes[key][upodmaj_key] = value 
 
-    return data
+def upodmaj_update(data, args):
+    if args.get('engine') == engine_csr:
+        return run_kernel(data, args, model_upodmaj['key'], upodmaj_kernel, converge=True)
+    return run_sweeps(data, args, model_upodmaj['key'], upodmaj_sweep, converge=True)
 
 def upodmaj_random(data, args):
     state = DiscreteState(list(range(args['states'])))
@@ -80,11 +95,7 @@ def upodmaj_build_callbacks(app):
     def tracer_callback(value):
         return [model_upodmaj['id'], value]
 
-    @app.callback(
-        dp.Output(id_upodmaj_threshold_id, 'children'),
-        dp.Input(id_upodmaj_slider_threshold, 'value'))
-    def slider_update(value):
-        return f'States: {value}'
+    build_label_callback(app, id_upodmaj_threshold_id, id_upodmaj_slider_threshold, 'States:')
 
     @app.callback(
         dp.Output(model_upodmaj['session-actions'], 'data'),
@@ -93,12 +104,13 @@ def upodmaj_build_callbacks(app):
         dp.Input(id_upodmaj_modal_generate, 'n_clicks'),
         dp.State(id_upodmaj_modal_init_slider, 'value'),
         dp.State(id_upodmaj_slider_threshold, 'value'),
-        dp.State(id_upodmaj_slider_steps, 'value'))
-    def callback(n1, n2, n3, init, states, steps):
+        dp.State(id_upodmaj_slider_steps, 'value'),
+        dp.State(id_upodmaj_dropdown_engine, 'value'))
+    def callback(n1, n2, n3, init, states, steps, engine):
         ctx = dash.callback_context
         if not ctx.triggered: return []
         source = ctx.triggered[0]['prop_id'].split('.')[0]
-        args = {'states': states, 'steps': steps, 'init': init}
+        args = {'states': states, 'steps': steps, 'init': init, 'engine': engine}
         ac = {
             id_upodmaj_button_random: action_upodmaj_random,
             id_upodmaj_button_step: action_upodmaj_step,
@@ -134,7 +146,8 @@ def upodmaj_build(model_id):
                         style={'width': '200px'}
                     ),
                     style=designs.col
-                )
+                ),
+                html.Div([build_engine_selector(id_upodmaj_dropdown_engine)], style=designs.col),
             ] + build_visual_selector(model_upodmaj, id=id_upodmaj_dropdown),
             style=designs.row,
             id={'type': model_upodmaj['id'], 'index': model_upodmaj['id']}
@@ -163,9 +176,12 @@ model_upodmaj = {
     'key': 'upodmaj',
     'actions': upodmaj_build_actions(),
     'callbacks': upodmaj_build_callbacks,
-    'update': tracer_upodmaj,
+    'update': upodmaj_update,
+    'kernel': upodmaj_kernel,
+    'kernel-inputs': ('adjacency', upodmaj_inputs),
     'session-actions': 'session-actions-upodmaj',
     'session-tracer': 'session-tracer-upodmaj',
+    'state-actions': [action_upodmaj_random, action_upodmaj_step, action_upodmaj_init],
     'visual_default': tracer_upodmaj['id'],
     'visuals': { model['id']: model for model in [
         visual_connections, tracer_upodmaj
@@ -13,6 +13,7 @@ from dash.exceptions import PreventUpdate
 from src.interaction import *
 from src.tracer import generate_trace
 from src.models import DiscreteState, init_value
+from src.engine import engine_csr, run_kernel, run_sweeps
 import src.designs as designs
 
 from src.visual import *
@@ -22,6 +23,7 @@ id_upoduna_button_random = 'upoduna-button-random'
 id_upoduna_button_step = 'upoduna-button-step'
 id_upoduna_button_stochastic = 'upoduna-button-stochastic'
 id_upoduna_dropdown = 'upoduna-dropdown'
+id_upoduna_dropdown_engine = 'upoduna-dropdown-engine'
 id_upoduna_slider_threshold = 'upoduna-slider-threshold'
 id_upoduna_threshold_id = 'upoduna-slider-threshold-val'
 id_upoduna_slider_steps = 'upoduna-slider-steps'
@@ -36,26 +38,38 @@ action_upoduna_step = 'action_upoduna_step'
 action_upoduna_visual = 'action_upoduna_visual'
 action_upoduna_init = 'action_upoduna_init'
 
-def upoduna_update(data, args):
-    graph = data['graph']
+def upoduna_inputs(state, args):
+    return [state == s for s in range(args['states'])]
+
+def upoduna_kernel(compiled, state, args, sums=None):
+    if sums is None:
+        sums = compiled.neighbour_sums(upoduna_inputs(state, args))
+    counts = np.stack(sums, axis=1)
+    # a node adopts a state only if all of its neighbours share it
+    unanimous = counts == compiled.degree[:, None]
+    return np.where(unanimous.any(axis=1), unanimous.argmax(axis=1), state)
+
+def upoduna_sweep(graph, args):
     upoduna_key = model_upoduna['key']
-    for _ in range(args['steps']):
-        update_dict = {}
-        for srcNode, adjacency in graph.adjacency():
-            counts = {state: 0 for state in range(args['states'])} 
-            total = len(adjacency)
-            for dstNode in adjacency.keys():
-                counts[graph.nodes[dstNode][upoduna_key]] += 1
-
-            for key, value in counts.items():
-                if value == total:
-                    update_dict[srcNode] = key
-                    break
-
-        for key, value in update_dict.items():
-            graph.nodes[key][upoduna_key] = value 
+    update_dict = {}
+    for srcNode, adjacency in graph.adjacency():
+        counts = {state: 0 for state in range(args['states'])} 
+        total = len(adjacency)
+        for dstNode in adjacency.keys():
+            counts[graph.nodes[dstNode][upoduna_key]] += 1
 
-    return data
+        for key, value in counts.items():
+            if value == total:
+                update_dict[srcNode] = key
+                break
+
+    for key, value in update_dict.items():
+        graph.nodes[key][upoduna_key] = value 
+
+def upoduna_update(data, args):
+    if args.get('engine') == engine_csr:
+        return run_kernel(data, args, model_upoduna['key'], upoduna_kernel, converge=True)
+    return run_sweeps(data, args, model_upoduna['key'], upoduna_sweep, converge=True)
 
 def upoduna_random(data, args):
     state = DiscreteState(list(range(args['states'])))
@@ -81,11 +95,7 @@ def upoduna_build_callbacks(app):
     def tracer_callback(value):
         return [model_upoduna['id'], value]
 
-    @app.callback(
-        dp.Output(id_upoduna_threshold_id, 'children'),
-        dp.Input(id_upoduna_slider_threshold, 'value'))
-    def slider_update(value):
-        return f'States: {value}'
+    build_label_callback(app, id_upoduna_threshold_id, id_upoduna_slider_threshold, 'States:')
 
     @app.callback(
         dp.Output(model_upoduna['session-actions'], 'data'),
@@ -94,12 +104,13 @@ def upoduna_build_callbacks(app):
         dp.Input(id_upoduna_modal_generate, 'n_clicks'),
         dp.State(id_upoduna_modal_init_slider, 'value'),
         dp.State(id_upoduna_slider_threshold, 'value'),
-        dp.State(id_upoduna_slider_steps, 'value'))
-    def callback(n1, n2, n3, init, states, steps):
+        dp.State(id_upoduna_slider_steps, 'value'),
+        dp.State(id_upoduna_dropdown_engine, 'value'))
+    def callback(n1, n2, n3, init, states, steps, engine):
         ctx = dash.callback_context
         if not ctx.triggered: return []
         source = ctx.triggered[0]['prop_id'].split('.')[0]
-        args = {'states': states, 'steps': steps, 'init': init}
+        args = {'states': states, 'steps': steps, 'init': init, 'engine': engine}
         ac = {
             id_upoduna_button_random: action_upoduna_random,
             id_upoduna_button_step: action_upoduna_step,
@@ -135,7 +146,8 @@ def upoduna_build(model_id):
                         style={'width': '200px'}
                     ),
                     style=designs.col
-                )
+                ),
+                html.Div([build_engine_selector(id_upoduna_dropdown_engine)], style=designs.col),
             ] + build_visual_selector(model_upoduna, id=id_upoduna_dropdown),
             style=designs.row,
             id={'type': model_upoduna['id'], 'index': model_upoduna['id']}
@@ -164,9 +176,12 @@ model_upoduna = {
     'key': 'upoduna',
     'actions': upoduna_build_actions(),
     'callbacks': upoduna_build_callbacks,
-    'update': tracer_upoduna,
+    'update': upoduna_update,
+    'kernel': upoduna_kernel,
+    'kernel-inputs': ('adjacency', upoduna_inputs),
     'session-actions': 'session-actions-upoduna',
     'session-tracer': 'session-tracer-upoduna',
+    'state-actions': [action_upoduna_random, action_upoduna_step, action_upoduna_init],
     'visual_default': tracer_upoduna['id'],
     'visuals': { model['id']: model for model in [
         visual_connections, tracer_upoduna
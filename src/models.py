@@ -3,10 +3,15 @@
 """ Models """
 
 import random
+import hashlib
 
+import numpy as np
 import networkx as nx
 
 from src.interaction import *
+from src.store import LayoutCache
+from src.engine import CompiledGraph, digest
+from src.state import as_state_graph, node_slots
 
 __author__ = "Created by Konstantin Rolf | University of Groningen"
 __copyright__ = "Copyright 2021, Konstantin Rolf"
@@ -33,18 +38,58 @@ class ContinuesState:
         return random.random() * (self.end - self.start) + self.start
 
 def stochastic_callback(data, args):
-    if isinstance(data['graph'], nx.Graph):
+    if not data['graph'].is_directed():
         # undirected graph: convert
-        data['graph'] = nx.DiGraph(data['graph'])
+        data['graph'] = data['graph'].to_directed()
     nx.stochastic_graph(data['graph'], copy=False, weight='weight')
+    # the weights changed, the copied graph attributes still hold the old fingerprint
+    data['graph'].graph.pop('fingerprint', None)
     return data
 
+layout_cache = LayoutCache()
+
+def topologyFingerprint(graph):
+    """ Returns a hash of the graph direction and its compiled weighted adjacency.
+    The layouts store the positions in node order, so two graphs that only
+    differ in their node names can share them.
+
+    The hash is kept in graph.graph['fingerprint'] together with the
+    direction and size of the graph. Edits drop it (see markEdited) and a
+    changed size catches the changes that do not go through markEdited. """
+    size = ('directed' if graph.is_directed() else 'undirected',
+        graph.number_of_nodes(), graph.number_of_edges())
+    cached = graph.graph.get('fingerprint')
+    if cached is not None and cached[0] == size:
+        return cached[1]
+    compiled = CompiledGraph(graph)
+    fingerprint = hashlib.blake2b(size[0].encode() + b''.join(digest(array)
+        for array in (compiled.indptr, compiled.indices, compiled.weights.data)),
+        digest_size=16).hexdigest()
+    graph.graph['fingerprint'] = (size, fingerprint)
+    return fingerprint
+
 def updateLayout(graph, layoutAlgorithm, layouts):
     """ Updates the layout of the graph """
     if layoutAlgorithm in layouts:
-        graphLayout = layouts[layoutAlgorithm]['gen'](graph)
-        for node, pos in graphLayout.items():
-            graph.nodes[node]['layout'] = pos
+        layout, key, positions = layouts[layoutAlgorithm], None, None
+        if layout.get('cache', True):
+            key = (topologyFingerprint(graph), layoutAlgorithm)
+            positions = layout_cache.get(key)
+        if positions is None:
+            graphLayout = layout['gen'](graph)
+            positions = np.array([graphLayout[node] for node in graph.nodes()],
+                dtype=float).reshape(-1, 2)
+            if key is not None:
+                layout_cache.put(key, positions)
+        if not layout.get('incremental', False):
+            # all nodes were placed, the edits are already laid out
+            graph.graph.pop('edited', None)
+        state, slots = node_slots(graph, list(graph.nodes()))
+        if state is not None:
+            state.scatter('layout', slots, positions)
+        else:
+            for node, pos in zip(graph.nodes(), positions):
+                graph.nodes[node]['layout'] = pos
     else:
         print('UNKNOWN LAYOUT ALGORITHM')
 
@@ -55,31 +100,86 @@ def init_value(data, args, key):
     return data
 
 
-def addMinRequirements(graph):
-    """ Adds the minimum requirements to the graph """
-    def update(node, key, value, range):
-        if key not in node[1]:
-            node[1][key] = value
-
-    graphLayout = None
-    for node in graph.nodes(data=True):
-        if 'pos' not in node[1]:
-            if graphLayout is None:
-                graphLayout = nx.spring_layout(graph)
-            data = graphLayout[node[0]]
-            node[1]['pos'] = (data[0], data[1])
-
-        update(node, 'thu', 0, (0, 1))
-        update(node, 'thu_th', 0.5, (0, 1))
-        update(node, 'thw', 0, (0, 1))
-        update(node, 'thw_th', 0.5, (0, 1))
-
-        update(node, 'tha', 0, (0, 1))
-        update(node, 'deg', 0, (0, 1))
-        update(node, 'sis', 0, (0, None))
-        update(node, 'sir', 0, (-1, None))
-        update(node, 'upodmaj', 0, (None, None))
-        update(node, 'upoduna', 0, (None, None))
+def markEdited(graph, nodes):
+    """ Remembers the nodes whose neighbourhood was changed by an edit """
+    graph.graph.setdefault('edited', set()).update(nodes)
+    graph.graph.pop('fingerprint', None)
+
+def guessPosition(graph, node, positions):
+    """ Places a node next to the center of its positioned neighbours """
+    known = [positions[nb] for nb in nx.all_neighbors(graph, node) if nb in positions]
+    if not known:
+        known = list(positions.values())
+    center = np.mean(known, axis=0) if known else np.zeros(2)
+    return center + np.random.uniform(-0.05, 0.05, 2)
+
+def localSpringLayout(graph, positions, region, iterations=50):
+    """ Runs the spring layout only on the region around edited nodes.
+
+    The nodes in region start at their known (or guessed) positions and
+    are moved while their direct neighbours stay fixed. Returns the new
+    positions of the nodes in region.
+    """
+    region = set(region)
+    anchors = {nb for node in region for nb in nx.all_neighbors(graph, node)
+        if nb in positions} - region
+    initial = {node: positions[node] for node in anchors}
+    for node in region:
+        initial[node] = positions[node] if node in positions else guessPosition(graph, node, positions)
+    if not anchors:
+        # without fixed nodes the spring layout would rescale the region
+        return {node: initial[node] for node in region}
+
+    subLayout = nx.spring_layout(graph.subgraph(region | anchors), pos=initial,
+        fixed=anchors, iterations=iterations, k=1.0 / np.sqrt(len(graph)))
+    return {node: subLayout[node] for node in region}
+
+def incrementalSpringLayout(graph):
+    """ Spring layout that only relaxes the nodes that were edited since the last call """
+    positions = {node: data['layout'] for node, data in graph.nodes(data=True)
+        if 'layout' in data}
+    edited = graph.graph.pop('edited', set())
+    if not positions:
+        return nx.spring_layout(graph)
+
+    region = {node for node in edited if node in graph}
+    region.update(node for node in graph.nodes() if node not in positions)
+    if region:
+        positions.update(localSpringLayout(graph, positions, region))
+    return positions
+
+# number of nodes above which new graphs start with a random layout
+springLayoutLimit = 5000
+
+# default value of every model state
+state_defaults = {
+    'thu': 0, 'thu_th': 0.5, 'thw': 0, 'thw_th': 0.5, 'tha': 0, 'deg': 0,
+    'sis': 0, 'sis_risk': 0, 'sir': 0, 'sir_risk': 0, 'upodmaj': 0, 'upoduna': 0,
+}
+
+def addMinRequirements(graph, layout=True):
+    """ Adds the minimum requirements to the graph. The node positions are
+    only needed for drawing and can be skipped for headless runs. The
+    returned graph stores the model states in columns (see state.py). """
+    graph = as_state_graph(graph)
+    missing = [node for node, data in graph.nodes(data=True)
+        if layout and 'pos' not in data]
+    if missing:
+        positions = {node: data['pos'] for node, data in graph.nodes(data=True)
+            if 'pos' in data}
+        if positions:
+            graphLayout = localSpringLayout(graph, positions, missing)
+        elif len(graph) > springLayoutLimit:
+            # the spring layout is far too slow for imported graphs
+            graphLayout = nx.random_layout(graph)
+        else:
+            graphLayout = nx.spring_layout(graph)
+        for node in missing:
+            data = graphLayout[node]
+            graph.nodes[node]['pos'] = (data[0], data[1])
+
+    for key, value in state_defaults.items():
+        graph.state.fill(key, value)
 
     for edge in graph.edges(data=True):
         if 'weight' not in edge[2]:
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+""" Trajectory recorder and playback frames """
+
+import numpy as np
+import plotly.graph_objects as go
+
+from src.state import state_columns, column_bounds
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+# memory limits of a recording, see graph.py for the command line options
+recorder_options = {
+    # bytes of state vectors that are kept per recording
+    'frame_budget': 32 * 1024 ** 2,
+    # number of frames that are kept per recording
+    'max_frames': 200,
+    # milliseconds every frame is shown during playback
+    'frame_duration': 200,
+}
+
+def recording_dtype(key, low=0, high=0):
+    """ Continuous states are recorded as float32 and discrete states in the
+    smallest integer type, at least int8, that holds the values low..high """
+    if np.dtype(state_columns.get(key, np.float64)).kind == 'f':
+        return np.float32
+    for dtype in (np.int8, np.int16, np.int32):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+class TrajectoryRecorder:
+    """ Keeps the last state vectors of a run in a ring buffer.
+
+    The number of frames is bounded by max_frames and by the frame budget
+    in bytes, whichever is smaller. Once the buffer is full every new
+    frame replaces the oldest one. Discrete states start as int8, a frame
+    that does not fit moves the buffer to a wider type.
+    """
+    def __init__(self, key, size, budget=None, max_frames=None):
+        self.budget = recorder_options['frame_budget'] if budget is None else budget
+        self.max_frames = recorder_options['max_frames'] if max_frames is None else max_frames
+        self.key = key
+        self.size = size
+        self._allocate(np.dtype(recording_dtype(key)))
+        self.count = 0
+        self.step = 0
+
+    def _allocate(self, dtype):
+        self.capacity = max(1, min(self.max_frames, self.budget // max(self.size * dtype.itemsize, 1)))
+        self.states = np.zeros((self.capacity, self.size), dtype=dtype)
+        self.steps = np.zeros(self.capacity, dtype=np.int64)
+
+    def _widen(self, low, high):
+        """ Moves the frames to a type that also holds low..high. The frame
+        budget stays the same, so the oldest frames may be dropped. """
+        steps, states = self.frames()
+        if len(states):
+            low, high = min(low, int(states.min())), max(high, int(states.max()))
+        self._allocate(np.dtype(recording_dtype(self.key, low, high)))
+        keep = min(len(states), self.capacity)
+        self.states[:keep] = states[len(states) - keep:]
+        self.steps[:keep] = steps[len(steps) - keep:]
+        self.count = keep
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def nbytes(self):
+        return self.states.nbytes + self.steps.nbytes
+
+    def record(self, state):
+        """ Stores the state vector of the next step """
+        state = np.asarray(state)
+        bounds = column_bounds(self.states)
+        if bounds is not None and len(state) > 0:
+            low, high = int(state.min()), int(state.max())
+            if low < bounds[0] or high > bounds[1]:
+                self._widen(low, high)
+        row = self.count % self.capacity
+        self.states[row] = state
+        self.steps[row] = self.step
+        self.count += 1
+        self.step += 1
+
+    def frames(self):
+        """ Returns the recorded steps and states from the oldest to the newest """
+        order = np.arange(self.count - len(self), self.count) % self.capacity
+        return self.steps[order], self.states[order]
+
+def add_playback(figure, recorder, trace=1):
+    """ Adds the recorded frames to a figure together with play controls.
+
+    The frames only contain the marker colors of the node trace, so the
+    browser plays the run without asking the server for new figures.
+    Returns False if there is nothing to play.
+    """
+    if len(recorder) < 2 or len(figure.data) <= trace or len(figure.data[trace].x) != recorder.size:
+        return False
+    steps, states = recorder.frames()
+    # a fixed color range keeps the colors comparable between frames
+    figure.data[trace].marker.cmin = float(states.min())
+    figure.data[trace].marker.cmax = float(states.max())
+    figure.data[trace].marker.color = states[-1].tolist()
+
+    # WebGL traces are only updated by a full redraw
+    redraw = isinstance(figure.data[trace], go.Scattergl)
+    duration = recorder_options['frame_duration']
+    Trace = type(figure.data[trace])
+    figure.frames = [go.Frame(name=str(step), traces=[trace],
+        data=[Trace(marker={'color': state.tolist()})])
+        for step, state in zip(steps.tolist(), states)]
+    play = {'frame': {'duration': duration, 'redraw': redraw},
+        'transition': {'duration': 0}, 'fromcurrent': True}
+    pause = {'frame': {'duration': 0, 'redraw': redraw},
+        'transition': {'duration': 0}, 'mode': 'immediate'}
+    figure.update_layout(
+        updatemenus=[{
+            'type': 'buttons', 'showactive': False,
+            'x': 0.0, 'y': 0.0, 'xanchor': 'left', 'yanchor': 'top',
+            'buttons': [
+                {'label': 'Play', 'method': 'animate', 'args': [None, play]},
+                {'label': 'Pause', 'method': 'animate', 'args': [[None], pause]},
+            ],
+        }],
+        sliders=[{
+            'x': 0.1, 'y': 0.0, 'len': 0.9, 'yanchor': 'top',
+            'currentvalue': {'prefix': 'Step '},
+            'active': len(steps) - 1,
+            'steps': [{'label': str(step), 'method': 'animate',
+                'args': [[str(step)], pause]} for step in steps.tolist()],
+        }],
+    )
+    return True
+
+if __name__ == '__main__':
+    print('recorder.py')
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+""" Compact binary graph format """
+
+import io
+import gc
+import json
+import struct
+import functools
+
+import numpy as np
+
+from src.state import StateGraph, StateDiGraph, NodeAttributes, node_slots, state_columns
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+# File layout: magic, format version, header length, JSON header and the raw
+# arrays. Every array starts at a multiple of the alignment so that it can be
+# used in place when the file is memory mapped.
+magic = b'ODTG'
+format_version = 1
+alignment = 64
+extension = '.odtg'
+prefix = struct.Struct('<4sIQ')
+
+# node attributes that are stored as state columns
+state_keys = tuple(state_columns)
+
+def pack_column(values):
+    """ Converts a state column to the smallest integer type or float64 """
+    column = np.asarray(values)
+    if column.dtype.kind in 'biu':
+        if len(column) == 0:
+            return column.astype(np.int8)
+        low, high = int(column.min()), int(column.max())
+        if low >= 0:
+            return column.astype(np.min_scalar_type(high))
+        return column.astype(np.result_type(np.min_scalar_type(low), np.min_scalar_type(-high - 1)))
+    return column.astype(np.float64)
+
+def graph_to_arrays(graph):
+    """ Converts a graph to its header and arrays """
+    nodes = list(graph.nodes())
+    index = {node: idx for idx, node in enumerate(nodes)}
+    size = len(nodes)
+    header = {'directed': graph.is_directed(), 'nodes': size}
+    arrays = {}
+
+    if all(isinstance(node, (int, np.integer)) and not isinstance(node, bool) for node in nodes):
+        header['node_type'] = 'int'
+        arrays['names'] = np.array(nodes, dtype=np.int64)
+    else:
+        header['node_type'] = 'str'
+        encoded = [str(node).encode('utf-8') for node in nodes]
+        arrays['name_offsets'] = np.cumsum([0] + [len(name) for name in encoded], dtype=np.int64)
+        arrays['names'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    # edges are stored once in compressed sparse row order of their source
+    edges = list(graph.edges(data='weight', default=1))
+    src = np.fromiter((index[edge[0]] for edge in edges), dtype=np.int64, count=len(edges))
+    dst = np.fromiter((index[edge[1]] for edge in edges), dtype=np.int64, count=len(edges))
+    weights = np.fromiter((edge[2] for edge in edges), dtype=np.float32, count=len(edges))
+    order = np.argsort(src, kind='stable')
+    arrays['indptr'] = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=size)))).astype(np.int64)
+    arrays['indices'] = dst[order].astype(np.int32 if size < 2 ** 31 else np.int64)
+    arrays['weights'] = weights[order]
+    header['edges'] = len(edges)
+
+    # missing positions are stored as NaN
+    positions = np.full((size, 2), np.nan, dtype=np.float32)
+    state, slots = node_slots(graph, nodes)
+    if state is not None:
+        for key in state_keys:
+            if state.has_all(key, slots):
+                arrays[f'state_{key}'] = pack_column(state.gather(key, slots))
+        present = state.present['pos'][slots]
+        positions[present] = state.gather('pos', slots[present])
+    else:
+        data = [attributes for _, attributes in graph.nodes(data=True)]
+        for key in state_keys:
+            if size > 0 and all(key in attributes for attributes in data):
+                arrays[f'state_{key}'] = pack_column([attributes[key] for attributes in data])
+        # positions may be tuples or numpy arrays
+        for idx, attributes in enumerate(data):
+            if 'pos' in attributes:
+                positions[idx] = np.asarray(attributes['pos'], dtype=np.float32)[:2]
+    arrays['positions'] = positions
+    return header, arrays
+
+def write_arrays(file, header, arrays):
+    offset, entries = 0, {}
+    for name, array in arrays.items():
+        offset = -(-offset // alignment) * alignment
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+    encoded = json.dumps(dict(header, arrays=entries)).encode('utf-8')
+    start = -(-(prefix.size + len(encoded)) // alignment) * alignment
+    encoded += b' ' * (start - prefix.size - len(encoded))
+
+    file.write(prefix.pack(magic, format_version, len(encoded)))
+    file.write(encoded)
+    position = 0
+    for name, array in arrays.items():
+        file.write(b'\0' * (entries[name]['offset'] - position))
+        file.write(np.ascontiguousarray(array).tobytes())
+        position = entries[name]['offset'] + array.nbytes
+
+def read_arrays(buffer):
+    """ Reads the header and arrays from a buffer without copying them """
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    if len(raw) < prefix.size:
+        raise ValueError('File is too short for a graph file')
+    tag, version, length = prefix.unpack(raw[:prefix.size].tobytes())
+    if tag != magic:
+        raise ValueError('File is not a graph file')
+    if version != format_version:
+        raise ValueError(f'Unsupported graph file version {version}')
+    header = json.loads(raw[prefix.size:prefix.size + length].tobytes())
+    start = prefix.size + length
+
+    arrays = {}
+    for name, entry in header.pop('arrays').items():
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        offset = start + entry['offset']
+        arrays[name] = raw[offset:offset + count * dtype.itemsize].view(dtype).reshape(entry['shape'])
+    return header, arrays
+
+def node_names(header, arrays):
+    if header['node_type'] == 'int':
+        return arrays['names'].tolist()
+    names, offsets = arrays['names'].tobytes(), arrays['name_offsets'].tolist()
+    return [names[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+def adjacency_dicts(names, rows, cols, data, size):
+    """ Builds the adjacency dict of every node from the edges (rows, cols) """
+    order = np.argsort(rows, kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=size)))).tolist()
+    neighbours = names[cols[order]].tolist()
+    values = data[order].tolist()
+    return [dict(zip(neighbours[start:end], values[start:end]))
+        for start, end in zip(bounds[:-1], bounds[1:])]
+
+def check_edges(arrays, size):
+    """ Raises ValueError if the edge arrays do not fit together. The
+    adjacency dicts are built later, so broken files are rejected here. """
+    indptr, indices = arrays['indptr'], arrays['indices']
+    if len(indptr) != size + 1 or indptr[0] != 0 or indptr[-1] != len(indices) \
+            or len(arrays['weights']) != len(indices) or np.any(np.diff(indptr) < 0):
+        raise ValueError('The edge arrays of the graph file do not match')
+    if len(indices) and (indices.min() < 0 or indices.max() >= size):
+        raise ValueError('The graph file has edges to unknown nodes')
+
+def arrays_to_graph(header, arrays):
+    """ Builds the networkx graph from the header and arrays.
+
+    Only the node states are copied right away. The node and adjacency
+    dicts are built from the arrays on their first access (see
+    StateGraphMixin.defer), so loading a graph only costs a pass over the
+    state columns and callers that do not walk the graph never pay for
+    the dicts.
+    """
+    names = node_names(header, arrays)
+    size = len(names)
+    check_edges(arrays, size)
+    graph = StateDiGraph() if header['directed'] else StateGraph()
+
+    # the node states are copied column by column into the node state
+    slots = graph.state.allocate_block(size)
+    for name in arrays:
+        if name.startswith('state_') and name[len('state_'):] in state_columns:
+            graph.state.scatter(name[len('state_'):], slots, arrays[name])
+    positions = arrays['positions']
+    valid = ~np.isnan(positions).any(axis=1)
+    graph.state.scatter('pos', slots[valid], positions[valid])
+    graph.defer(functools.partial(build_dicts, header, arrays, names, slots))
+    return graph
+
+def build_dicts(header, arrays, names, slots, graph):
+    """ Sets the node and adjacency dicts of a deferred graph.
+
+    add_edges_from validates and inserts every edge one by one, which
+    dominates the loading time of large graphs. The adjacency dicts are
+    therefore built per node from the sorted edge arrays and assigned to
+    the graph directly; both directions of an edge share its data dict
+    just like they do in networkx.
+    """
+    # the millions of new dicts would trigger many useless collections
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        size = len(names)
+        graph._node = dict(zip(names, [NodeAttributes(graph.state, slot) for slot in slots.tolist()]))
+
+        name_array = np.empty(size, dtype=object)
+        name_array[:] = names
+        data = np.empty(len(arrays['weights']), dtype=object)
+        data[:] = [{'weight': weight} for weight in arrays['weights'].astype(np.float64).tolist()]
+        src = np.repeat(np.arange(size), np.diff(arrays['indptr']))
+        dst = np.asarray(arrays['indices'], dtype=np.int64)
+
+        if header['directed']:
+            graph._succ = graph._adj = dict(zip(names, adjacency_dicts(name_array, src, dst, data, size)))
+            graph._pred = dict(zip(names, adjacency_dicts(name_array, dst, src, data, size)))
+        else:
+            # every undirected edge is stored once and inserted in both directions
+            loops = src != dst
+            rows = np.concatenate((src, dst[loops]))
+            cols = np.concatenate((dst, src[loops]))
+            graph._adj = dict(zip(names, adjacency_dicts(
+                name_array, rows, cols, np.concatenate((data, data[loops])), size)))
+    finally:
+        if enabled:
+            gc.enable()
+
+def dumps(graph):
+    """ Returns the graph in the binary format """
+    file = io.BytesIO()
+    write_arrays(file, *graph_to_arrays(graph))
+    return file.getvalue()
+
+def loads(buffer):
+    """ Reads a graph from a bytes like object """
+    return arrays_to_graph(*read_arrays(buffer))
+
+def save_graph(graph, path):
+    with open(path, 'wb') as file:
+        write_arrays(file, *graph_to_arrays(graph))
+
+def load_graph(path, mmap=True):
+    """ Reads a graph file, the arrays are memory mapped if mmap is set """
+    if mmap:
+        return loads(np.memmap(path, dtype=np.uint8, mode='r'))
+    with open(path, 'rb') as file:
+        return loads(file.read())
+
+if __name__ == '__main__':
+    print('serialization.py')
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+""" Headless batch simulation """
+
+import os
+import ast
+import json
+import random
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+from src import serialization
+from src import importer
+from src.models import addMinRequirements
+from src.state import node_values
+from src.engine import engine_default
+from src.info import dropdown_model, graph_gens
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+# the defaults of the sliders in the model panels
+default_args = {
+    'threshold': 0.5,
+    'states': 2,
+    'prob': 0.05,
+    'itime': 20,
+    'init': 0,
+    'realizations': 100,
+    'seed': None,
+    'engine': engine_default,
+    'selected': None,
+}
+
+def parse_value(value):
+    """ Parses a command line value as Python literal, falls back to a string """
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+def parse_model_args(values):
+    """ Parses a list of key=value strings into a model argument dict """
+    args = dict(default_args)
+    for value in values or []:
+        key, sep, raw = value.partition('=')
+        if not sep:
+            raise ValueError(f'Model arguments must be given as key=value: {value}')
+        args[key.strip()] = parse_value(raw.strip())
+    return args
+
+def load_graph(path, directed=False):
+    """ Loads a graph from a binary, GraphML, GML, node link JSON, CSV, MatrixMarket or edge list file """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == serialization.extension:
+        return serialization.load_graph(path)
+    if ext == '.graphml':
+        return nx.read_graphml(path)
+    if ext == '.gml':
+        return nx.read_gml(path)
+    if ext == '.json':
+        with open(path) as f:
+            return nx.node_link_graph(json.load(f))
+    if ext in ('.csv', '.mtx'):
+        with open(path, 'rb') as f:
+            return importer.import_file(f, path, directed)
+    return nx.read_edgelist(path, create_using=nx.DiGraph if directed else nx.Graph)
+
+def generate_graph(name, values):
+    """ Generates a graph with one of the registered graph generators """
+    graph_gen = graph_gens.get(name)
+    if graph_gen is None:
+        raise ValueError(f'Unknown graph generator {name}, use one of: {list(graph_gens)}')
+    inputs = list(graph_gen['argvals'])
+    for idx, value in enumerate(values or []):
+        inputs[idx] = graph_gen['argtypes'][idx](parse_value(value))
+    return graph_gen['gen'](*inputs)
+
+def simulate(graph, model, args, steps, actions=()):
+    """ Runs the registered actions and then the model update step by step.
+
+    Returns the node list, the (steps + 1) x N state trajectory and the
+    data dictionary after the last step.
+    """
+    data = {'graph': graph}
+    for action in actions:
+        function = model['actions'].get(action)
+        if function is None:
+            raise ValueError(f'Unknown action {action}, use one of: {list(model["actions"])}')
+        data = function(data, dict(args))
+
+    key = model['key']
+    nodes = list(data['graph'].nodes())
+    trajectory = [node_values(data['graph'], nodes, key)]
+    for _ in range(steps):
+        data = model['update'](data, dict(args, steps=1))
+        trajectory.append(node_values(data['graph'], nodes, key))
+    return nodes, np.array(trajectory), data
+
+def write_trajectory(path, nodes, states):
+    """ Writes the trajectory as compressed .npz or as .csv with one column per node """
+    if os.path.splitext(path)[1].lower() == '.csv':
+        frame = pd.DataFrame(states, columns=[str(node) for node in nodes])
+        frame.index.name = 'step'
+        frame.to_csv(path)
+    else:
+        np.savez_compressed(path, nodes=np.array([str(node) for node in nodes]), states=states)
+
+def build_parser(parser):
+    parser.add_argument('--model', type=str, required=True, choices=list(dropdown_model),
+        help='Model that is simulated')
+    parser.add_argument('--graph', type=str,
+        help='Binary (.odtg), GraphML, GML, node link JSON, CSV, MatrixMarket or edge list file')
+    parser.add_argument('--directed', action='store_true',
+        help='Reads edge lists, CSV and MatrixMarket files as directed graphs')
+    parser.add_argument('--generator', type=str, default='random_geometric',
+        help='Graph generator that is used without --graph (default: random_geometric)')
+    parser.add_argument('--generator-args', type=str, nargs='*', default=[],
+        help='Arguments of the graph generator')
+    parser.add_argument('--arg', type=str, action='append', default=[],
+        help='Model argument as key=value, e.g. prob=0.1 (repeatable)')
+    parser.add_argument('--action', type=str, action='append', default=[],
+        help='Model action that is run before the simulation, e.g. action_sis_random (repeatable)')
+    parser.add_argument('--steps', type=int, default=100,
+        help='Number of simulated steps (default: 100)')
+    parser.add_argument('--seed', type=int, default=None,
+        help='Seed of the random number generators')
+    parser.add_argument('--output', type=str, default='trajectory.npz',
+        help='Output file, .npz or .csv (default: trajectory.npz)')
+    return parser
+
+def run(options):
+    if options['seed'] is not None:
+        random.seed(options['seed'])
+        np.random.seed(options['seed'])
+
+    if options['graph'] is not None:
+        graph = load_graph(options['graph'], options['directed'])
+    else:
+        graph = generate_graph(options['generator'], options['generator_args'])
+    graph = addMinRequirements(graph, layout=False)
+
+    model = dropdown_model[options['model']]
+    args = parse_model_args(options['arg'])
+    print(f'Simulating {model["name"]} on {len(graph)} nodes and'
+        f' {graph.number_of_edges()} edges for {options["steps"]} steps')
+    nodes, states, data = simulate(graph, model, args, options['steps'], options['action'])
+    write_trajectory(options['output'], nodes, states)
+    print(f'Wrote trajectory to {options["output"]}')
+    return data
+
+if __name__ == '__main__':
+    print('simulate.py')
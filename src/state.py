@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+
+""" Columnar node state storage """
+
+import copy
+import threading
+from collections.abc import MutableMapping
+
+import numpy as np
+import networkx as nx
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+# node attributes that are stored in typed columns instead of the node dicts
+state_columns = {
+    'thu': np.int32,
+    'thu_th': np.float64,
+    'thw': np.int32,
+    'thw_th': np.float64,
+    'tha': np.int32,
+    'deg': np.float64,
+    'sis': np.int32,
+    'sis_risk': np.float64,
+    'sir': np.int32,
+    'sir_risk': np.float64,
+    'upodmaj': np.int32,
+    'upoduna': np.int32,
+}
+# two dimensional attributes, pos is read as tuple and layout as array
+vector_columns = {'pos': tuple, 'layout': np.array}
+
+def column_bounds(column):
+    """ Returns the value range of an integer column, None for other columns """
+    if column.dtype.kind != 'i':
+        return None
+    info = np.iinfo(column.dtype)
+    return int(info.min), int(info.max)
+
+class NodeState:
+    """ Stores the model state of all nodes in one typed array per key.
+
+    Every node owns a slot, its row in all columns. Slots stay stable
+    while the node exists and are reused after it is removed. A present
+    mask per key keeps track of the attributes that were set, so missing
+    keys behave like missing dict entries.
+    """
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self.end = 0
+        self.free = []
+        self.live = np.zeros(capacity, dtype=bool)
+        self.columns, self.present, self.bounds = {}, {}, {}
+        for key, dtype in state_columns.items():
+            self.columns[key] = np.zeros(capacity, dtype=dtype)
+            self.present[key] = np.zeros(capacity, dtype=bool)
+            self.bounds[key] = column_bounds(self.columns[key])
+        for key in vector_columns:
+            self.columns[key] = np.zeros((capacity, 2), dtype=np.float64)
+            self.present[key] = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return int(self.live.sum())
+
+    @property
+    def nbytes(self):
+        return self.live.nbytes + sum(column.nbytes + self.present[key].nbytes
+            for key, column in self.columns.items())
+
+    def _grow(self, size):
+        capacity = self.capacity
+        while capacity < size:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        def resize(array):
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.capacity] = array
+            return grown
+        self.live = resize(self.live)
+        self.columns = {key: resize(column) for key, column in self.columns.items()}
+        self.present = {key: resize(mask) for key, mask in self.present.items()}
+        self.capacity = capacity
+
+    def allocate(self):
+        """ Returns a free slot """
+        if self.free:
+            slot = self.free.pop()
+        else:
+            self._grow(self.end + 1)
+            slot, self.end = self.end, self.end + 1
+        self.live[slot] = True
+        return slot
+
+    def allocate_block(self, size):
+        """ Returns size new consecutive slots """
+        self._grow(self.end + size)
+        slots = np.arange(self.end, self.end + size)
+        self.live[self.end:self.end + size] = True
+        self.end += size
+        return slots
+
+    def release(self, slot):
+        self.live[slot] = False
+        for mask in self.present.values():
+            mask[slot] = False
+        self.free.append(slot)
+
+    def attributes(self):
+        """ Node attribute dict factory that allocates a new slot """
+        return NodeAttributes(self, self.allocate())
+
+    def _fit(self, key, values):
+        """ Widens an integer column if the values do not fit into it """
+        column = self.columns[key]
+        if column.dtype.kind == 'f':
+            return
+        values = np.asarray(values)
+        if values.dtype.kind == 'f' or values.dtype.kind == 'O':
+            self.columns[key] = column.astype(np.float64)
+        elif values.size > 0 and not (np.iinfo(column.dtype).min <= values.min()
+                and values.max() <= np.iinfo(column.dtype).max):
+            self.columns[key] = column.astype(np.int64)
+        self.bounds[key] = column_bounds(self.columns[key])
+
+    def get(self, slot, key):
+        if not self.present[key].item(slot):
+            raise KeyError(key)
+        if key in vector_columns:
+            return vector_columns[key](self.columns[key][slot])
+        return self.columns[key].item(slot)
+
+    def set(self, slot, key, value):
+        # single values are set for every node in the dict based updates
+        bounds = self.bounds.get(key)
+        if bounds is not None and not (isinstance(value, (int, np.integer))
+                and bounds[0] <= value <= bounds[1]):
+            self._fit(key, value)
+        self.columns[key][slot] = value
+        self.present[key][slot] = True
+
+    def has_all(self, key, slots):
+        return bool(self.present[key][slots].all())
+
+    def gather(self, key, slots, dtype=None):
+        """ Returns the values of key for the slots as array """
+        values = self.columns[key][slots]
+        return values if dtype is None else values.astype(dtype)
+
+    def scatter(self, key, slots, values):
+        """ Writes the values of key for the slots """
+        if key not in vector_columns:
+            self._fit(key, values)
+        self.columns[key][slots] = values
+        self.present[key][slots] = True
+
+    def fill(self, key, value):
+        """ Sets key to value for all nodes that do not have it """
+        missing = self.live & ~self.present[key]
+        if missing.any():
+            self.scatter(key, np.flatnonzero(missing), value)
+
+class NodeAttributes(MutableMapping):
+    """ Node attribute dict whose state keys live in a NodeState.
+
+    Keys that are not state columns are kept in a small dict that is only
+    created when such a key is set.
+    """
+    __slots__ = ('state', 'slot', 'extra')
+
+    def __init__(self, state, slot):
+        self.state = state
+        self.slot = slot
+        self.extra = None
+
+    def __getitem__(self, key):
+        present = self.state.present.get(key)
+        if present is not None:
+            if not present.item(self.slot):
+                raise KeyError(key)
+            if key in vector_columns:
+                return vector_columns[key](self.state.columns[key][self.slot])
+            return self.state.columns[key].item(self.slot)
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.state.columns:
+            self.state.set(self.slot, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.state.columns:
+            if not self.state.present[key][self.slot]:
+                raise KeyError(key)
+            self.state.present[key][self.slot] = False
+        elif self.extra is None:
+            raise KeyError(key)
+        else:
+            del self.extra[key]
+
+    def __contains__(self, key):
+        present = self.state.present.get(key)
+        if present is not None:
+            return present.item(self.slot)
+        return self.extra is not None and key in self.extra
+
+    def __iter__(self):
+        for key, mask in self.state.present.items():
+            if mask[self.slot]:
+                yield key
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def copy(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        # copying the attributes must not copy the shared state columns
+        return copy.deepcopy(dict(self), memo)
+
+class StateGraphMixin:
+    """ Makes a networkx graph store its node attributes in a NodeState """
+    def __init__(self, incoming_graph_data=None, **attr):
+        self.state = NodeState()
+        self.node_attr_dict_factory = self.state.attributes
+        super().__init__(incoming_graph_data, **attr)
+
+    def to_directed_class(self):
+        return StateDiGraph
+
+    def to_undirected_class(self):
+        return StateGraph
+
+    def remove_node(self, n):
+        attributes = self._node.get(n)
+        super().remove_node(n)
+        self.state.release(attributes.slot)
+
+    def remove_nodes_from(self, nodes):
+        nodes = list(nodes)
+        slots = [self._node[n].slot for n in nodes if n in self._node]
+        super().remove_nodes_from(nodes)
+        for slot in slots:
+            self.state.release(slot)
+
+    def clear(self):
+        super().clear()
+        self.state = NodeState()
+        self.node_attr_dict_factory = self.state.attributes
+
+    def defer(self, build):
+        """ Drops the node and adjacency dicts, build(graph) sets them on
+        their first access. The node state is kept. """
+        for name in ('_node', '_adj', '_succ', '_pred'):
+            self.__dict__.pop(name, None)
+        self.deferred = build
+        self.__class__ = deferred_classes[type(self)]
+
+class StateGraph(StateGraphMixin, nx.Graph):
+    pass
+
+class StateDiGraph(StateGraphMixin, nx.DiGraph):
+    pass
+
+# guards the deferred builds of graphs that are shared between threads
+deferred_lock = threading.Lock()
+
+def build_deferred(graph):
+    with deferred_lock:
+        if type(graph) in built_classes:
+            # the graph becomes a plain state graph before the dicts are set,
+            # so they pass through the setters of networkx. Graphs created
+            # from a deferred class (graph.copy) have nothing to build.
+            build = graph.__dict__.pop('deferred', None)
+            graph.__class__ = built_classes[type(graph)]
+            if build is not None:
+                build(graph)
+
+class deferred_dict:
+    """ Node or adjacency dict of a deferred graph, built on first access """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        build_deferred(instance)
+        return getattr(instance, self.name)
+
+    def __set__(self, instance, value):
+        build_deferred(instance)
+        setattr(instance, self.name, value)
+
+class DeferredGraphMixin:
+    """ State graph whose dicts are not built yet (see StateGraphMixin.defer).
+    It turns into a StateGraph or StateDiGraph on the first access. """
+    _node = deferred_dict()
+    _adj = deferred_dict()
+    _succ = deferred_dict()
+    _pred = deferred_dict()
+
+class DeferredStateGraph(DeferredGraphMixin, StateGraph):
+    pass
+
+class DeferredStateDiGraph(DeferredGraphMixin, StateDiGraph):
+    pass
+
+deferred_classes = {StateGraph: DeferredStateGraph, StateDiGraph: DeferredStateDiGraph}
+built_classes = {deferred: graph for graph, deferred in deferred_classes.items()}
+
+def is_state_graph(graph):
+    return isinstance(graph, StateGraphMixin)
+
+def as_state_graph(graph):
+    """ Moves the node attributes of a nx.Graph or nx.DiGraph into columns.
+
+    The graph is converted in place, so all references to it stay valid
+    and the edges are not copied. Other graph classes are returned as is.
+    """
+    if type(graph) not in (nx.Graph, nx.DiGraph):
+        return graph
+    state = NodeState()
+    items = list(graph._node.items())
+    slots = state.allocate_block(len(items)).tolist()
+    columns = {}
+    for (node, data), slot in zip(items, slots):
+        attributes = NodeAttributes(state, slot)
+        for key, value in data.items():
+            if key in state.columns:
+                column = columns.setdefault(key, ([], []))
+                column[0].append(slot)
+                column[1].append(value)
+            else:
+                attributes[key] = value
+        graph._node[node] = attributes
+    for key, (keySlots, values) in columns.items():
+        values = [np.asarray(value, dtype=np.float64)[:2] for value in values] \
+            if key in vector_columns else values
+        state.scatter(key, keySlots, values)
+
+    graph.__class__ = StateDiGraph if graph.is_directed() else StateGraph
+    graph.state = state
+    graph.node_attr_dict_factory = state.attributes
+    return graph
+
+def node_slots(graph, nodes):
+    """ Returns the state and the slots of the nodes, (None, None) if the
+    graph does not store its node state in columns. The state is taken from
+    the node attributes because graph views share them with their graph.
+    """
+    attributes = [graph._node[node] for node in nodes]
+    if not attributes or not isinstance(attributes[0], NodeAttributes):
+        return None, None
+    return attributes[0].state, np.fromiter((values.slot for values in attributes),
+        dtype=np.int64, count=len(attributes))
+
+def node_values(graph, nodes, key, dtype=None):
+    """ Returns the attribute key of the nodes as array """
+    state, slots = node_slots(graph, nodes)
+    if state is not None and key in state.columns and state.has_all(key, slots):
+        return state.gather(key, slots, dtype)
+    return np.array([graph.nodes[node][key] for node in nodes], dtype=dtype)
+
+if __name__ == '__main__':
+    print('state.py')
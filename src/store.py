@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+""" Server side session storage """
+
+import threading
+from collections import OrderedDict
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+# rough memory footprint of networkx objects including the columnar model state
+node_bytes = 500
+edge_bytes = 400
+
+def estimate_graph_size(graph):
+    """ Estimates the memory that is used by a graph in bytes """
+    return len(graph) * node_bytes + graph.number_of_edges() * edge_bytes
+
+class SessionStore:
+    """ Keeps the live graph of every session on the server.
+
+    Sessions are evicted in least recently used order once either the
+    number of sessions or the estimated memory exceeds its limit. The
+    browser only keeps a handle containing the session id and version.
+    Every function in evict_hooks is called with the id of a removed or
+    evicted session, so other per session data follows the same bound.
+    """
+    def __init__(self, max_sessions=256, max_bytes=2 * 1024 ** 3):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.sessions = OrderedDict()
+        self.total_bytes = 0
+        self.evict_hooks = []
+        self.mutex = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self.sessions
+
+    def get(self, session_id):
+        """ Returns the graph of a session or None if it is unknown """
+        with self.mutex:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return None
+            self.sessions.move_to_end(session_id)
+            return entry['graph']
+
+    def version(self, session_id):
+        with self.mutex:
+            entry = self.sessions.get(session_id)
+            return None if entry is None else entry['version']
+
+    def put(self, session_id, graph):
+        """ Stores the graph of a session and returns its new handle """
+        size = estimate_graph_size(graph)
+        with self.mutex:
+            entry = self.sessions.pop(session_id, None)
+            version = 0
+            if entry is not None:
+                self.total_bytes -= entry['size']
+                version = entry['version'] + 1
+            self.sessions[session_id] = {
+                'graph': graph, 'version': version, 'size': size}
+            self.total_bytes += size
+            evicted = self._evict()
+        self._forget(evicted)
+        return handle(session_id, version)
+
+    def remove(self, session_id):
+        with self.mutex:
+            entry = self.sessions.pop(session_id, None)
+            if entry is not None:
+                self.total_bytes -= entry['size']
+        self._forget([session_id])
+
+    def _evict(self):
+        # the most recently used session is never evicted
+        evicted = []
+        while len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions
+                or self.total_bytes > self.max_bytes):
+            session_id, entry = self.sessions.popitem(last=False)
+            self.total_bytes -= entry['size']
+            evicted.append(session_id)
+            print(f'Evicting session {session_id} ({entry["size"]} bytes)')
+        return evicted
+
+    def _forget(self, session_ids):
+        # the hooks run outside of the lock, they may use the store
+        for session_id in session_ids:
+            for hook in self.evict_hooks:
+                hook(session_id)
+
+class LayoutCache:
+    """ Keeps computed node positions keyed by a topology fingerprint and
+    the layout name. The least recently used layouts are evicted once
+    their memory exceeds max_bytes.
+    """
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.layouts = OrderedDict()
+        self.total_bytes = 0
+        self.mutex = threading.Lock()
+
+    def __len__(self):
+        return len(self.layouts)
+
+    def get(self, key):
+        """ Returns the (N x 2) positions stored for key or None """
+        with self.mutex:
+            positions = self.layouts.get(key)
+            if positions is not None:
+                self.layouts.move_to_end(key)
+            return positions
+
+    def put(self, key, positions):
+        with self.mutex:
+            previous = self.layouts.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous.nbytes
+            self.layouts[key] = positions
+            self.total_bytes += positions.nbytes
+            while len(self.layouts) > 1 and self.total_bytes > self.max_bytes:
+                _, evicted = self.layouts.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+def handle(session_id, version):
+    """ Returns the handle that is stored in the browser """
+    return {'id': session_id, 'version': version}
+
+if __name__ == '__main__':
+    print('store.py')
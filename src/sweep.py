@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+""" Parallel parameter sweeps over models and graph generators """
+
+import os
+import json
+import time
+import random
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from src.models import addMinRequirements
+from src.state import node_values
+from src.info import dropdown_model, graph_gens
+from src.simulate import default_args, generate_graph, parse_value
+
+__author__ = "Created by Konstantin Rolf | University of Groningen"
+__copyright__ = "Copyright 2021, Konstantin Rolf"
+__credits__ = [""]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Konstantin Rolf"
+__email__ = "konstantin.rolf@gmail.com"
+__status__ = "Development"
+
+def expand_grid(grid):
+    """ Returns every combination of a {name: [values]} grid as list of dicts """
+    names = list(grid)
+    return [dict(zip(names, values))
+        for values in itertools.product(*(grid[name] for name in names))]
+
+def task_key(task):
+    """ Returns a stable key identifying a task independent of its position in the
+    sweep. The key contains the sweep seed, so a checkpoint written with another
+    seed is not reused. """
+    return json.dumps({name: task[name] for name in (
+        'model', 'generator', 'generator_args', 'args', 'repetition', 'steps', 'actions',
+        'sweep_seed')},
+        sort_keys=True, default=str)
+
+def task_seed(seed, key):
+    """ Derives the seed of a task from the sweep seed and the task key """
+    digest = hashlib.blake2b(f'{seed}:{key}'.encode(), digest_size=4).digest()
+    return int.from_bytes(digest, 'little')
+
+def build_tasks(models, generators, grid=None, repetitions=1, steps=100, actions=(), seed=0):
+    """ Builds the task list of a sweep.
+
+    models is a list of model ids and generators maps a generator name to
+    a list of value lists, one per generator argument (an empty list
+    keeps the default of that argument). grid maps model arguments to the
+    values that are swept. Actions are only run for models that register
+    them.
+    """
+    tasks = []
+    for generator, values in generators.items():
+        graph_gen = graph_gens[generator]
+        values = list(values or [])
+        choices = [values[idx] if idx < len(values) and values[idx] else [default]
+            for idx, default in enumerate(graph_gen['argvals'])]
+        for generator_args in itertools.product(*choices):
+            for model_id in models:
+                model = dropdown_model[model_id]
+                model_actions = [action for action in actions if action in model['actions']]
+                for args in expand_grid(grid or {}):
+                    for repetition in range(repetitions):
+                        task = {
+                            'model': model_id,
+                            'generator': generator,
+                            'generator_args': list(generator_args),
+                            'args': args,
+                            'repetition': repetition,
+                            'steps': steps,
+                            'actions': model_actions,
+                            'sweep_seed': seed,
+                        }
+                        task['key'] = task_key(task)
+                        task['seed'] = task_seed(seed, task['key'])
+                        tasks.append(task)
+    return tasks
+
+def run_task(task):
+    """ Generates the graph of a task, runs the model and summarizes the final state """
+    random.seed(task['seed'])
+    np.random.seed(task['seed'])
+    start = time.perf_counter()
+
+    graph = addMinRequirements(
+        generate_graph(task['generator'], task['generator_args']), layout=False)
+    model = dropdown_model[task['model']]
+    args = dict(default_args, **task['args'])
+    data = {'graph': graph}
+    for action in task['actions']:
+        data = model['actions'][action](data, dict(args))
+    data = model['update'](data, dict(args, steps=task['steps']))
+
+    state = node_values(data['graph'], list(data['graph'].nodes()), model['key'], np.float64)
+    convergence = data.get('convergence', {})
+    row = {
+        'key': task['key'],
+        'model': task['model'],
+        'generator': task['generator'],
+        'repetition': task['repetition'],
+        'seed': task['seed'],
+        'steps': task['steps'],
+        'nodes': len(graph),
+        'edges': graph.number_of_edges(),
+        'mean': float(state.mean()) if len(state) else 0.0,
+        'active': float((state > 0).mean()) if len(state) else 0.0,
+        'removed': float((state < 0).mean()) if len(state) else 0.0,
+        'converged_step': convergence.get('step'),
+        'period': convergence.get('period'),
+        'seconds': time.perf_counter() - start,
+    }
+    for idx, value in enumerate(task['generator_args']):
+        row[f'generator_arg{idx}'] = value
+    for name, value in task['args'].items():
+        row[f'arg_{name}'] = value
+    return row
+
+def read_checkpoint(path):
+    """ Returns the rows of the tasks that are already completed """
+    rows = {}
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # partially written line of an interrupted sweep
+                rows[row['key']] = row
+    return rows
+
+def run_sweep(tasks, workers=None, checkpoint=None):
+    """ Runs the tasks in a process pool and returns the results as DataFrame.
+
+    Every completed task is appended to the checkpoint file (JSON lines)
+    so that an interrupted sweep only runs the missing tasks on restart.
+    """
+    rows = read_checkpoint(checkpoint)
+    pending = [task for task in tasks if task['key'] not in rows]
+    print(f'Running {len(pending)} of {len(tasks)} tasks ({len(tasks) - len(pending)} checkpointed)')
+
+    if pending:
+        output = open(checkpoint, 'a') if checkpoint is not None else None
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(run_task, task) for task in pending]
+                for done, future in enumerate(as_completed(futures), 1):
+                    row = future.result()
+                    rows[row['key']] = row
+                    if output is not None:
+                        output.write(json.dumps(row) + '\n')
+                        output.flush()
+                    print(f'Completed task {done}/{len(pending)}')
+        finally:
+            if output is not None:
+                output.close()
+
+    frame = pd.DataFrame([rows[task['key']] for task in tasks])
+    return frame.drop(columns=['key']) if 'key' in frame else frame
+
+def parse_grid(values):
+    """ Parses a list of name=v1,v2,... strings into a grid """
+    grid = {}
+    for value in values or []:
+        name, sep, raw = value.partition('=')
+        if not sep:
+            raise ValueError(f'Grid values must be given as name=v1,v2,...: {value}')
+        grid[name.strip()] = [parse_value(item.strip()) for item in raw.split(',')]
+    return grid
+
+def build_parser(parser):
+    parser.add_argument('--model', type=str, nargs='+', required=True, choices=list(dropdown_model),
+        help='Models that are swept')
+    parser.add_argument('--generator', type=str, nargs='+', default=['random_geometric'],
+        help='Graph generators that are swept (default: random_geometric)')
+    parser.add_argument('--generator-args', type=str, nargs='*', default=[],
+        help='Comma separated values per generator argument, e.g. 100,200 0.1')
+    parser.add_argument('--grid', type=str, action='append', default=[],
+        help='Swept model argument as name=v1,v2,..., e.g. prob=0.05,0.1 (repeatable)')
+    parser.add_argument('--action', type=str, action='append', default=[],
+        help='Model action that is run before every simulation (repeatable)')
+    parser.add_argument('--repetitions', type=int, default=1,
+        help='Number of runs per grid cell (default: 1)')
+    parser.add_argument('--steps', type=int, default=100,
+        help='Number of simulated steps (default: 100)')
+    parser.add_argument('--seed', type=int, default=0,
+        help='Seed from which the task seeds are derived (default: 0)')
+    parser.add_argument('--workers', type=int, default=None,
+        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--checkpoint', type=str, default=None,
+        help='JSON lines file of completed tasks used to resume a sweep')
+    parser.add_argument('--output', type=str, default='sweep.csv',
+        help='CSV file of the aggregated results (default: sweep.csv)')
+    return parser
+
+def run(options):
+    generator_args = [[parse_value(item) for item in value.split(',')]
+        for value in options['generator_args']]
+    tasks = build_tasks(options['model'],
+        {generator: generator_args for generator in options['generator']},
+        parse_grid(options['grid']), options['repetitions'],
+        options['steps'], options['action'], options['seed'])
+    frame = run_sweep(tasks, options['workers'], options['checkpoint'])
+    frame.to_csv(options['output'], index=False)
+    print(f'Wrote {len(frame)} results to {options["output"]}')
+    return frame
+
+if __name__ == '__main__':
+    print('sweep.py')
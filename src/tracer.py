@@ -2,10 +2,12 @@
 
 """ Tracers """
 
+import numpy as np
 import plotly.graph_objects as go
 import networkx as nx
 
-from src.addEdge import addEdge
+from src.addEdge import add_edges
+from src.state import node_slots, node_values
 from src.visual_connections import connection_tracer 
 __author__ = "Created by Konstantin Rolf | University of Groningen"
 __copyright__ = "Copyright 2021, Konstantin Rolf"
@@ -22,66 +24,121 @@ __status__ = "Development"
 #'Reds' | 'Blues' | 'Picnic' | 'Rainbow' | 'Portland' | 'Jet' |
 #'Hot' | 'Blackbody' | 'Earth' | 'Electric' | 'Viridis' |
 
+# level of detail options for large graphs, see graph.py for the command line options
+render_options = {
+    # uses WebGL traces above this number of nodes plus edges
+    'webgl_threshold': 10000,
+    # drops the arrowheads of directed graphs above this number of edges
+    'max_arrows': 10000,
+    # drops the edge weight trace above this number of edges
+    'max_weight_labels': 2000,
+    # drops the node hover texts above this number of nodes
+    'max_node_labels': 50000,
+    # draws a uniform sample of this many edges in larger graphs (0 draws all)
+    'max_edges': 0,
+}
+
+def to_webgl(trace):
+    """ Converts a go.Scatter trace into a go.Scattergl trace """
+    if not isinstance(trace, go.Scatter):
+        return trace
+    data = trace.to_plotly_json()
+    data.pop('type', None)
+    return go.Scattergl(**data)
+
 def findNodePos(node):
     l = node.get('layout')
     if l is not None: return l
     return node['pos']
 
-def generateFigure(graph, graphType, models, tracer):
+def findNodePositions(graph, node_ids):
+    """ Returns the (N x 2) positions of the nodes, the layout is preferred """
+    state, slots = node_slots(graph, node_ids)
+    if state is not None:
+        layout = state.present['layout'][slots]
+        if (layout | state.present['pos'][slots]).all():
+            return np.where(layout[:, None],
+                state.columns['layout'][slots], state.columns['pos'][slots])
+    return np.array([findNodePos(graph.nodes[node]) for node in node_ids],
+        dtype=float).reshape(-1, 2)
+
+def modelGraph(graph, graphType, models):
+    """ Returns a directed or undirected view of the graph matching the model type """
     if graphType in models:
         if isinstance(graph, nx.DiGraph) and models[graphType]['type'] == 'u':
             graph = graph.to_undirected(as_view=True)
         elif isinstance(graph, nx.Graph) and models[graphType]['type'] == 'd':
             graph = graph.to_directed(as_view=True)
+    return graph
+
+def generateNodeTrace(graph, graphType, models, tracer, node_x, node_y, node_ids):
+    try:
+        node_trace = models[tracer[0]]['visuals'][tracer[1]]['tracer'](graph, node_x, node_y, node_ids)
+    except KeyError:
+        print(f'Unknown graph type {graphType} {tracer}')
+        node_trace = connection_tracer(graph, node_x, node_y, node_ids)
+    if len(node_ids) > render_options['max_node_labels']:
+        node_trace.text, node_trace.hoverinfo = None, 'none'
+    return node_trace
 
-    edge_x, edge_y = [], []
-    node_x, node_y = [], []
-    edge_cx, edge_cy = [], []
-    weights = []
+def generateNodeColors(graph, graphType, models, tracer):
+    """ Returns the marker colors and hover texts of the node trace of generateFigure """
+    graph = modelGraph(graph, graphType, models)
+    node_ids = list(graph.nodes())
+    positions = findNodePositions(graph, node_ids)
+    node_trace = generateNodeTrace(graph, graphType, models, tracer,
+        positions[:, 0], positions[:, 1], node_ids)
+    return node_trace.marker.color, node_trace.text
+
+def generateFigure(graph, graphType, models, tracer):
+    graph = modelGraph(graph, graphType, models)
     directed = isinstance(graph, nx.DiGraph)
     node_ids = list(graph.nodes())
+    index = {node: idx for idx, node in enumerate(node_ids)}
+    positions = findNodePositions(graph, node_ids)
+    node_x, node_y = positions[:, 0], positions[:, 1]
+
+    # gathers the start and end points of all edges
+    edges = list(graph.edges(data=True))
+    edgeCount = len(edges)
+    if 0 < render_options['max_edges'] < len(edges):
+        # the fixed seed keeps the sample stable between redraws
+        sample = np.random.default_rng(0).choice(len(edges), render_options['max_edges'], replace=False)
+        edges = [edges[idx] for idx in np.sort(sample)]
+    src = np.fromiter((index[edge[0]] for edge in edges), dtype=np.int64, count=len(edges))
+    dst = np.fromiter((index[edge[1]] for edge in edges), dtype=np.int64, count=len(edges))
+    start, end = positions[src], positions[dst]
+    # checks which edges have a weight
+    weighted = np.fromiter(('weight' in edge[2] for edge in edges), dtype=bool, count=len(edges))
+    weights = [str(edge[2]['weight']) for edge in edges if 'weight' in edge[2]]
+
+    webgl = len(node_ids) + edgeCount > render_options['webgl_threshold']
+    Scatter = go.Scattergl if webgl else go.Scatter
     if directed:
-        for edge in graph.edges(data=True):
-            start = findNodePos(graph.nodes[edge[0]])
-            end = findNodePos(graph.nodes[edge[1]])
-            edge_x, edge_y = addEdge(start, end, edge_x, edge_y, 1.0, 'end', .01, 15, 12)
-            if 'weight' in edge[2]: # checks if we have a weight
-                edge_cx.append((start[0] / 3 + end[0] * (2.0 / 3.0)))
-                edge_cy.append((start[1] / 3 + end[1] * (2.0 / 3.0)))
-                weights.append(str(edge[2]['weight']))
+        arrowPos = 'end' if edgeCount <= render_options['max_arrows'] else None
+        edge_x, edge_y = add_edges(start, end, 1.0, arrowPos, .01, 15, 12)
+        centers = start[weighted] / 3 + end[weighted] * (2.0 / 3.0)
     else:
-        for edge in graph.edges(data=True):
-            x0, y0 = findNodePos(graph.nodes[edge[0]])
-            x1, y1 = findNodePos(graph.nodes[edge[1]])
-            edge_x.extend((x0, x1, None))
-            edge_y.extend((y0, y1, None))
-            if 'weight' in edge[2]: # checks if we have a weight
-                edge_cx.append((x0 + x1) / 2)
-                edge_cy.append((y0 + y1) / 2)
-                weights.append(str(edge[2]['weight']))
-
-
-    for node in graph.nodes():
-        x, y = findNodePos(graph.nodes[node])
-        node_x.append(x)
-        node_y.append(y)
-
-    edge_trace = go.Scatter(
+        gap = np.full(len(edges), np.nan)
+        edge_x = np.stack((start[:, 0], end[:, 0], gap), axis=1).ravel()
+        edge_y = np.stack((start[:, 1], end[:, 1], gap), axis=1).ravel()
+        centers = (start[weighted] + end[weighted]) / 2
+    edge_cx, edge_cy = centers[:, 0], centers[:, 1]
+
+    edge_trace = Scatter(
         x=edge_x, y=edge_y,
         line=dict(width=0.5, color='#888'),
         hoverinfo='text',
         mode='lines',
     )
 
-    try:
-        node_trace = models[tracer[0]]['visuals'][tracer[1]]['tracer'](graph, node_x, node_y, node_ids)
-    except KeyError:
-        print(f'Unknown graph type {graphType} {tracer}')
-        node_trace = connection_tracer(graph, node_x, node_y)
+    node_trace = generateNodeTrace(graph, graphType, models, tracer, node_x, node_y, node_ids)
+    if webgl:
+        node_trace = to_webgl(node_trace)
 
     traces = [edge_trace, node_trace]
-    if models[graphType]['weighted']:
-        edge_text_trace = go.Scatter(
+    if models[graphType]['weighted'] and edgeCount <= render_options['max_weight_labels']:
+        edge_text_trace = Scatter(
             x=edge_cx, y=edge_cy,
             mode='markers',
             hoverinfo='text',
@@ -134,8 +191,9 @@ def generate_trace(graph, node_x, node_y, node_ids, key, title, color):
         )
     )
 
-    node_trace.marker.color = [node[1][key] for node in graph.nodes(data=True)]
-    node_trace.text = [str(node[1][key]) for node in graph.nodes(data=True)]
+    values = node_values(graph, list(graph.nodes()), key).tolist()
+    node_trace.marker.color = values
+    node_trace.text = [str(value) for value in values]
     return node_trace
 
 def generateSocialChoiceTracer(graph, node_x, node_y, node_ids):
@@ -1,4 +1,6 @@
 
+import json
+
 import dash
 import dash.dependencies as dp
 import dash_html_components as html
@@ -6,6 +8,7 @@ import dash_core_components as dcc
 import dash_bootstrap_components as dbc
 
 import src.designs as designs
+from src.engine import engines, engines_synchronous, engine_default
 
 def build_init_modal(id_modal, slider_id, generate_id, text, min, max, step, value):
     return dbc.Modal(
@@ -36,30 +39,54 @@ def build_init_button(id_modal):
     return html.Div([html.Button(
         'Init', id=f'modal-{id_modal}-open', style=designs.but)], style=designs.col)
 
+def build_label_callback(app, id_value, id_slider, text):
+    """ Shows the value of a slider next to its label. The label is written
+    in the browser, so moving the slider does not call the server. """
+    app.clientside_callback(
+        f"""
+        function(value) {{
+            return {json.dumps(text)} + ' ' + value;
+        }}
+        """,
+        dp.Output(id_value, 'children'),
+        dp.Input(id_slider, 'value'))
+
+def build_modal_callback(app, id_modal, id_open, id_close, dismiss=None, show=None):
+    """ Opens and closes a modal in the browser. A change of the property
+    dismiss, for example 'upload-graph.contents', always closes it and a
+    change of the property show always opens it. """
+    inputs = [dp.Input(id_open, 'n_clicks'), dp.Input(id_close, 'n_clicks')]
+    check = ''
+    for prop, value in ((dismiss, 'false'), (show, 'true')):
+        if prop is None:
+            continue
+        inputs.append(dp.Input(*prop.split('.')))
+        check += f"""
+            if (triggered.length && triggered[0].prop_id === {json.dumps(prop)}) {{
+                return {value};
+            }}"""
+    if check:
+        check = """
+            const triggered = window.dash_clientside.callback_context.triggered;""" + check
+    app.clientside_callback(
+        f"""
+        function(n1, n2) {{
+            const is_open = arguments[arguments.length - 1];{check}
+            return n1 || n2 ? !is_open : is_open;
+        }}
+        """,
+        dp.Output(id_modal, 'is_open'),
+        inputs,
+        dp.State(id_modal, 'is_open'))
+
 def build_init_callback(app, id_modal, slider_id, text):
-    @app.callback(
-        dp.Output(f'{slider_id}-value', 'children'),
-        dp.Input(f'{slider_id}', 'value'))
-    def slider_update(value):
-        return f'{text} {value}'
-
-    @app.callback(
-        dp.Output(f'modal-{id_modal}', 'is_open'),
-        dp.Input(f'modal-{id_modal}-open', 'n_clicks'),
-        dp.Input(f'modal-{id_modal}-close', 'n_clicks'),
-        dp.State(f'modal-{id_modal}', 'is_open'))
-    def toggle_modal_init(n1, n2, is_open):
-        if n1 or n2:
-            return not is_open
-        return is_open
+    build_label_callback(app, f'{slider_id}-value', slider_id, text)
+    build_modal_callback(app, f'modal-{id_modal}',
+        f'modal-{id_modal}-open', f'modal-{id_modal}-close')
 
 
 def build_step_callback(app, id_value, id_slider, text):
-    @app.callback(
-        dp.Output(id_value, 'children'),
-        dp.Input(id_slider, 'value'))
-    def slider_update(value):
-        return f'{text} {value}'
+    build_label_callback(app, id_value, id_slider, text)
 
 def build_step_slider(id_value, id_slider, text):
     return html.Div(
@@ -74,11 +101,7 @@ def build_step_slider(id_value, id_slider, text):
     )
 
 def build_prob_callback(app, id_value, id_slider):
-    @app.callback(
-        dp.Output(id_value, 'children'),
-        dp.Input(id_slider, 'value'))
-    def slider_update(value):
-        return f'Probability {value}'
+    build_label_callback(app, id_value, id_slider, 'Probability')
 
 def build_prob_slider(id_value, id_slider, default=0.05):
     return html.Div(
@@ -93,11 +116,7 @@ def build_prob_slider(id_value, id_slider, default=0.05):
     )
 
 def build_infection_callback(app, id_value, id_slider):
-    @app.callback(
-        dp.Output(id_value, 'children'),
-        dp.Input(id_slider, 'value'))
-    def slider_update(value):
-        return f'Infection Time {value}'
+    build_label_callback(app, id_value, id_slider, 'Infection Time')
 
 def build_infection_slider(id_value, id_slider):
     return html.Div(
@@ -111,6 +130,41 @@ def build_infection_slider(id_value, id_slider):
         style={'width': '200px'}
     )
 
+def build_ensemble_callback(app, id_value, id_slider):
+    build_label_callback(app, id_value, id_slider, 'Realizations')
+
+def build_ensemble_slider(id_value, id_slider, id_seed):
+    return html.Div(
+        [
+            html.Div('Realizations', id=id_value, style={'padding-left': '30px'}),
+            dcc.Slider(
+                id=id_slider,
+                min=10, max=1000, step=10, value=100
+            ),
+            dcc.Input(
+                id=id_seed, type='number', placeholder='Seed', min=0, step=1,
+                style={'margin-left': '30px', 'width': '140px'}
+            ),
+        ],
+        style={'width': '200px'}
+    )
+
+def build_engine_selector(id, options=engines_synchronous):
+    return html.Div(
+        [
+            html.Div('Engine', style={'padding-left': '30px'}),
+            dcc.Dropdown(
+                id=id,
+                options=[{'label': engines[key]['name'], 'value': key}
+                    for key in options],
+                value=engine_default,
+                clearable=False,
+                style={'width': '200px'}
+            ),
+        ],
+        style={'width': '200px'}
+    )
+
 def build_visual_selector(model, id):
     if len(model['visuals']) > 0:
         return [